@@ -1,3 +1,13 @@
+import numpy as np
+
+# decisions and plume signals are coded as small ints. the names are what they're called in the output dataframes
+DECISIONS = ('search', 'surge', 'cast_l', 'cast_r', 'ga', 'ignore')
+SEARCH, SURGE, CAST_L, CAST_R, GRADIENT_ASCENT, IGNORE = range(len(DECISIONS))
+
+# GRADIENT tells upstream code to look up the plume gradient, NO_SIGNAL is for agents ignoring the plume
+PLUME_SIGNALS = ('out', 'in', 'exit_l', 'exit_r', 'gradient', 'none')
+OUT, IN, EXIT_L, EXIT_R, GRADIENT, NO_SIGNAL = range(len(PLUME_SIGNALS))
+
 
 class Decisions:
     def __init__(self, decision_policy, stimulus_memory_n_timesteps):
@@ -5,7 +15,7 @@ class Decisions:
 
         self.stimulus_memory_n_timesteps = stimulus_memory_n_timesteps
         self.plume_sighted_ago = 10000000  # a long time ago
-        self.last_plume_side_exited = None
+        self.last_plume_side_exited = None  # EXIT_L or EXIT_R
 
         self.make_decision = self._set_decision_policy()
 
@@ -26,35 +36,98 @@ class Decisions:
     def _boolean_decisions(self, in_plume, crosswind_velocity):
         if in_plume == True:  # use == instead of "is" because we're using type np.bool
             self.plume_sighted_ago = 0
-            plume_signal = 'in'
+            plume_signal = IN
             if 'surge' in self.decision_policy:
-                current_decision = 'surge'
+                current_decision = SURGE
             else:
-                current_decision = 'search'
+                current_decision = SEARCH
         elif in_plume == False:
             self.plume_sighted_ago += 1
             if self.plume_sighted_ago == 1:  # we just exited the plume
                 # if our y velocity is negative, we just exited to the left. otherwise, to the right.
                 if crosswind_velocity < 0:
-                    plume_signal = 'exit_l'
-                    self.last_plume_side_exited = 'l'
-                    current_decision = 'cast_r'
+                    plume_signal = EXIT_L
+                    self.last_plume_side_exited = EXIT_L
+                    current_decision = CAST_R
                 else:
-                    plume_signal = 'exit_r'
-                    self.last_plume_side_exited = 'r'
-                    current_decision = 'cast_l'
+                    plume_signal = EXIT_R
+                    self.last_plume_side_exited = EXIT_R
+                    current_decision = CAST_L
             else:  # been outside plume at least a couple timesteps
-                plume_signal = 'out'
+                plume_signal = OUT
                 if 'cast' in self.decision_policy:
                     if self.plume_sighted_ago <= self.stimulus_memory_n_timesteps:  # we were in the plume recently
-                        if self.last_plume_side_exited == 'l':
-                            current_decision = 'cast_r'
-                        else:  # 'r'
-                            current_decision = 'cast_l'
+                        if self.last_plume_side_exited == EXIT_L:
+                            current_decision = CAST_R
+                        else:  # EXIT_R
+                            current_decision = CAST_L
                     else:  # haven't seen the plume in a while
-                        current_decision = 'search'
+                        current_decision = SEARCH
                 else:
-                    current_decision = 'search'
+                    current_decision = SEARCH
+
+        return current_decision, plume_signal
+
+    def _gradient_decisions(self, *_):
+        """
+        Returns
+        -------
+        current_decision
+            we are always following the gradient in this model
+        plume_signal
+            tell upstream code to look up plume signal
+        """
+        plume_signal = GRADIENT
+        current_decision = GRADIENT_ASCENT
+
+        return current_decision, plume_signal
+
+    def _ignore_plume(self, *_):
+        return IGNORE, NO_SIGNAL
+
+
+class EnsembleDecisions(Decisions):
+    """Same decision policies as Decisions, but evaluated for a whole ensemble of agents at once.
+
+    Every agent keeps its own plume memory, so the arrays passed to make_decision must always be ordered by agent.
+    Decisions and plume signals are returned as int8 arrays holding the same codes Decisions returns.
+    """
+    def __init__(self, decision_policy, stimulus_memory_n_timesteps, n_agents):
+        self.n_agents = n_agents
+        Decisions.__init__(self, decision_policy, stimulus_memory_n_timesteps)
+
+        self.plume_sighted_ago = np.full(n_agents, 10000000, dtype=np.int64)  # a long time ago
+        self.last_plume_side_exited = np.full(n_agents, NO_SIGNAL, dtype=np.int8)  # EXIT_L, EXIT_R once exited
+
+    def _boolean_decisions(self, in_plume, crosswind_velocity):
+        in_plume = np.asarray(in_plume, dtype=bool)
+        crosswind_velocity = np.asarray(crosswind_velocity)
+
+        self.plume_sighted_ago = np.where(in_plume, 0, self.plume_sighted_ago + 1)
+
+        # if our y velocity is negative, we just exited to the left. otherwise, to the right.
+        just_exited = self.plume_sighted_ago == 1
+        exited_l = just_exited & (crosswind_velocity < 0)
+        exited_r = just_exited & ~(crosswind_velocity < 0)
+        self.last_plume_side_exited[exited_l] = EXIT_L
+        self.last_plume_side_exited[exited_r] = EXIT_R
+
+        plume_signal = np.full(self.n_agents, OUT, dtype=np.int8)
+        plume_signal[in_plume] = IN
+        plume_signal[exited_l] = EXIT_L
+        plume_signal[exited_r] = EXIT_R
+
+        current_decision = np.full(self.n_agents, SEARCH, dtype=np.int8)
+        if 'surge' in self.decision_policy:
+            current_decision[in_plume] = SURGE
+        if 'cast' in self.decision_policy:
+            # we were in the plume recently
+            remembers_plume = ~in_plume & ~just_exited & (self.plume_sighted_ago <= self.stimulus_memory_n_timesteps)
+            last_exit_l = self.last_plume_side_exited == EXIT_L
+            current_decision[remembers_plume & last_exit_l] = CAST_R
+            current_decision[remembers_plume & ~last_exit_l] = CAST_L
+        current_decision[exited_l] = CAST_R
+        current_decision[exited_r] = CAST_L
 
         return current_decision, plume_signal
 
@@ -67,10 +140,10 @@ class Decisions:
         plume_signal
             tell upstream code to look up plume signal
         """
-        plume_signal = 'X'  # magic code to look up gradient
-        current_decision = 'ga'
+        plume_signal = np.full(self.n_agents, GRADIENT, dtype=np.int8)
+        current_decision = np.full(self.n_agents, GRADIENT_ASCENT, dtype=np.int8)
 
         return current_decision, plume_signal
 
     def _ignore_plume(self, *_):
-        return 'ignore', 0
+        return np.full(self.n_agents, IGNORE, dtype=np.int8), np.full(self.n_agents, NO_SIGNAL, dtype=np.int8)
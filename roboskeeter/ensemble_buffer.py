@@ -0,0 +1,138 @@
+"""
+Columnar storage for a whole ensemble of simulated trajectories.
+
+Every column gets n_trajectories * max_bins slots up front, trajectory after trajectory. The integrators write straight
+into views of these arrays, landed trajectories are compacted in place, and the result is wrapped in a DataFrame
+without copying the float columns. Coded series (e.g. decisions) are stored as small ints and come out as
+pandas Categoricals.
+"""
+import numpy as np
+import pandas as pd
+
+
+class EnsembleBuffer(object):
+    def __init__(self, n_trajectories, max_bins, vector_names, float32_vector_names=(), categories=None):
+        """
+        Parameters
+        ----------
+        n_trajectories
+            (int)
+        max_bins
+            (int) timesteps per trajectory
+        vector_names
+            (list) 3D quantities to store, e.g. ['position', 'velocity']. They become <name>_x, <name>_y, <name>_z
+            columns
+        float32_vector_names
+            (list) 3D quantities stored in single precision, e.g. ['gradient']. Same column naming as vector_names
+        categories
+            (dict) series name -> tuple of category names. The series hold int8 codes indexing the names
+        """
+        self.n_trajectories = n_trajectories
+        self.max_bins = max_bins
+        size = n_trajectories * max_bins
+
+        self.vector_names = list(vector_names)
+        self.float32_vector_names = list(float32_vector_names)
+        self.float_columns = ['{}_{}'.format(name, dim) for name in self.vector_names for dim in 'xyz']
+        self.float32_columns = ['{}_{}'.format(name, dim) for name in self.float32_vector_names for dim in 'xyz']
+        self.categories = dict(categories or {})
+
+        # one row per float column, so that the compacted rows can become a DataFrame block as they are
+        self.floats = np.full((len(self.float_columns), size), np.nan)
+        self.floats32 = np.zeros((len(self.float32_columns), size), dtype=np.float32)
+        self.series = {'in_plume': np.zeros(size, dtype=bool)}
+        for name in self.categories:
+            self.series[name] = np.zeros(size, dtype=np.int8)
+
+        # number of timesteps each trajectory kept, see land()
+        self.lengths = np.zeros(n_trajectories, dtype=int)
+        self.n_rows = None  # set by compact()
+
+    def vector(self, name):
+        """(n_trajectories, max_bins, 3) view of a vector quantity"""
+        if name in self.vector_names:
+            i = 3 * self.vector_names.index(name)
+            planes = self.floats[i:i + 3]
+        else:
+            i = 3 * self.float32_vector_names.index(name)
+            planes = self.floats32[i:i + 3]
+        return planes.reshape(3, self.n_trajectories, self.max_bins).transpose(1, 2, 0)
+
+    def series_view(self, name):
+        """(n_trajectories, max_bins) view of in_plume or of a coded series"""
+        return self.series[name].reshape(self.n_trajectories, self.max_bins)
+
+    def trajectory(self, i):
+        """views of trajectory i: (max_bins, 3) arrays for vectors, (max_bins,) arrays for the rest"""
+        views = {name: self.vector(name)[i] for name in self.vector_names + self.float32_vector_names}
+        for name in self.series:
+            views[name] = self.series_view(name)[i]
+        return views
+
+    def land(self, i, length):
+        """keep only the first length timesteps of trajectory i"""
+        self.lengths[i] = length
+
+    def compact(self, n_trajectories=None):
+        """
+        Move the kept timesteps of the first n_trajectories trajectories (all of them by default) to the front of the
+        buffer, one trajectory after another. Columns are only valid up to self.n_rows afterwards.
+        """
+        if n_trajectories is not None:
+            self.lengths = self.lengths[:n_trajectories]
+        arrays = [self.floats, self.floats32] + self.series.values()
+
+        offset = 0
+        for i, length in enumerate(self.lengths):
+            start = i * self.max_bins
+            if start != offset:  # trajectories only ever move towards the front, so nothing unread gets overwritten
+                for array in arrays:
+                    array[..., offset:offset + length] = array[..., start:start + length]
+            offset += length
+        self.n_rows = offset
+
+        return self
+
+    def column(self, name):
+        """compacted column. coded series are returned as their int8 codes"""
+        if name in self.float_columns:
+            return self.floats[self.float_columns.index(name), :self.n_rows]
+        elif name in self.float32_columns:
+            return self.floats32[self.float32_columns.index(name), :self.n_rows]
+        else:
+            return self.series[name][:self.n_rows]
+
+    def to_dataframe(self, trajectory_nums, times):
+        """
+        Wrap the compacted buffer in a DataFrame. The float64 columns aren't copied, coded series become Categoricals.
+
+        Parameters
+        ----------
+        trajectory_nums
+            trajectory number of every trajectory in the buffer
+        times
+            (max_bins,) time of every timestep
+
+        Returns
+        -------
+        df
+        """
+        if self.n_rows is None:
+            self.compact()
+
+        df = pd.DataFrame(self.floats[:, :self.n_rows].T, columns=self.float_columns, copy=False)
+        for name in self.float32_columns:
+            df[name] = self.column(name)
+        for name in sorted(self.series):
+            if name in self.categories:
+                df[name] = pd.Categorical.from_codes(self.column(name), self.categories[name])
+            else:
+                df[name] = self.column(name)
+
+        starts = np.cumsum(self.lengths) - self.lengths
+        tsi = np.arange(self.n_rows) - np.repeat(starts, self.lengths)
+        df['tsi'] = tsi
+        df['times'] = np.asarray(times)[tsi]
+        df['trajectory_num'] = np.repeat(np.asarray(trajectory_nums)[:len(self.lengths)], self.lengths)
+
+        return df
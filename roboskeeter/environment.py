@@ -1,16 +1,105 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+
 import numpy as np
 import pandas as pd
-from scipy.interpolate import Rbf, griddata
+from scipy.interpolate import griddata
 from scipy.spatial import cKDTree as kdt
 
+from roboskeeter.io.grid_store import grid_exists, load_grid, save_grid
 from roboskeeter.io.i_o import get_directory
+from roboskeeter.io.interpolation_cache import interpolation_cache_key, load_interpolation, save_interpolation
+from roboskeeter.math.grid_lookup import RegularGridLookup
+from roboskeeter.math.rbf_interpolation import interpolate_rbf_on_grid
 from roboskeeter.plotting.plot_environment import plot_windtunnel, plot_plume_gradient, draw_bool_plume
 
 
+# process-wide Environments shared between experiments, see get_environment()
+_environment_registry = {}
+_environment_registry_lock = threading.Lock()
+
+
+def get_environment(experiment):
+    """
+    Shared Environment for the experiment's conditions, so that experiments with the same (condition, heat model,
+    bounded, plume occupancy resolution) don't each load the heat model again. Made on first request, kept until evict_environments().
+
+    Parameters
+    ----------
+    experiment
+        (object) with experiment_conditions, as for Environment()
+
+    Returns
+    -------
+    environment
+    """
+    key = _environment_key(experiment.experiment_conditions)
+    with _environment_registry_lock:
+        if key not in _environment_registry:
+            _environment_registry[key] = Environment(experiment)
+        return _environment_registry[key]
+
+
+def publish_environment(experiment):
+    """
+    get_environment, with the heat model loaded and published to shared memory (see HeatModel.publish). Call this
+    before starting a process pool and hand the environment to the workers, which register it with
+    register_environment(), so the workers read one copy of the grids instead of each loading their own heat model.
+
+    Returns
+    -------
+    environment
+    """
+    environment = get_environment(experiment)
+    environment.heat.publish()
+    return environment
+
+
+def register_environment(environment):
+    """make environment the shared Environment for its conditions, e.g. in a worker handed a published environment"""
+    with _environment_registry_lock:
+        _environment_registry[environment.registry_key] = environment
+
+
+def evict_environments(condition=None, heat_model_name=None, bounded=None):
+    """
+    Drop shared environments from the registry. Fields left as None match anything, so by default everything is
+    evicted.
+
+    Returns
+    -------
+    n_evicted
+        (int)
+    """
+    with _environment_registry_lock:
+        evicted = [key for key in _environment_registry
+                   if (condition is None or key[0] == _environment_key({'condition': condition})[0]) and
+                   (heat_model_name is None or key[1] == heat_model_name.lower()) and
+                   (bounded is None or key[2] == bounded)]
+        for key in evicted:
+            del _environment_registry[key]
+
+    return len(evicted)
+
+
+def _environment_key(experiment_conditions):
+    condition = experiment_conditions['condition']
+    if isinstance(condition, basestring):
+        condition = condition.lower()
+    else:  # list of conditions
+        condition = tuple(c.lower() for c in condition)
+
+    return (condition, experiment_conditions.get('heat_model_name', '').lower(), experiment_conditions.get('bounded'),
+            experiment_conditions.get('plume_occupancy_resolution'))
+
+
 class Environment(object):
     def __init__(self, experiment):
         """
-        Generate environmental objects
+        Generate environmental objects. The heat model is loaded on first access of self.heat
 
         Parameters
         ----------
@@ -20,17 +109,26 @@ class Environment(object):
         self.condition = experiment.experiment_conditions['condition']
         self.bounded = experiment.experiment_conditions['bounded']
         self.heat_model_name = experiment.experiment_conditions['heat_model_name'].lower()
+        # optional voxel size (in meters) of the Boolean plume's occupancy bitmap, see BooleanPlumeModel
+        self.plume_occupancy_resolution = experiment.experiment_conditions.get('plume_occupancy_resolution')
+        self.registry_key = _environment_key(experiment.experiment_conditions)  # see get_environment
 
         self.windtunnel = WindTunnel(self.condition)
-        try:
-            self.heat = self._load_heat_model()
-        except IOError:
-            print """IOerror. You are probably missing the temperature data in /data/temperature. The data can be found at
-            https://drive.google.com/file/d/0B1CyEg2BqCdjX21yZ0FSVWNEa1E/view?usp=sharing
-            Note, the data is encrypted until we publish. If you're a collaborator, email Richard Decal for the password."""
-            raise
+        self._heat = None
         self.room_temperature = 19.0
 
+    @property
+    def heat(self):
+        if self._heat is None:
+            try:
+                self._heat = self._load_heat_model()
+            except IOError:
+                print """IOerror. You are probably missing the temperature data in /data/temperature. The data can be found at
+                https://drive.google.com/file/d/0B1CyEg2BqCdjX21yZ0FSVWNEa1E/view?usp=sharing
+                Note, the data is encrypted until we publish. If you're a collaborator, email Richard Decal for the password."""
+                raise
+        return self._heat
+
     def _load_heat_model(self):
         if self.heat_model_name == "boolean":
             plume = BooleanPlumeModel(self)
@@ -103,6 +201,29 @@ class Walls:
 
         return inside, past_wall
 
+    def check_in_bounds_batch(self, positions):
+        """
+        Vectorized check_in_bounds
+
+        Parameters
+        ----------
+        positions
+            (N, 3) array
+
+        Returns
+        -------
+        inside
+            (N,) boolean mask, True where the position is inside the windtunnel
+        """
+        positions = np.asarray(positions, dtype=float)
+        xpos, ypos, zpos = positions[:, 0], positions[:, 1], positions[:, 2]
+
+        inside = (xpos <= self.upwind) & (xpos >= self.downwind) & \
+                 (ypos >= self.left) & (ypos <= self.right) & \
+                 (zpos <= self.ceiling) & (zpos >= self.floor)
+
+        return inside
+
 
 class Heater:
     def __init__(self, side, experimental_condition):
@@ -151,6 +272,9 @@ class Heater:
 
 
 class HeatModel(object):
+    # attributes that are left out when pickling a published model and rebuilt from the shared grid when unpickling
+    _shared_attributes = ()
+
     def __init__(self, environment):
         """
         The plume base class
@@ -176,6 +300,105 @@ class HeatModel(object):
         self.floor = self.walls.floor
         self.bounds = [self.downwind, self.upwind, self.left, self.right, self.floor, self.ceiling]
 
+        # set by publish()
+        self.shared_grid_dir = None
+
+    def publish(self, shared_grid_dir=None):
+        """
+        Put the model's grids in shared memory, so worker processes don't each hold (and load) their own copy.
+
+        The grids are written once as memory-mappable files, by default in /dev/shm. After publishing, pickling the
+        model (e.g. when handing an Experiment to a multiprocessing pool) only sends the location of the grids, and
+        unpickling attaches read-only memory-mapped views of them. The publishing process switches to the same views.
+
+        Parameters
+        ----------
+        shared_grid_dir
+            where to write the grids. Defaults to a new directory in /dev/shm (or the temp dir if there's no /dev/shm),
+            which is removed when the publishing process exits
+
+        Returns
+        -------
+        shared_grid_dir
+            None if the model has no grids to share
+        """
+        if self.shared_grid_dir is not None:  # already published
+            return self.shared_grid_dir
+
+        grid = self._get_shared_grid()
+        if grid is None:
+            return None
+
+        if shared_grid_dir is None:
+            shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            parent = tempfile.mkdtemp(prefix='roboskeeter-{}-'.format(self.heat_model_name), dir=shm)
+            atexit.register(shutil.rmtree, parent, True)
+            shared_grid_dir = os.path.join(parent, 'grid')
+
+        save_grid(shared_grid_dir, *grid, overwrite=True)
+        self.shared_grid_dir = shared_grid_dir
+        self._attach_shared_grid(*load_grid(shared_grid_dir))
+
+        return shared_grid_dir
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state.get('shared_grid_dir') is not None:
+            for name in self._shared_attributes:
+                state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if state.get('shared_grid_dir') is not None:
+            self._attach_shared_grid(*load_grid(self.shared_grid_dir))
+
+    def _get_shared_grid(self):
+        """(xi, yi, zi, volumes) to publish, see grid_store.save_grid(). None if the model has no grids"""
+        return None
+
+    def _attach_shared_grid(self, xi, yi, zi, volumes):
+        """use grids loaded from the shared grid dir, restoring the attributes listed in _shared_attributes"""
+        pass
+
+    def check_in_plume_bounds_batch(self, positions):
+        """
+        Batch counterpart of check_in_plume_bounds()
+
+        Parameters
+        ----------
+        positions
+            (N, 3) array
+
+        Returns
+        -------
+        in_plume
+            (N,) boolean mask. Models without plume bounds are never in the plume.
+        """
+        return np.zeros(len(positions), dtype=bool)
+
+    def get_nearest_gradient_batch(self, positions):
+        """
+        Batch counterpart of get_nearest_gradient(). Models without temperature data have no gradient.
+
+        Returns
+        -------
+        gradients
+            (N, 3) array
+        """
+        return np.zeros((len(positions), 3))
+
+    def get_temperature_batch(self, positions):
+        """
+        Temperatures at (N, 3) positions. Models without temperature data are at room temperature everywhere.
+
+        Returns
+        -------
+        temperatures
+            (N,) array
+        """
+        return np.full(len(positions), self.environment.room_temperature)
+
 
 class NoHeatModel(HeatModel):
     def __init__(self, environment):
@@ -206,58 +429,131 @@ class UniformRoomTemp(HeatModel):
 
 class BooleanPlumeModel(HeatModel):
     """Are you in the plume Y/N"""
+    _shared_attributes = ('occupancy',)
+
     def __init__(self, environment):
         super(self.__class__, self).__init__(environment)
 
+        self.minor_ax_major_ax_ratio = 3
+
         self.data = self._load_plume_data()
 
         self.resolution = self._calc_resolution()
 
+        self._compile_plume_planes()
+
+        # precomputed plume membership, set by build_occupancy_bitmap. None checks the plume ellipses exactly instead.
+        self.occupancy = None
+        self.occupancy_resolution = None
+        if environment.plume_occupancy_resolution is not None:
+            self.build_occupancy_bitmap(environment.plume_occupancy_resolution)
+
     def check_in_plume_bounds(self, position):
         #  I guess conceptually this should be under the `decisions` module, since the mosquito decides whether it's in
         #  the plume or not. But for now I'm keeping it this way.
-        in_windtunnel_bounds, _ = self.walls.check_in_bounds(position)
-        x, y, z = position
-
-        x_distances_to_plume_planes = np.abs(self.data['x_position'] - x)
-
-        if x_distances_to_plume_planes.min() > self.resolution:
-            # if distance to nearest plume plane is greater than thresh, we are too far upwind or downwind from plume
-            # to be inside the plume
-            in_plume = False
-        elif in_windtunnel_bounds is False:
-            # print("WARNING: can't find plumes outside of windtunnel bounds")
-            in_plume = False
+        return self.check_in_plume_bounds_batch(np.asarray(position, dtype=float).reshape(1, 3))[0]
+
+    def check_in_plume_bounds_batch(self, positions):
+        """
+        Vectorized check_in_plume_bounds
+
+        Parameters
+        ----------
+        positions
+            (N, 3) array
+
+        Returns
+        -------
+        in_plume
+            (N,) boolean mask
+        """
+        positions = np.asarray(positions, dtype=float)
+
+        # positions outside of the windtunnel can't be in the plume
+        in_windtunnel_bounds = self.walls.check_in_bounds_batch(positions)
+
+        if self.occupancy is None:
+            in_plume = self._check_in_plume_ellipses(positions)
         else:
-            plume_plane = self._get_nearest_plume_plane(x)
-            minor_axis = plume_plane.small_radius
-            minor_ax_major_ax_ratio = 3
-            major_axis = minor_axis * minor_ax_major_ax_ratio
-
-            # check if position is within the elipsoid
-            # implementation of http://math.stackexchange.com/a/76463/291217
-            value = (((y - plume_plane.y_position) ** 2) / minor_axis ** 2) + \
-                    (((z - plume_plane.z_position) ** 2) / major_axis ** 2)
-
-            if value <= 1:
-                in_plume = True
-            else:
-                in_plume = False
+            in_plume = self.occupancy.query(positions, 'occupancy')
+
+        return in_windtunnel_bounds & in_plume
+
+    def build_occupancy_bitmap(self, resolution):
+        """
+        Precompute plume membership at the center of every voxel of the windtunnel, so that checking a position is a
+        single array read. Membership is then only as exact as the voxel size.
+
+        Parameters
+        ----------
+        resolution
+            (float) voxel size in meters
+        """
+        xc = np.arange(self.downwind, self.upwind, resolution) + resolution / 2.
+        yc = np.arange(self.left, self.right, resolution) + resolution / 2.
+        zc = np.arange(self.floor, self.ceiling, resolution) + resolution / 2.
+
+        bitmap = np.zeros((len(xc), len(yc), len(zc)), dtype=bool)
+        grid_y, grid_z = np.meshgrid(yc, zc, indexing='ij')
+        for i, x in enumerate(xc):  # one yz slab at a time to keep memory down
+            slab = np.column_stack([np.full(grid_y.size, x), grid_y.ravel(), grid_z.ravel()])
+            bitmap[i] = self._check_in_plume_ellipses(slab).reshape(grid_y.shape)
 
-        return in_plume
+        self.occupancy_resolution = resolution
+        self.occupancy = RegularGridLookup(xc, yc, zc, {'occupancy': bitmap})
+
+    def _get_shared_grid(self):
+        if self.occupancy is None:
+            return None
+        xi, yi, zi = self.occupancy.axes
+        bitmap = self.occupancy.volumes['occupancy'].reshape(self.occupancy.shape)
+        return xi, yi, zi, {'occupancy': bitmap}
+
+    def _attach_shared_grid(self, xi, yi, zi, volumes):
+        self.occupancy = RegularGridLookup(xi, yi, zi, volumes)
+
+    def _check_in_plume_ellipses(self, positions):
+        """exact plume membership of (N, 3) positions, ignoring the windtunnel walls"""
+        x, y, z = positions[:, 0], positions[:, 1], positions[:, 2]
+
+        nearest_plane, x_distance_to_plume_plane = self._get_nearest_plume_planes(x)
+        # if distance to nearest plume plane is greater than thresh, we are too far upwind or downwind from plume
+        # to be inside the plume
+        near_a_plume_plane = x_distance_to_plume_plane <= self.resolution
+
+        # check if position is within the elipsoid
+        # implementation of http://math.stackexchange.com/a/76463/291217
+        value = (((y - self.plane_y[nearest_plane]) ** 2) / self.plane_minor_axis[nearest_plane] ** 2) + \
+                (((z - self.plane_z[nearest_plane]) ** 2) / self.plane_major_axis[nearest_plane] ** 2)
+
+        return near_a_plume_plane & (value <= 1)
+
+    def _compile_plume_planes(self):
+        """copy the plume planes into arrays sorted by x, so that nearest planes can be found with searchsorted"""
+        planes = self.data.sort_values('x_position', kind='mergesort')
+        self.plane_x = planes['x_position'].values.astype(float)
+        self.plane_y = planes['y_position'].values.astype(float)
+        self.plane_z = planes['z_position'].values.astype(float)
+        self.plane_minor_axis = planes['small_radius'].values.astype(float)
+        self.plane_major_axis = self.plane_minor_axis * self.minor_ax_major_ax_ratio
+
+    def _get_nearest_plume_planes(self, x_positions):
+        """given x positions, find index of nearest plane in the compiled arrays and the x distance to it"""
+        if len(self.plane_x) == 1:
+            nearest = np.zeros(len(x_positions), dtype=int)
+        else:
+            upper = np.clip(np.searchsorted(self.plane_x, x_positions), 1, len(self.plane_x) - 1)
+            lower = upper - 1
+            upper_is_closer = np.abs(self.plane_x[upper] - x_positions) < np.abs(x_positions - self.plane_x[lower])
+            nearest = np.where(upper_is_closer, upper, lower)
+
+        return nearest, np.abs(self.plane_x[nearest] - x_positions)
 
     def show(self):
         fig, ax = plot_windtunnel(self.environment.windtunnel)
         ax.axis('off')
         draw_bool_plume(self, ax=ax)
 
-    def _get_nearest_plume_plane(self, x_position):
-        """given x position, find nearest plan"""
-        closest_plume_index = (np.abs(self.data['x_position'] - x_position)).argmin()
-        plume_plane = self.data.loc[closest_plume_index]
-
-        return plume_plane
-
     def _load_plume_data(self):
         col_names = ['x_position', 'z_position', 'small_radius']
 
@@ -292,6 +588,9 @@ class BooleanPlumeModel(HeatModel):
 
 class TimeAvgTempModel(HeatModel):
     """time-averaged temperature readings taken inside the windtunnel"""
+    _shared_attributes = ('grid_x', 'grid_y', 'grid_z', 'grid_temp', 'gradient_x', 'gradient_y', 'gradient_z',
+                          'grid_lookup', '_data', '_tree')
+
     # TODO: test TimeAvgPlume
     def __init__(self, environment):
         super(self.__class__, self).__init__(environment)
@@ -301,12 +600,58 @@ class TimeAvgTempModel(HeatModel):
         # resolution = (100j, 25j, 25j)  # stored as complex numbers for mgrid to work properly
         self.interpolation_resolution = .05  # in meters
 
+        # how temperatures and gradients are read off the interpolated grid. options: 'nearest', 'trilinear'
+        self.grid_lookup_mode = 'nearest'
+
+        # room temperature sheet put around the windtunnel walls before interpolating
+        self.wall_sheet_thickness = 0.03  # make sure this value is >= wall_sheet_resolution
+        self.wall_sheet_resolution = 0.03
+
+        # Rbf settings. smoothing was determined by testing various numbers and looking at the minimum and maximum of
+        # the resulting plumes. epsilon=None uses the average distance between neighboring observations
+        self.rbf_function = 'quintic'
+        self.rbf_smoothing = 2e-5  # TODO: we can disable smoothing by getting rid of duplicate positions
+        self.rbf_epsilon = None
+        # the Rbf is evaluated on blocks of this many grid nodes at a time, which bounds memory use
+        self.rbf_block_shape = (10, 10, 10)
+        # None fits one Rbf to all the data. an int fits a local Rbf per block to its rbf_neighbors nearest data points,
+        # which is needed for fine (~1 cm) resolutions
+        self.rbf_neighbors = None
+        # number of processes to interpolate blocks on
+        self.interpolation_workers = 1
+
+        # reuse interpolations of the same raw data with the same settings from get_directory('TIMEAVG_INTERPOLATION_CACHE')
+        self.use_interpolation_cache = True
+
+        self._data = None  # built from the grid on first access if we loaded a binary grid
+        self._tree = None  # built on first access
+        self.grid_lookup = None
+
+        grid_dir = self._get_grid_directory()
+        have_binary_grid = grid_exists(grid_dir)
+
         print "loading raw plume data"
-        data_list = self._load_plume_data() # returns list. len(list) == 3 if precomputed.
+        # returns list. len(list) == 3 if precomputed.
+        data_list = self._load_plume_data(load_precomputed=not have_binary_grid)
 
-        if len(data_list) == 3:
+        if have_binary_grid:
+            print "loading binary grid {}".format(grid_dir)
+            self.raw_data = data_list[0]
+            self.padded_data = None  # not stored with the grid
+            interp_func = "binary grid"
+            self._set_grid(*load_grid(grid_dir))
+        elif len(data_list) == 3:
             print "loading precomputed padded and interpolated data"
             self.raw_data, self.padded_data, self.data = data_list
+            interp_func = "precomputed"
+            self.grid_x, self.grid_y, self.grid_z, self.grid_temp = self._grid_from_data()
+            if 'gradient_x' in self.data:
+                self.gradient_x, self.gradient_y, self.gradient_z = [
+                    self.data[col].values.reshape(self.grid_temp.shape)
+                    for col in ('gradient_x', 'gradient_y', 'gradient_z')]
+            else:
+                print "calculating gradient"
+                self.gradient_x, self.gradient_y, self.gradient_z = self._calc_gradient()
         elif len(data_list) == 1:
             self.raw_data = data_list[0]
             # print "filling area surrounding measured area with room temperature data"
@@ -318,13 +663,22 @@ class TimeAvgTempModel(HeatModel):
             self.grid_x, self.grid_y, self.grid_z = self._set_interpolation_coords(self.padded_data)
             print "WARNING: temporarily setting interpolation function by hand inside environment.py! ~line 317"
             interp_func = self._interpolate_data_RBF  # options: self._interpolate_data_RBF self._interpolate_data_griddata
-            self.data, self.grid_temp = interp_func()
-            # self.data, self.grid_x, self.grid_y, self.grid_z, self.grid_temp = self._interpolate_data_RBF()
-            print "calculating gradient"
-            self.gradient_x, self.gradient_y, self.gradient_z = self._calc_gradient()
 
-        print "calculating kd-tree"
-        self.tree = self._calc_kdtree()
+            cache_key = self._interpolation_cache_key(interp_func) if self.use_interpolation_cache else None
+            cached = load_interpolation(cache_key) if cache_key is not None else None
+            if cached is not None:
+                print "loaded interpolation from cache ({})".format(cache_key)
+                self._set_grid(*cached)
+            else:
+                self.data, self.grid_temp = interp_func()
+                # self.data, self.grid_x, self.grid_y, self.grid_z, self.grid_temp = self._interpolate_data_RBF()
+                print "calculating gradient"
+                self.gradient_x, self.gradient_y, self.gradient_z = self._calc_gradient()
+                if cache_key is not None:
+                    self._save_to_interpolation_cache(cache_key)
+
+        if self.grid_lookup is None:
+            self.grid_lookup = self._calc_grid_lookup()
 
         print """Timeaveraged plume stats:  TODO implement sanity checks
         interp function: {}
@@ -333,11 +687,49 @@ class TimeAvgTempModel(HeatModel):
         interpolated min temp: {}
         interpolated max temp: {}
         """.format(interp_func, self.raw_data.avg_temp.min(), self.raw_data.avg_temp.max(),
-                   self.data.avg_temp.min(), self.data.avg_temp.max())
+                   np.nanmin(self.grid_temp), np.nanmax(self.grid_temp))
 
         print """Warning: we don't know the plume bounds for the Timeavg plume, so the check_for_plume() method
                 always returns False"""
 
+    @property
+    def data(self):
+        """interpolated temperatures and gradients as a dataframe, one row per grid node"""
+        if self._data is None:
+            self._data = self._data_from_grid()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    @property
+    def tree(self):
+        """kd-tree over the interpolated grid nodes, for get_nearest_prediction()"""
+        if self._tree is None:
+            print "calculating kd-tree"
+            self._tree = self._calc_kdtree()
+        return self._tree
+
+    def export_grid(self, grid_dir=None):
+        """
+        Save the interpolated temperature and gradient volumes in the binary grid format, which later environments load
+        (memory-mapped) instead of the csvs or interpolating.
+
+        Parameters
+        ----------
+        grid_dir
+            defaults to get_directory('THERMOCOUPLE_TIMEAVG_<SIDE>_GRID')
+
+        Returns
+        -------
+        grid_dir
+        """
+        if grid_dir is None:
+            grid_dir = self._get_grid_directory()
+        return save_grid(grid_dir, self.grid_x[:, 0, 0], self.grid_y[0, :, 0], self.grid_z[0, 0, :],
+                         self._grid_volumes(), overwrite=True)
+
     def check_in_plume_bounds(self, *_):
         """
         we don't know the plume bounds for the Timeavg plume, so the check_in_plume_bounds() method
@@ -369,8 +761,29 @@ class TimeAvgTempModel(HeatModel):
         return data
 
     def get_nearest_gradient(self, position):
-        data = self.get_nearest_prediction(position)
-        return np.array([data['gradient_x'], data['gradient_y'], data['gradient_z']])
+        """
+        Given [x,y,z] or an (N, 3) array of positions, read the gradient off the interpolated grid using
+        self.grid_lookup_mode
+
+        Returns
+        -------
+        gradient
+            [dT/dx, dT/dy, dT/dz], or an (N, 3) array
+        """
+        return self.grid_lookup.query(position, 'gradient', self.grid_lookup_mode)
+
+    def get_temperature(self, position):
+        """
+        Given [x,y,z] or an (N, 3) array of positions, read the temperature off the interpolated grid using
+        self.grid_lookup_mode
+        """
+        return self.grid_lookup.query(position, 'temperature', self.grid_lookup_mode)
+
+    def get_nearest_gradient_batch(self, positions):
+        return self.grid_lookup.query(np.asarray(positions).reshape(-1, 3), 'gradient', self.grid_lookup_mode)
+
+    def get_temperature_batch(self, positions):
+        return self.grid_lookup.query(np.asarray(positions).reshape(-1, 3), 'temperature', self.grid_lookup_mode)
 
     def show_scatter_data(self, selection='raw', temp_thresh=0):
         print "selection={}".format(selection)
@@ -412,9 +825,22 @@ class TimeAvgTempModel(HeatModel):
 
         return dist_neighbors.mean()
 
-    def _load_plume_data(self):
+    def _get_grid_directory(self):
+        if self.condition in 'lLleftLeft':
+            return get_directory('THERMOCOUPLE_TIMEAVG_LEFT_GRID')
+        elif self.condition in 'rightRight':
+            return get_directory('THERMOCOUPLE_TIMEAVG_RIGHT_GRID')
+        else:
+            raise Exception('No such condition for loading plume data: {}'.format(self.condition))
+
+    def _load_plume_data(self, load_precomputed=True):
         """
 
+        Parameters
+        ----------
+        load_precomputed
+            look for precomputed padded and interpolated csvs
+
         Returns
         -------
         list of dataframes
@@ -428,8 +854,11 @@ class TimeAvgTempModel(HeatModel):
             raise Exception("We shouldn't ever run this, unless we ever decide to precompute control temps")
         elif self.condition in 'lLleftLeft':
             plume_dir = get_directory('THERMOCOUPLE_TIMEAVG_LEFT_CSV')
+            self.raw_data_path = plume_dir
             raw = pd.read_csv(plume_dir, names=col_names)
             raw = raw.dropna()
+            if not load_precomputed:
+                return [raw]
 
             # check for pre-computed padded files
             try:
@@ -446,8 +875,11 @@ class TimeAvgTempModel(HeatModel):
 
         elif self.condition in 'rightRight':
             plume_dir = get_directory('THERMOCOUPLE_TIMEAVG_RIGHT_CSV')
+            self.raw_data_path = plume_dir
             raw = pd.read_csv(plume_dir, names=col_names)
             raw = raw.dropna()
+            if not load_precomputed:
+                return [raw]
 
             # check for pre-computed padded files
             try:
@@ -467,7 +899,8 @@ class TimeAvgTempModel(HeatModel):
 
     def _room_temp_wall_sheet(self):
         # generates a plane of room temp data points immediately outside of the wintunnel
-        wall_thickness = 0.03  # make sure this value is >= resolution in the _make_uniform_data_grid()
+        wall_thickness = self.wall_sheet_thickness
+        res = self.wall_sheet_resolution
         data_xmin = self.downwind - wall_thickness
         data_xmax = self.upwind + wall_thickness
         data_ymin = self.left - wall_thickness
@@ -479,14 +912,14 @@ class TimeAvgTempModel(HeatModel):
         df_list = [self.raw_data]  # start with raw data
 
         # make a sheet of room temp data for each wall
-        df_list.append(self._make_uniform_data_grid(data_xmin, self.downwind, self.left, self.right, self.floor, self.ceiling))
-        df_list.append(self._make_uniform_data_grid(self.upwind, data_xmax, self.left, self.right, self.floor, self.ceiling))
+        df_list.append(self._make_uniform_data_grid(data_xmin, self.downwind, self.left, self.right, self.floor, self.ceiling, res=res))
+        df_list.append(self._make_uniform_data_grid(self.upwind, data_xmax, self.left, self.right, self.floor, self.ceiling, res=res))
 
-        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, data_ymin, self.left, self.floor, self.ceiling))
-        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, self.right, data_ymax, self.floor, self.ceiling))
+        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, data_ymin, self.left, self.floor, self.ceiling, res=res))
+        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, self.right, data_ymax, self.floor, self.ceiling, res=res))
 
-        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, self.left, self.right, data_zmin, self.floor))
-        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, self.left, self.right, self.ceiling, data_zmax))
+        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, self.left, self.right, data_zmin, self.floor, res=res))
+        df_list.append(self._make_uniform_data_grid(self.downwind, self.upwind, self.left, self.right, self.ceiling, data_zmax, res=res))
 
         return pd.concat(df_list)
 
@@ -543,7 +976,6 @@ class TimeAvgTempModel(HeatModel):
 
     def _set_interpolation_coords(self, data):
         """generate the coords our interpolator will evaluate at"""
-        # TODO: run this on a computer with lots of memory and save CSV so you don't run into memory errors (200, 60, 60)
         xi = np.arange(self.downwind, self.upwind, self.interpolation_resolution)
         yi = np.arange(self.left, self.right, self.interpolation_resolution)
         zi = np.arange(self.floor, self.ceiling, self.interpolation_resolution)
@@ -567,6 +999,29 @@ class TimeAvgTempModel(HeatModel):
 
         return interpolated_temps_df, interpolated_temp_grid
 
+    def _interpolation_cache_key(self, interp_func):
+        """key of interp_func's result for our raw data and settings in the interpolation cache"""
+        settings = {'interp_func': interp_func.__name__,
+                    'interpolation_resolution': self.interpolation_resolution,
+                    'bounds': self.bounds,
+                    'wall_sheet_thickness': self.wall_sheet_thickness,
+                    'wall_sheet_resolution': self.wall_sheet_resolution,
+                    'wall_sheet_temperature': 19.,
+                    'rbf_function': self.rbf_function,
+                    'rbf_smoothing': self.rbf_smoothing,
+                    'rbf_epsilon': self.rbf_epsilon,
+                    'rbf_neighbors': self.rbf_neighbors}
+        if self.rbf_neighbors is not None:  # local fits depend on how the grid is split up
+            settings['rbf_block_shape'] = list(self.rbf_block_shape)
+        return interpolation_cache_key(self.raw_data_path, settings)
+
+    def _save_to_interpolation_cache(self, cache_key):
+        try:
+            save_interpolation(cache_key, self.grid_x[:, 0, 0], self.grid_y[0, :, 0], self.grid_z[0, 0, :],
+                               self._grid_volumes())
+        except (IOError, OSError) as e:  # a read-only data dir shouldn't stop the simulation
+            print "could not write interpolation cache: {}".format(e)
+
     def _interpolate_data_RBF(self):
         """
         Replace data with a higher resolution interpolation
@@ -577,43 +1032,31 @@ class TimeAvgTempModel(HeatModel):
 
         Returns
         -------
-        interpolated_temps, (grid_x, grid_y, grid_z, grid_temps)
+        interpolated_temps, grid_temps
+            interpolated_temps is None: the dataframe is built from the grid on first access of self.data, since it is
+            large for fine resolutions
         """
         # TODO: review this function
         data = self.padded_data
 
-        # useful aliases
-        x, y, z, temps = data.x.values, data.y.values, data.z.values, data.avg_temp.values
-
-        # calculate average 3D euclidean distance b/w observations
-        avg_distance = self.calc_euclidean_distance_neighbords(selection = 'raw')  # use
-
+        if self.rbf_epsilon is None:
+            # calculate average 3D euclidean distance b/w observations
+            epsilon = self.calc_euclidean_distance_neighbords(selection='raw')
+        else:
+            epsilon = self.rbf_epsilon
 
         # init rbf interpolator
         """smoothing was determined by testing various numbers and looking at the minimum and maximum of the resulting plumes
         if I put values too far from this, the minimum and maximum temperature start to become extremely unnaturalistic.
         """
-        smoothing = 2e-5  # TODO: we can disable smoothing by getting rid of duplicate positions
-        self.rbfi = Rbf(x, y, z, temps, function='quintic', smooth=smoothing, epsilon=avg_distance)
-
-        # interpolate at those locations
-        grid_x_flat = self.grid_x.ravel()
-        grid_y_flat = self.grid_y.ravel()
-        grid_z_flat = self.grid_z.ravel()
-        interp_temps = self.rbfi(grid_x_flat, grid_y_flat, grid_z_flat)
-
-        # save to df
-        df_dict = dict()
-        df_dict['x'] = grid_x_flat
-        df_dict['y'] = grid_y_flat
-        df_dict['z'] = grid_z_flat
-        df_dict['avg_temp'] = interp_temps
-        interpolated_temps_df = pd.DataFrame(df_dict)
-
         # we save this grid b/c it helps us with the gradient func
-        grid_temps = interp_temps.reshape(self.grid_x.shape)  # all the grid_* have the same shape
+        grid_temps = interpolate_rbf_on_grid(data[['x', 'y', 'z']].values, data.avg_temp.values,
+                                             self.grid_x[:, 0, 0], self.grid_y[0, :, 0], self.grid_z[0, 0, :],
+                                             function=self.rbf_function, smooth=self.rbf_smoothing, epsilon=epsilon,
+                                             block_shape=self.rbf_block_shape, n_neighbors=self.rbf_neighbors,
+                                             workers=self.interpolation_workers)
 
-        return interpolated_temps_df, grid_temps
+        return None, grid_temps
 
     def _calc_gradient(self):
         # impossible to do gradient with unevenly spaced  samples, see https://stackoverflow.com/questions/36781698/numpy-sample-distances-for-3d-gradient
@@ -628,9 +1071,12 @@ class TimeAvgTempModel(HeatModel):
         #grid_temps = interp_temps.reshape((len(xi), len(yi), len(zi)))
 
         # Solve for the spatial
-        distances = [np.diff(self.data.x.unique())[0], np.diff(self.data.y.unique())[0], np.diff(self.data.z.unique())[0]]
+        distances = [np.diff(self.grid_x[:, 0, 0])[0], np.diff(self.grid_y[0, :, 0])[0], np.diff(self.grid_z[0, 0, :])[0]]
         gradient_x, gradient_y, gradient_z = np.gradient(self.grid_temp, *distances)
 
+        if self._data is None:  # the dataframe gets built from the grid, gradients included, if it's ever needed
+            return gradient_x, gradient_y, gradient_z
+
         self.data['gradient_x'] = gradient_x.ravel()
         self.data['gradient_y'] = gradient_y.ravel()
         self.data['gradient_z'] = gradient_z.ravel()
@@ -642,6 +1088,69 @@ class TimeAvgTempModel(HeatModel):
 
         return gradient_x, gradient_y, gradient_z
 
+    def _grid_from_data(self):
+        """rebuild the regular meshgrids from the interpolated dataframe, e.g. after loading it from a csv"""
+        xi, yi, zi = np.unique(self.data.x.values), np.unique(self.data.y.values), np.unique(self.data.z.values)
+        if len(self.data) != len(xi) * len(yi) * len(zi):
+            raise ValueError("interpolated plume data does not lie on a regular grid")
+
+        # order rows like np.meshgrid(xi, yi, zi, indexing='ij').ravel() does
+        order = np.lexsort((self.data.z.values, self.data.y.values, self.data.x.values))
+        self.data = self.data.iloc[order].reset_index(drop=True)
+
+        grid_x, grid_y, grid_z = np.meshgrid(xi, yi, zi, indexing='ij')
+        grid_temp = self.data.avg_temp.values.reshape(grid_x.shape)
+
+        return grid_x, grid_y, grid_z, grid_temp
+
+    def _grid_volumes(self):
+        gradient = np.stack([self.gradient_x, self.gradient_y, self.gradient_z], axis=-1)
+        gradient[~np.isfinite(gradient)] = 0  # same cleanup _calc_gradient does for the dataframe
+
+        return {'temperature': self.grid_temp, 'gradient': gradient}
+
+    def _calc_grid_lookup(self):
+        if self.condition in 'controlControlCONTROL':
+            return None
+
+        return RegularGridLookup(self.grid_x[:, 0, 0], self.grid_y[0, :, 0], self.grid_z[0, 0, :], self._grid_volumes())
+
+    def _get_shared_grid(self):
+        if self.grid_lookup is None:
+            return None
+        return self.grid_x[:, 0, 0], self.grid_y[0, :, 0], self.grid_z[0, 0, :], self._grid_volumes()
+
+    def _attach_shared_grid(self, xi, yi, zi, volumes):
+        self._data = None  # rebuilt from the shared grid if needed
+        self._tree = None
+        self._set_grid(xi, yi, zi, volumes)
+
+    def _set_grid(self, xi, yi, zi, volumes):
+        """use a grid loaded with grid_store.load_grid(). the volumes are used as is, so memory-mapped volumes stay
+        memory-mapped"""
+        shape = (len(xi), len(yi), len(zi))
+        # read-only broadcast views instead of full meshgrids
+        self.grid_x = np.broadcast_to(xi[:, np.newaxis, np.newaxis], shape)
+        self.grid_y = np.broadcast_to(yi[np.newaxis, :, np.newaxis], shape)
+        self.grid_z = np.broadcast_to(zi[np.newaxis, np.newaxis, :], shape)
+
+        self.grid_temp = volumes['temperature']
+        gradient = volumes['gradient']
+        self.gradient_x, self.gradient_y, self.gradient_z = gradient[..., 0], gradient[..., 1], gradient[..., 2]
+
+        self.grid_lookup = RegularGridLookup(xi, yi, zi, {'temperature': self.grid_temp, 'gradient': gradient})
+
+    def _data_from_grid(self):
+        """the dataframe _interpolate_data_RBF() and _calc_gradient() would have made for this grid"""
+        gradient = np.column_stack([self.gradient_x.ravel(), self.gradient_y.ravel(), self.gradient_z.ravel()])
+        data = pd.DataFrame({'x': self.grid_x.ravel(), 'y': self.grid_y.ravel(), 'z': self.grid_z.ravel(),
+                             'avg_temp': np.asarray(self.grid_temp).ravel()},
+                            columns=['avg_temp', 'x', 'y', 'z'])
+        data['gradient_x'], data['gradient_y'], data['gradient_z'] = gradient.T
+        data['gradient_norm'] = np.linalg.norm(gradient, axis=1)
+
+        return data
+
     def _calc_kdtree(self, selection = 'interpolated'):
         if self.condition in 'controlControlCONTROL':  # TODO: review this
             return None
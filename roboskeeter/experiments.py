@@ -5,10 +5,12 @@ __author__ = 'richard'
 from roboskeeter.math.kinematic_math import DoMath
 # from roboskeeter.math.scoring.scoring import Scoring
 from roboskeeter.simulator import Simulator
-from roboskeeter.environment import Environment
+from roboskeeter.decisions import DECISIONS, PLUME_SIGNALS
+from roboskeeter.environment import Environment, get_environment
 from roboskeeter.observations import Observations
 from roboskeeter.plotting.plot_funcs_wrapper import PlotFuncsWrapper
 import numpy as np
+import pandas as pd
 
 
 class Experiment(object):
@@ -17,13 +19,27 @@ class Experiment(object):
 
     Stores the windtunnel and plume objects
     """
-    def __init__(self, agent_kwargs, experiment_conditions):
+    def __init__(self, agent_kwargs, experiment_conditions, shared_environment=False):
+        """
+        Parameters
+        ----------
+        agent_kwargs
+            (dict) params for agent
+        experiment_conditions
+            (dict) params for environment
+        shared_environment
+            (bool) reuse the process-wide environment for these conditions (see environment.get_environment) instead
+            of loading a new one. Changes made to a shared environment are seen by every experiment using it.
+        """
         # save metadata
         self.experiment_conditions = experiment_conditions
         self.is_simulation = agent_kwargs['is_simulation']
 
         # init objects
-        self.environment = Environment(self)
+        if shared_environment:
+            self.environment = get_environment(self)
+        else:
+            self.environment = Environment(self)
 
         self.observations = Observations()
         self.agent = Simulator(self, agent_kwargs)
@@ -34,8 +50,10 @@ class Experiment(object):
         self.percent_time_in_plume = None
         self.side_ratio_score = None
         self.score, self.score_components = None, None
+        self.summary = None  # KinematicSummary, if run with summary_only
 
-    def run(self, n=None):  # None as default in case we're loading experiments instead of simulating
+    def run(self, n=None, workers=1, seed=None, summary_only=False,
+            sketch_edges=None):  # None as default in case we're loading experiments instead of simulating
         """
         Func that either loads experimental data or runs a simulation, depending on whether self.is_simulation is True
         Parameters
@@ -43,6 +61,19 @@ class Experiment(object):
         n
             (int, optional)
             Number of flights to simulate. If we are just loading files, it will load the entire ensemble.
+        workers
+            (int, optional)
+            Number of processes to simulate on
+        seed
+            (int, optional)
+            Seed for reproducible simulations, see Simulator.fly
+        summary_only
+            (bool, optional)
+            Only keep what scoring needs in self.summary (see Simulator.fly_summary). observations stay empty and no
+            analysis is run
+        sketch_edges
+            (dict, optional)
+            passed to Simulator.fly_summary
 
         Returns
         -------
@@ -51,27 +82,31 @@ class Experiment(object):
         if self.is_simulation:
             if type(n) != int:
                 raise TypeError("Number of flights must be integer.")
+            elif summary_only:
+                self.summary = self.agent.fly_summary(n_trajectories=n, workers=workers, seed=seed,
+                                                      sketch_edges=sketch_edges)
+                return
             else:
-                self.observations = self.agent.fly(n_trajectories=n)
+                self.observations = self.agent.fly(n_trajectories=n, workers=workers, seed=seed)
         else:
             self.observations.experiment_data_to_DF(experimental_condition=self.experiment_conditions['condition'])
             if self.experiment_conditions['optimizing'] is False:  # skip unneccessary computations for optimizer
                 print """\nDone loading files. Iterating through flights and presenting heat model "{}",
                  making hypothetical decisions using "{}" decision policy""".format(
                     self.environment.heat_model_name, self.agent.decision_policy)
-                n_rows = len(self.observations.kinematics)
-                in_plume = np.zeros(n_rows, dtype=bool)
-                heat_signal = np.array([None] * n_rows)
-                decision = np.array([None] * n_rows)
-                for i, row in self.observations.kinematics.iterrows():
-                    in_plume[i] = self.environment.heat.check_in_plume_bounds([row.position_x,
-                                                                               row.position_y,
-                                                                               row.position_z])
-                    decision[i], heat_signal[i] = self.agent.decisions.make_decision(in_plume[i], row.velocity_y)
+                kinematics = self.observations.kinematics
+                n_rows = len(kinematics)
+                heat_signal = np.empty(n_rows, dtype=np.int8)
+                decision = np.empty(n_rows, dtype=np.int8)
+                in_plume = self.environment.heat.check_in_plume_bounds_batch(
+                    kinematics[['position_x', 'position_y', 'position_z']].values)
+                velocity_y = kinematics['velocity_y'].values
+                for i in xrange(n_rows):
+                    decision[i], heat_signal[i] = self.agent.decisions.make_decision(in_plume[i], velocity_y[i])
 
                 self.observations.kinematics['in_plume'] = in_plume
-                self.observations.kinematics['plume_signal'] = heat_signal
-                self.observations.kinematics['decision'] = decision
+                self.observations.kinematics['plume_signal'] = pd.Categorical.from_codes(heat_signal, PLUME_SIGNALS)
+                self.observations.kinematics['decision'] = pd.Categorical.from_codes(decision, DECISIONS)
 
         # assign alias
         self.plt = PlotFuncsWrapper(self)  # takes self, extracts metadata for files and titles, etc
@@ -101,7 +136,8 @@ class Experiment(object):
 
 
 
-def start_simulation(num_flights, agent_kwargs=None, simulation_conditions=None):
+def start_simulation(num_flights, agent_kwargs=None, simulation_conditions=None, workers=1, seed=None,
+                     shared_environment=True, summary_only=False, sketch_edges=None):
     """
     Fire up RoboSkeeter
     Parameters
@@ -112,6 +148,15 @@ def start_simulation(num_flights, agent_kwargs=None, simulation_conditions=None)
         (dict) params for agent
     simulation_conditions
         (dict) params for environment
+    workers
+        (int) number of processes to simulate on
+    seed
+        (int or None) seed for reproducible simulations
+    shared_environment
+        (bool) reuse the environment (and its heat model) of earlier simulations with the same condition, heat model
+        and boundedness. Use environment.evict_environments() to reload it, e.g. after the plume data changed.
+    summary_only, sketch_edges
+        see Experiment.run. For optimizers, which only need experiment.summary for scoring
 
     Returns
     -------
@@ -122,7 +167,9 @@ def start_simulation(num_flights, agent_kwargs=None, simulation_conditions=None)
                                  'time_max': 6.,
                                  'bounded': True,
                                  'optimizing': False,
-                                 'heat_model_name': "Timeavg"  # "Boolean", "Timeavg", "None", "Unaveraged"
+                                 'heat_model_name': "Timeavg",  # "Boolean", "Timeavg", "None", "Unaveraged"
+                                 # voxel size (m) of the Boolean plume's occupancy bitmap, None checks it exactly
+                                 'plume_occupancy_resolution': None
                                  }
     if agent_kwargs is None: # Load defaults
         agent_kwargs = {'is_simulation': True,
@@ -135,11 +182,12 @@ def start_simulation(num_flights, agent_kwargs=None, simulation_conditions=None)
                         'decision_policy': 'gradient',  # 'surge', 'cast', 'castsurge', 'gradient', 'ignore'
                         'initial_position_selection': 'realistic',
                         'verbose': True,
-                        'optimizing': False
+                        'optimizing': False,
+                        'simulation_engine': 'batch'  # 'batch', 'scalar'
                         }
 
-    experiment = Experiment(agent_kwargs, simulation_conditions)
-    experiment.run(n=num_flights)
+    experiment = Experiment(agent_kwargs, simulation_conditions, shared_environment=shared_environment)
+    experiment.run(n=num_flights, workers=workers, seed=seed, summary_only=summary_only, sketch_edges=sketch_edges)
     if agent_kwargs['verbose'] is True:
         print "\nDone running simulation."
 
@@ -1,6 +1,7 @@
 __author__ = 'richard'
 import numpy as np
 from roboskeeter.math import math_toolbox
+from roboskeeter.decisions import DECISIONS, SURGE, CAST_L, CAST_R, GRADIENT_ASCENT
 
 
 class Flight():
@@ -9,39 +10,47 @@ class Flight():
         self.stim_f_strength = stim_f_strength  # TODO: separate surge strength, cast strength, gradient strenght
         self.damping_coeff = damping_coeff
         self.max_stim_f = 1e-5  # putting a maximum value on the stim_f
+        self._stimulus_table_key = None  # the strengths the cached table was built with, see _get_stimulus_table
+        self._stimulus_table = None
 
-    def random(self):
+    def random(self, random_state=np.random):
         """Generate random-direction force vector at each timestep from double-
         exponential distribution given exponent term rf.
         """
-        unit_vector = math_toolbox.generate_random_unit_vector()
+        unit_vector = math_toolbox.generate_random_unit_vector(random_state)
         force = self.random_f_strength * unit_vector
 
         return force
 
-    def stimulus(self, decision, plume_signal):
-        force = np.array([0., 0., 0.])
-
-        if decision is 'search':
-            pass  # there is no stimulus_f in the absence of stimulus
-        elif decision is 'ga':
-            force += self.surge_up_gradient(plume_signal)
-        elif decision is 'surge':
-            force += self.surge_upwind()
-        elif 'cast' in decision:
-            force += self.cast(decision)
-        elif decision == 'ignore':
-            pass
-        else:
+    def stimulus(self, decision, plume_gradient):
+        """
+        Parameters
+        ----------
+        decision
+            decision code, see decisions.DECISIONS
+        plume_gradient
+            the current plume gradient. Only read when ascending the gradient
+
+        Returns
+        -------
+        force
+            the stimulus force
+        """
+        if not 0 <= decision < len(DECISIONS):
             raise LookupError('unknown decision {}'.format(decision))
 
+        if decision == GRADIENT_ASCENT:
+            force = self.surge_up_gradient(plume_gradient)
+        else:  # search and ignore have no stimulus force
+            force = self._get_stimulus_table()[decision].copy()
+
         return force
 
-    def calc_forces(self, current_velocity, decision, plume_signal):
+    def calc_forces(self, current_velocity, decision, plume_signal, random_state=np.random):
         ################################################
         # Calculate driving forces at this timestep
         ################################################
-        random_f = self.random()
+        random_f = self.random(random_state)
 
         stim_f = self.stimulus(decision, plume_signal)
 
@@ -53,13 +62,89 @@ class Flight():
 
         return stim_f, random_f, total_f
 
+    def random_batch(self, n_agents, random_gauss=None):
+        """Random-direction force vectors for n_agents at once, see random()
+
+        random_gauss
+            optional (n_agents, 3) array of pre-drawn standard normals to build the directions from, e.g. when each
+            agent draws from its own random stream
+        """
+        if random_gauss is None:
+            unit_vectors = math_toolbox.generate_random_unit_vectors(n_agents)
+        else:
+            unit_vectors = math_toolbox.normalize_vectors(random_gauss)
+        forces = self.random_f_strength * unit_vectors
+
+        return forces
+
+    def stimulus_batch(self, decisions, plume_signals):
+        """
+        Vectorized counterpart of stimulus()
+
+        Parameters
+        ----------
+        decisions
+            (N,) array of decision codes, see decisions.DECISIONS
+        plume_signals
+            (N, 3) array of gradients. Only read for agents ascending the gradient.
+
+        Returns
+        -------
+        forces
+            (N, 3) array of stimulus forces
+        """
+        decisions = np.asarray(decisions)
+        unknown = (decisions < 0) | (decisions >= len(DECISIONS))
+        if unknown.any():
+            raise LookupError('unknown decision {}'.format(decisions[unknown][0]))
+
+        forces = self._get_stimulus_table()[decisions]
+
+        ascending = decisions == GRADIENT_ASCENT
+        if ascending.any():
+            forces[ascending] = self.surge_up_gradient_batch(plume_signals[ascending])
+
+        return forces
+
+    def _get_stimulus_table(self):
+        """
+        (len(DECISIONS), 3) array of the stimulus force of every decision that doesn't depend on the plume gradient.
+        Rebuilt whenever the force strengths change.
+        """
+        key = (self.stim_f_strength, self.max_stim_f)
+        if key != self._stimulus_table_key:
+            table = np.zeros((len(DECISIONS), 3))
+            table[SURGE] = self.surge_upwind()
+            table[CAST_L] = self.cast(CAST_L)
+            table[CAST_R] = self.cast(CAST_R)
+            self._stimulus_table, self._stimulus_table_key = table, key
+
+        return self._stimulus_table
+
+    def calc_forces_batch(self, current_velocities, decisions, plume_signals, random_gauss=None):
+        """
+        Vectorized counterpart of calc_forces(). Each row of the inputs and outputs is one agent.
+
+        Returns
+        -------
+        stim_f, random_f, total_f
+            (N, 3) arrays
+        """
+        random_f = self.random_batch(len(current_velocities), random_gauss)
+
+        stim_f = self.stimulus_batch(decisions, plume_signals)
+
+        total_f = -self.damping_coeff * current_velocities + random_f + stim_f
+
+        return stim_f, random_f, total_f
+
     def cast(self, decision):
         """
 
         Parameters
         ----------
         decision
-            cast_l or cast_r
+            CAST_L or CAST_R
 
         Returns
         -------
@@ -67,7 +152,7 @@ class Flight():
             the appropriate cast force
         """
         cast_f = self.stim_f_strength
-        if 'l' in decision:  # need to cast left
+        if decision == CAST_L:  # need to cast left
             cast_f *= -1.
         else:
             pass
@@ -109,6 +194,20 @@ class Flight():
 
         return force
 
+    def surge_up_gradient_batch(self, gradients):
+        """Vectorized counterpart of surge_up_gradient(). gradients is an (N, 3) array."""
+        forces = self.stim_f_strength * gradients
+
+        forces = self._shrink_huge_stim_f_batch(forces)
+
+        # catch bugs in gradient multiplication
+        if not np.isfinite(forces).all():
+            bad = ~np.isfinite(forces).all(axis=1)
+            raise ValueError("Nans or infs in gradient force!! force = {} gradient = {}".format(
+                forces[bad][0], gradients[bad][0]))
+
+        return forces
+
     def _shrink_huge_stim_f(self, force):
         norm = np.linalg.norm(force)
         if norm > self.max_stim_f:
@@ -116,3 +215,10 @@ class Flight():
 
         return force
 
+
+    def _shrink_huge_stim_f_batch(self, forces):
+        norms = np.linalg.norm(forces, axis=1)
+        too_huge = norms > self.max_stim_f
+        forces[too_huge] *= (self.max_stim_f / norms[too_huge])[:, np.newaxis]  # shrink to maximum allowed value
+
+        return forces
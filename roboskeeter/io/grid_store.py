@@ -0,0 +1,112 @@
+"""
+Binary storage for regular 3D grids, e.g. the interpolated temperature and gradient volumes of the time-averaged
+plume.
+
+A grid is a directory holding one .npy file per axis (xi.npy, yi.npy, zi.npy) and one per volume (temperature.npy,
+gradient.npy, ...), plus a small grid.json manifest. .npy files can be memory-mapped, so loading a grid neither parses
+text nor copies the volumes into memory until they are read.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+GRID_FORMAT_VERSION = 1
+MANIFEST_FNAME = 'grid.json'
+AXES = ('xi', 'yi', 'zi')
+
+
+def grid_exists(grid_dir):
+    return os.path.isfile(os.path.join(grid_dir, MANIFEST_FNAME))
+
+
+def save_grid(grid_dir, xi, yi, zi, volumes, overwrite=False):
+    """
+    Parameters
+    ----------
+    grid_dir
+        (str) directory to write. It is written next to its final location and renamed into place, so readers never
+        see a partially written grid.
+    xi, yi, zi
+        (1D arrays) grid coordinates along each axis
+    volumes
+        (dict) name -> array with shape (len(xi), len(yi), len(zi)) or (len(xi), len(yi), len(zi), k)
+    overwrite
+        replace grid_dir if it already exists. Otherwise an existing grid is left alone.
+
+    Returns
+    -------
+    grid_dir
+    """
+    axes = dict(zip(AXES, [np.asarray(xi, dtype=float), np.asarray(yi, dtype=float), np.asarray(zi, dtype=float)]))
+    shape = tuple(len(axes[axis]) for axis in AXES)
+    for name, volume in volumes.iteritems():
+        if name in AXES:
+            raise ValueError("volume name {} is reserved for an axis".format(name))
+        if tuple(np.shape(volume)[:3]) != shape:
+            raise ValueError("volume {} has shape {}, grid has shape {}".format(name, np.shape(volume), shape))
+
+    grid_dir = os.path.abspath(grid_dir)
+    parent = os.path.dirname(grid_dir)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:  # someone else made it in the meantime
+            if not os.path.isdir(parent):
+                raise
+
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.' + os.path.basename(grid_dir), suffix='.tmp')
+    try:
+        for name, array in axes.items() + volumes.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_dir, MANIFEST_FNAME), 'w') as f:
+            json.dump({'version': GRID_FORMAT_VERSION, 'shape': shape, 'volumes': sorted(volumes)}, f)
+
+        if os.path.exists(grid_dir):
+            if not overwrite:
+                shutil.rmtree(tmp_dir)
+                return grid_dir
+            old_dir = tmp_dir + '.old'
+            os.rename(grid_dir, old_dir)
+            os.rename(tmp_dir, grid_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.rename(tmp_dir, grid_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not grid_exists(grid_dir):  # lost a race against another writer is fine, anything else isn't
+            raise
+    except:  # e.g. interrupted, don't leave a half written grid behind
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return grid_dir
+
+
+def load_grid(grid_dir, mmap_mode='r'):
+    """
+    Parameters
+    ----------
+    grid_dir
+        (str) directory written by save_grid()
+    mmap_mode
+        passed to np.load. 'r' memory-maps the volumes read-only, None reads them into memory
+
+    Returns
+    -------
+    xi, yi, zi, volumes
+        the axes and a dict of name -> volume
+    """
+    with open(os.path.join(grid_dir, MANIFEST_FNAME)) as f:
+        manifest = json.load(f)
+    if manifest['version'] != GRID_FORMAT_VERSION:
+        raise ValueError("grid {} has format version {}, expected {}".format(
+            grid_dir, manifest['version'], GRID_FORMAT_VERSION))
+
+    xi, yi, zi = [np.load(os.path.join(grid_dir, axis + '.npy')) for axis in AXES]
+    volumes = {name: np.load(os.path.join(grid_dir, name + '.npy'), mmap_mode=mmap_mode)
+               for name in manifest['volumes']}
+
+    return xi, yi, zi, volumes
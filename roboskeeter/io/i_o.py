@@ -12,6 +12,22 @@ from tkFileDialog import askdirectory
 import numpy as np
 import pandas as pd
 
+TRAJECTORY_CSV_COLUMNS = [  # TODO: check that Sharri's kinematics are the same as your kinematics
+    'position_x',
+    'position_y',
+    'position_z',
+    'velocity_x',
+    'velocity_y',
+    'velocity_z',
+    'acceleration_x',
+    'acceleration_y',
+    'acceleration_z',
+    'heading_angleS',
+    'angular_velo_xyS',
+    'angular_velo_yzS',
+    'curvatureS'
+    ]
+
 
 def load_single_csv_to_df(csv_dir):
     """
@@ -26,21 +42,7 @@ def load_single_csv_to_df(csv_dir):
     pandas df
     """
 
-    col_labels = [  # TODO: check that Sharri's kinematics are the same as your kinematics
-        'position_x',
-        'position_y',
-        'position_z',
-        'velocity_x',
-        'velocity_y',
-        'velocity_z',
-        'acceleration_x',
-        'acceleration_y',
-        'acceleration_z',
-        'heading_angleS',
-        'angular_velo_xyS',
-        'angular_velo_yzS',
-        'curvatureS'
-        ]
+    col_labels = TRAJECTORY_CSV_COLUMNS
 
     # map string "NaN" to np.nan
     # header=None is needed to make sure dtype float is assigned properly, apparently
@@ -63,7 +65,8 @@ def load_single_csv_to_df(csv_dir):
 
 def experiment_condition_to_DF(experimental_condition):
     """
-    Given an experimental condition, load the appropriate dataset into a dataframe.
+    Given an experimental condition, load the appropriate dataset into a dataframe by parsing every csv. See
+    io.trajectory_store for a faster way.
     Parameters
     ----------
     experimental_condition
@@ -74,24 +77,44 @@ def experiment_condition_to_DF(experimental_condition):
     -------
     df
     """
+    df_list = []
+    for file_path in get_condition_csv_paths(experimental_condition):
+        directory, fname = os.path.split(file_path)
+        print "Loading {} from {}".format(fname, directory)
+        dataframe = load_single_csv_to_df(file_path)
+
+        df_list.append(dataframe)
+
+    df = pd.concat(df_list)
+
+    return df
+
+
+def get_condition_csv_paths(experimental_condition):
+    """
+    Parameters
+    ----------
+    experimental_condition
+        (string)
+        Control, Left, or Right, or list thereof
+
+    Returns
+    -------
+    list of the paths of every trajectory file of the condition(s), in loading order
+    """
     if type(experimental_condition) is str:
         experimental_condition = [experimental_condition]
     experimental_condition = [string.upper(i) for i in experimental_condition]
-    df_list = []
+
+    paths = []
     for condition in experimental_condition:
         dir_label = "EXP_TRAJECTORIES_" + condition
         directory = get_directory(dir_label)
 
         for fname in [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]:  # list files
-            print "Loading {} from {}".format(fname, directory)
-            file_path = os.path.join(directory, fname)
-            dataframe = load_single_csv_to_df(file_path)
-
-            df_list.append(dataframe)
-
-    df = pd.concat(df_list)
+            paths.append(os.path.join(directory, fname))
 
-    return df
+    return paths
 
 
 def get_csv_name_list(path, relative=True):
@@ -140,6 +163,8 @@ def get_directory(selection=None):
     EXP_TRAJECTORIES_CONTROL = os.path.join(EXPERIMENTAL_TRAJECTORIES, 'control')
     EXP_TRAJECTORIES_LEFT = os.path.join(EXPERIMENTAL_TRAJECTORIES, 'left')
     EXP_TRAJECTORIES_RIGHT = os.path.join(EXPERIMENTAL_TRAJECTORIES, 'right')
+    REFERENCE_CACHE = os.path.join(EXPERIMENTS_PATH, 'reference-cache')
+    TRAJECTORY_STORE = os.path.join(EXPERIMENTS_PATH, 'trajectory-store')
 
     TEMPERATURES_PATH = os.path.join(EXPERIMENTS_PATH, 'temperature')
     RAW = os.path.join(TEMPERATURES_PATH, 'raw-data')
@@ -153,9 +178,12 @@ def get_directory(selection=None):
     THERMOCOUPLE_TIMEAVG_LEFT_CSV = os.path.join(TIMEAVG, 'left', 'timeavg_left.csv')
     THERMOCOUPLE_TIMEAVG_LEFT_PADDED_CSV = os.path.join(TIMEAVG, 'left', 'timeavg_left_padded.csv')
     THERMOCOUPLE_TIMEAVG_LEFT_INTERPOLATED_CSV = os.path.join(TIMEAVG, 'left', 'timeavg_left_interpolated.csv')
+    THERMOCOUPLE_TIMEAVG_LEFT_GRID = os.path.join(TIMEAVG, 'left', 'timeavg_left_grid')
     THERMOCOUPLE_TIMEAVG_RIGHT_CSV = os.path.join(TIMEAVG, 'right', 'timeavg_right.csv')
     THERMOCOUPLE_TIMEAVG_RIGHT_PADDED_CSV = os.path.join(TIMEAVG, 'right', 'timeavg_right_padded.csv')
     THERMOCOUPLE_TIMEAVG_RIGHT_INTERPOLATED_CSV = os.path.join(TIMEAVG, 'right', 'timeavg_right_interpolated.csv')
+    THERMOCOUPLE_TIMEAVG_RIGHT_GRID = os.path.join(TIMEAVG, 'right', 'timeavg_right_grid')
+    TIMEAVG_INTERPOLATION_CACHE = os.path.join(TIMEAVG, 'interpolation-cache')
     BOOL_LEFT_CSV = os.path.join(BOOL, 'left', 'left_plume_bounds.csv')
     BOOL_RIGHT_CSV = os.path.join(BOOL, 'right', 'right_plume_bounds.csv')
 
@@ -170,14 +198,19 @@ def get_directory(selection=None):
         'EXP_TRAJECTORIES_CONTROL': EXP_TRAJECTORIES_CONTROL,
         'EXP_TRAJECTORIES_LEFT': EXP_TRAJECTORIES_LEFT,
         'EXP_TRAJECTORIES_RIGHT': EXP_TRAJECTORIES_RIGHT,
+        'REFERENCE_CACHE': REFERENCE_CACHE,
+        'TRAJECTORY_STORE': TRAJECTORY_STORE,
         'THERMOCOUPLE_RAW_LEFT': THERMOCOUPLE_RAW_LEFT_CSV,
         'THERMOCOUPLE_TIMEAVG_LEFT_PADDED_CSV': THERMOCOUPLE_TIMEAVG_LEFT_PADDED_CSV,
         'THERMOCOUPLE_TIMEAVG_LEFT_INTERPOLATED_CSV': THERMOCOUPLE_TIMEAVG_LEFT_INTERPOLATED_CSV,
+        'THERMOCOUPLE_TIMEAVG_LEFT_GRID': THERMOCOUPLE_TIMEAVG_LEFT_GRID,
         'THERMOCOUPLE_RAW_RIGHT': THERMOCOUPLE_RAW_RIGHT_CSV,
         'THERMOCOUPLE_TIMEAVG_RIGHT_PADDED_CSV': THERMOCOUPLE_TIMEAVG_RIGHT_PADDED_CSV,
         'THERMOCOUPLE_TIMEAVG_RIGHT_INTERPOLATED_CSV': THERMOCOUPLE_TIMEAVG_RIGHT_INTERPOLATED_CSV,
+        'THERMOCOUPLE_TIMEAVG_RIGHT_GRID': THERMOCOUPLE_TIMEAVG_RIGHT_GRID,
         'THERMOCOUPLE_TIMEAVG_LEFT_CSV': THERMOCOUPLE_TIMEAVG_LEFT_CSV,
         'THERMOCOUPLE_TIMEAVG_RIGHT_CSV': THERMOCOUPLE_TIMEAVG_RIGHT_CSV,
+        'TIMEAVG_INTERPOLATION_CACHE': TIMEAVG_INTERPOLATION_CACHE,
         'BOOL_LEFT_CSV': BOOL_LEFT_CSV,
         'BOOL_RIGHT_CSV': BOOL_RIGHT_CSV,
         'VAR_LEFT_CSV': VAR_LEFT_CSV,
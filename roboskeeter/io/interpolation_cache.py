@@ -0,0 +1,84 @@
+"""
+Content-addressed on-disk cache for interpolated temperature grids.
+
+Interpolating the time-averaged plume (fitting an Rbf over the thermocouple data and evaluating it on the full grid)
+takes minutes. The result only depends on the raw data file and on the interpolation settings, so we store it under
+a hash of both and load it back on the next run instead of interpolating again. Entries are stored in the
+memory-mappable grid format of grid_store.
+"""
+import hashlib
+import json
+import os
+
+from roboskeeter.io.grid_store import grid_exists, load_grid, save_grid
+from roboskeeter.io.i_o import get_directory
+
+# bump this whenever the interpolation code changes in a way that changes its output, to invalidate old entries
+CACHE_VERSION = 3
+
+
+def interpolation_cache_key(raw_data_path, settings):
+    """
+    Parameters
+    ----------
+    raw_data_path
+        (str) path of the raw thermocouple csv
+    settings
+        (dict) every setting the interpolation depends on (padding, smoothing, epsilon, kernel, resolution...).
+        values must be json serializable
+
+    Returns
+    -------
+    key
+        (str) hex digest of the raw data contents and the settings
+    """
+    digest = hashlib.sha1()
+    with open(raw_data_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps({'version': CACHE_VERSION, 'settings': settings}, sort_keys=True).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def load_interpolation(key, cache_dir=None):
+    """
+    Parameters
+    ----------
+    key
+        from interpolation_cache_key()
+    cache_dir
+        defaults to get_directory('TIMEAVG_INTERPOLATION_CACHE')
+
+    Returns
+    -------
+    xi, yi, zi, volumes
+        as returned by grid_store.load_grid() (volumes are memory-mapped read-only), or None on a cache miss
+    """
+    path = _entry_path(key, cache_dir)
+    if not grid_exists(path):
+        return None
+
+    try:
+        return load_grid(path)
+    except (IOError, ValueError):  # unreadable entry, treat it as a miss
+        return None
+
+
+def save_interpolation(key, xi, yi, zi, volumes, cache_dir=None):
+    """
+    Write a grid (see grid_store.save_grid) to the cache. Entries are renamed into place once fully written, so
+    concurrent readers never see a partial entry.
+
+    Returns
+    -------
+    path
+        of the cache entry
+    """
+    return save_grid(_entry_path(key, cache_dir), xi, yi, zi, volumes, overwrite=True)
+
+
+def _entry_path(key, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = get_directory('TIMEAVG_INTERPOLATION_CACHE')
+    return os.path.join(cache_dir, key)
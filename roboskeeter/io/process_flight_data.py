@@ -14,11 +14,12 @@ trim ends
 
 Split the trajectories: if the mosquito tracker loses the mosquito OR if the
 tracker code bugs out and gets stuck. Break threshold is 0.5sec (timebins are 
-10ms each, so we need 50 datapoints/NaNs in a row).
+10ms each, so we need 50 datapoints/NaNs in a row). Shorter gaps get interpolated.
 
 Output:
-trajectory data as .csv file
-** Output form? (x1, y1, z1), (x2, y2, z2), ...
+trajectory data as .csv files, one per split trajectory, with x,y,z columns
+
+A whole recording session is processed with process_directory, one csv per worker process.
 
 Created on Fri Mar 13 14:30:42 2015
 @author: Richard Decal, decal@uw.edu
@@ -30,11 +31,19 @@ video - string name of the recording file (avi)
 raw - 3D position of the trajectory. (n x 3, where n is the number of timesteps)
 """
 
+import multiprocessing
+import os
+import sys
+import tempfile
+
 import numpy as np
+import pandas as pd
+from scipy.interpolate import interp1d
 
 from roboskeeter.io import i_o
 
-    
+RAW_COLUMNS = ['x', 'y', 'z']
+
 
 def trim_leading_trailing_NaNs(array, trim='fb'):
     """
@@ -64,177 +73,294 @@ def trim_leading_trailing_NaNs(array, trim='fb'):
     >>> np.trim_NaNs([0, 1, 2, 0])
     [1, 2]
     """
-    filtx = array['x']  # we assume that if there's a NaN  in the x col the
+    filtx = np.asarray(array['x'])  # we assume that if there's a NaN  in the x col the
                     # rest of that row will also be NaNs
+    numbers = np.flatnonzero(~np.isnan(filtx))
     first = 0
     trim = trim.upper()
     if 'F' in trim:
-        for i in filtx:
-            if np.isnan(i) == False:
-                break
-            else:
-                first += 1
+        first = numbers[0] if len(numbers) else len(array)
     last = len(array)
     if 'B' in trim:
-        for i in filtx[::-1]:
-            if np.isnan(i) == False:
-                break
-            else:
-                last -= 1
+        last = numbers[-1] + 1 if len(numbers) else 0
     return array[first:last].reset_index()[['x', 'y', 'z']]
 
 
-def split_trajectories(full_trajectory, NaN_split_thresh=50, min_trajectory_len=20):
+def find_runs(mask):
+    """
+    Run-length encode the runs of True in a boolean array.
+
+    Returns
+    -------
+    starts, lengths
+        int arrays of the first index and the length of every run
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def find_stuck(positions, stuck_thresh=50):
+    """
+    Find where the tracker code got stuck, repeating the same position for stuck_thresh timesteps or more.
+
+    Parameters
+    ----------
+    positions
+        (n, 3) array of x, y, z
+    stuck_thresh
+        repeats of a position in a row that count as the tracker being stuck
+
+    Returns
+    -------
+    stuck
+        boolean array, True at the repeats. The first timestep of a stuck run is kept as a real position
+    """
+    positions = np.asarray(positions)
+    stuck = np.zeros(len(positions), dtype=bool)
+    if len(positions) < 2:
+        return stuck
+
+    repeats = np.zeros(len(positions), dtype=bool)
+    repeats[1:] = np.all(positions[1:] == positions[:-1], axis=1)
+    starts, lengths = find_runs(repeats)
+    for start, length in zip(starts[lengths >= stuck_thresh], lengths[lengths >= stuck_thresh]):
+        stuck[start:start + length] = True
+
+    return stuck
+
+
+def fill_gaps(positions, gaps, kind='cubic'):
+    """
+    Interpolate the positions at the gaps from the other timesteps of the trajectory
+
+    Parameters
+    ----------
+    positions
+        (n, 3) array of x, y, z
+    gaps
+        boolean array, True where the tracker lost the mosquito. The first and last timestep must not be gaps
+    kind
+        interpolation of scipy.interpolate.interp1d. Falls back to 'linear' if there are too few positions for it
+
+    Returns
+    -------
+    filled
+        copy of positions with the gaps interpolated
+    """
+    filled = np.array(positions, dtype=float)
+    timesteps = np.arange(len(filled))
+    known = ~gaps
+    if kind == 'cubic' and known.sum() < 4:
+        kind = 'linear'
+    interpolator = interp1d(timesteps[known], filled[known], kind=kind, axis=0, assume_sorted=True)
+    filled[gaps] = interpolator(timesteps[gaps])
+
+    return filled
+
+
+def split_trajectories(full_trajectory, NaN_split_thresh=50, min_trajectory_len=20, stuck_thresh=50,
+                       interpolation='cubic'):
     """split if we have too many NaNs or if the mosquito is stuck
     If len(NaN segment) >= threshold, split trajectory
     else, use cubic interpolator to estimate values and replace NaNs
-    
-    use pandas.DataFrame.duplicated for stuck bug
-    
-    firstN = 0
-    NaNcount=0
-    in_NaN_runs = False
-    for i, x in enumerate(thing['x']):
-        isnan[i] == True:
-            
-            if 
-            check if last position isnan was True. if so, record last NaN.
-        loop through x until isnan = true. set in_NaN_run=true
-        if in_NaN_run[t-1]=False
-            record where we encounter the first NaN.
-            start NaNcount=1
-        
-        while NaNs, increment NaNcount, in_NaN_run=true
-        if numer:
-            record where we find the lastNaN, end NaNcount, in_NaN_run false
-        if the first counter when we find our first NaN.
+
+    The NaN runs are found with a run-length encoding of the whole trajectory, rather than by walking through it.
+    Leading and trailing NaNs are trimmed, as there is nothing to interpolate them from.
+
+    Parameters
+    ----------
+    full_trajectory
+        df with x, y, z columns, one row per timestep
+    NaN_split_thresh
+        NaN runs at least this long split the trajectory
+    min_trajectory_len
+        trajectories this short or shorter are tossed
+    stuck_thresh
+        (int or None) a position repeated this many times in a row means the tracker got stuck, and the repeats are
+        treated as NaNs. None skips looking for a stuck tracker
+    interpolation
+        kind of scipy.interpolate.interp1d to fill NaN runs shorter than NaN_split_thresh with
+
+    Returns
+    -------
+    split_trajectory_list
+        list of dfs with x, y, z columns, without NaNs
     """
-    xs = full_trajectory['x']  # we assume that if there's a NaN  in the x col 
-                    # the rest of that row will also be NaNs
-    in_NaN_run = False
-    firstN = None
-    lastN = None
-    firstNaN = None
-    lastNaN = None
-    NaNcount = 0
+    positions = np.array(full_trajectory[RAW_COLUMNS].values, dtype=float)
+    if stuck_thresh is not None:
+        positions[find_stuck(positions, stuck_thresh)] = np.nan
+
+    lost = np.isnan(positions).any(axis=1)
+    starts, lengths = find_runs(lost)
+    split = (lengths >= NaN_split_thresh) | (starts == 0) | (starts + lengths == len(lost))
+    trajectory_starts = np.concatenate(([0], starts[split] + lengths[split]))
+    trajectory_stops = np.concatenate((starts[split], [len(lost)]))
+
     split_trajectory_list = []
-    for i, x in enumerate(xs):
-#        print "last N ", lastN
-        # if x is a number
-        if np.isnan(xs[i]) == False:
-            # if starting a new trajectory
-            if firstN is None:  # found our first number
-                firstN = i
-#                print "firstN ",firstN
-            # if continuing a number run
-            if in_NaN_run is False:
-                if i == len(xs)-1:  # loop reached end; grab last trajectory
-                    if lastN is None:
-                        lastN = i
-#                    print "the end!"
-#                    print full_trajectory[firstN:lastN+1]
-                    split_trajectory_list.append(full_trajectory[firstN:lastN+1].reset_index()[['x', 'y', 'z']])
-            # ending a NaN run, starting number run
-            if in_NaN_run is True:
-                lastNaN = i - 1
-                # if splitting trajectory
-                if NaNcount >= NaN_split_thresh:
-                    split_trajectory_list.append(full_trajectory[firstN:lastN+1].reset_index()[['x', 'y', 'z']])                 
-#                    print "new trajectory!"
-                    in_NaN_run = False
-                    firstN = i
-                    lastN = None
-                    firstNaN = None
-                    lastNaN = None
-                    NaNcount = 0
-                else:
-                    # not splitting; resume
-                    lastN = None
-                    firstNaN = None
-                    lastNaN = None
-                    NaNcount = 0
-                    in_NaN_run = False
-        # if x is a NaN
-        else:
-            # ending number run, starting NaN run
-            if in_NaN_run is False:
-                firstNaN = i
-                NaNcount = 1
-                lastN = firstNaN - 1  # exiting number run; storing lastN
-                in_NaN_run = True
-            # if continuing a NaN run
-            if in_NaN_run is True:
-                NaNcount += 1
-        # for debugging
-#        print "NaN_run {} firstN {} lastN {} firstNaN {} lastNaN {} Nancount {}".format(in_NaN_run, firstN, lastN, firstNaN, lastNaN, NaNcount)
-
-    # toss short trajectories
-    split_trajectory_list = [ trajectory for trajectory in split_trajectory_list if len(trajectory) > min_trajectory_len ]
+    for start, stop in zip(trajectory_starts, trajectory_stops):
+        if stop - start <= min_trajectory_len:  # toss short trajectories
+            continue
+        trajectory = positions[start:stop]
+        if lost[start:stop].any():
+            trajectory = fill_gaps(trajectory, lost[start:stop], interpolation)
+        split_trajectory_list.append(pd.DataFrame(trajectory, columns=RAW_COLUMNS))
+
     return split_trajectory_list
 
 
-def get_filepaths():
+def get_directories():
     print("Enter source directory")
     source_dir = i_o.get_directory()
     print("Enters destination directory")
     destination_dir = i_o.get_directory()
 
-    csv_list = i_o.get_csv_name_list(source_dir, relative=False)
+    return source_dir, destination_dir
+
+
+def get_filepaths(source_dir):
+    csv_list = sorted(fname for fname in i_o.get_csv_name_list(source_dir, relative=False) if fname.endswith('.csv'))
     filepaths = i_o.get_csv_filepath_list(source_dir, csv_list)
     print("Found data: {}".format(csv_list))
 
     return filepaths
 
+
 def load_csvs(filepath):
     if type(filepath) == unicode or type(filepath) == str:
-        # load the csv
-        debug = False
-        Data = i_o.load_single_csv_to_df(filepath)
+        # load the raw tracker csv, keeping its NaNs
+        Data = pd.read_csv(filepath, na_values="NaN", names=RAW_COLUMNS, header=None, dtype=np.float64)
     else:  # (for debugging) if script is fed a dataframe instead of a path
-        debug = True
         Data = filepath
     Data.columns = ['x','y','z']
 
     return Data
 
 
-def main(input_df=None):
-    if input_df is None:
-        filepaths = get_filepaths()
-        data_list = [load_csvs(filepath) for filepath in filepaths]
+def process_csv(filepath, destination_dir=None, **kwargs):
+    """
+    Split one raw tracker csv and save its trajectories.
+
+    Parameters
+    ----------
+    filepath
+        raw tracker csv of x, y, z
+    destination_dir
+        see save_processed_csv
+    kwargs
+        passed on to split_trajectories
+
+    Returns
+    -------
+    list of the paths of the processed csvs
+    """
+    trajectory_list = split_trajectories(load_csvs(filepath), **kwargs)
+    return save_processed_csv(trajectory_list, filepath, destination_dir)
+
+
+def process_directory(source_dir, destination_dir, workers=None, **kwargs):
+    """
+    Split every raw tracker csv in source_dir into destination_dir, on a pool of worker processes. Each csv is read,
+    split and written by one worker, so memory use doesn't grow with the size of the recording session.
+
+    Parameters
+    ----------
+    source_dir
+        directory of raw tracker csvs
+    destination_dir
+        directory to save the processed csvs in
+    workers
+        (int or None) processes to use, None uses every cpu
+    kwargs
+        passed on to split_trajectories
+
+    Returns
+    -------
+    dict of raw csv path -> list of the paths of its processed csvs
+    """
+    filepaths = get_filepaths(source_dir)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(min(workers, len(filepaths)), 1)
+
+    tasks = [(filepath, destination_dir, kwargs) for filepath in filepaths]
+    processed = {}
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for filepath, output_paths in pool.imap_unordered(_process_csv_worker, tasks):
+                processed[filepath] = output_paths
+                sys.stdout.write("\rProcessed {}/{} csvs".format(len(processed), len(filepaths)))
+                sys.stdout.flush()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
     else:
-        data_list = []
-        data_list.append(input_df)
-    trimmed_data_list = [trim_leading_trailing_NaNs(data) for data in data_list]
-    ###    sanitychecks(trimmed_Data)
-    # trajectory_list = split_trajectories(trimmed_data_list)
-#
-#
-#     # save
-#     if debug is False:
-#         io.save_processed_csv(trajectory_list, filepath)
-#
-#
-#     return trajectory_list
+        for task in tasks:
+            filepath, output_paths = _process_csv_worker(task)
+            processed[filepath] = output_paths
+            sys.stdout.write("\rProcessed {}/{} csvs".format(len(processed), len(filepaths)))
+            sys.stdout.flush()
+    print
 
+    print "Split {} csvs into {} trajectories".format(len(processed), sum(len(paths) for paths in processed.values()))
+    return processed
 
 
+def _process_csv_worker(task):
+    filepath, destination_dir, kwargs = task
+    return filepath, process_csv(filepath, destination_dir, **kwargs)
 
 
-    # trajectory_list = main(file_path)
+def main(source_dir=None, destination_dir=None, workers=None, **kwargs):
+    """process_directory, asking for the directories if they aren't given"""
+    if source_dir is None or destination_dir is None:
+        source_dir, destination_dir = get_directories()
 
-def save_processed_csv(trajectory_list, filepath):
+    return process_directory(source_dir, destination_dir, workers, **kwargs)
+
+
+def save_processed_csv(trajectory_list, filepath, destination_dir=None):
     """
-    This is an old function I wrote to help process Sharri's flight data. Keeping here just in case.
+    Outputs x,y,z coords at each timestep to a csv file per trajectory, named after the raw csv. Each file is written
+    next to its final location and renamed into place, so an interrupted run never leaves half written csvs.
+
+    Parameters
+    ----------
+    trajectory_list
+        dfs with x, y, z columns
+    filepath
+        the raw csv they were split from
+    destination_dir
+        defaults to Processed/ next to the raw csv
 
-    Outputs x,y,z coords at each timestep to a csv file. These trajectories
-    will still contain short NaN repeats, but Sharri will fix that downstream
-    using her interpolating code. She will also Kalman filter.
+    Returns
+    -------
+    list of the paths of the processed csvs
     """
-    dir = os.path.dirname(filepath)
-    filename, extension = os.path.splitext ( os.path.basename(filepath) )
+    if destination_dir is None:
+        destination_dir = os.path.join(os.path.dirname(filepath), "Processed")
+    if not os.path.isdir(destination_dir):
+        try:
+            os.makedirs(destination_dir)
+        except OSError:  # another worker made it in the meantime
+            if not os.path.isdir(destination_dir):
+                raise
+
+    filename, extension = os.path.splitext(os.path.basename(filepath))
+    file_paths = []
     for i, trajectory in enumerate(trajectory_list):
-        trajectory = trajectory.fillna("NaN")  # hack to turn nan into string
-        # so that the csv doesn't have empty fields
-        file_path = os.path.join(dir, "Processed/", filename + "_SPLIT_" + str(i))
-        trajectory.to_csv(file_path, index=False)
+        file_path = os.path.join(destination_dir, filename + "_SPLIT_" + str(i) + ".csv")
+        fd, tmp_path = tempfile.mkstemp(dir=destination_dir, prefix='.' + os.path.basename(file_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                trajectory.to_csv(f, index=False, na_rep="NaN")
+            os.rename(tmp_path, file_path)
+        except:
+            os.remove(tmp_path)
+            raise
+        file_paths.append(file_path)
+
+    return file_paths
@@ -0,0 +1,110 @@
+"""
+On-disk cache of the reference kinematics Scoring compares simulations to.
+
+Building them means parsing every trajectory csv of the experimental condition(s), running the experiment analysis
+and trimming the endzones, which takes minutes. The trimmed arrays are stored in one .npz file per condition (list),
+next to a manifest of the source csvs' sizes and modification times. The entry is rebuilt whenever a csv is added,
+removed or changed.
+"""
+import hashlib
+import json
+import os
+import string
+import tempfile
+
+import numpy as np
+
+from roboskeeter.io.i_o import get_condition_csv_paths, get_directory
+
+# bump this whenever the analysis the reference arrays come out of changes, to invalidate old entries
+CACHE_VERSION = 1
+MANIFEST_KEY = '__manifest__'
+
+
+def load_reference_kinematics(condition, compute, cache_dir=None):
+    """
+    Parameters
+    ----------
+    condition
+        (str or list) experimental condition(s), e.g. 'Control' or ['Left', 'Right']
+    compute
+        function returning the dict of kinematic -> 1D array to cache, called on a cache miss
+    cache_dir
+        defaults to get_directory('REFERENCE_CACHE')
+
+    Returns
+    -------
+    dict of kinematic -> 1D array
+    """
+    path = _entry_path(condition, cache_dir)
+    manifest = source_manifest(condition)
+
+    kinematics = _read_entry(path, manifest)
+    if kinematics is None:
+        print "Reference kinematics of {} not cached or out of date, computing them".format(condition)
+        kinematics = compute()
+        _write_entry(path, manifest, kinematics)
+    else:
+        print "Loaded reference kinematics of {} from {}".format(condition, path)
+
+    return kinematics
+
+
+def source_manifest(condition):
+    """the cache version and the name, size and mtime of every source csv of the condition(s)"""
+    files = []
+    for file_path in sorted(get_condition_csv_paths(condition)):
+        stat = os.stat(file_path)
+        files.append([file_path, stat.st_size, stat.st_mtime])
+
+    return {'version': CACHE_VERSION, 'files': files}
+
+
+def _entry_path(condition, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = get_directory('REFERENCE_CACHE')
+    if type(condition) is str:
+        condition = [condition]
+    conditions = [string.upper(c) for c in condition]
+
+    digest = hashlib.sha1(json.dumps(conditions)).hexdigest()[:12]
+    return os.path.join(cache_dir, '{}_{}.npz'.format('_'.join(conditions), digest))
+
+
+def _read_entry(path, manifest):
+    """the cached arrays, or None if there is no up to date entry"""
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path) as entry:
+            if json.loads(str(entry[MANIFEST_KEY])) != json.loads(json.dumps(manifest)):
+                return None
+            return {name: entry[name] for name in entry.files if name != MANIFEST_KEY}
+    except (IOError, ValueError, KeyError):  # unreadable entry, treat it as a miss
+        return None
+
+
+def _write_entry(path, manifest, kinematics):
+    """write to a temporary file next to path and rename it into place, so readers never see a partial entry"""
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:  # someone else made it in the meantime
+            if not os.path.isdir(cache_dir):
+                raise
+
+    arrays = {name: np.asarray(values) for name, values in kinematics.iteritems()}
+    arrays[MANIFEST_KEY] = np.array(json.dumps(manifest))
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+    return path
@@ -0,0 +1,302 @@
+"""
+Binary columnar storage of the experimental trajectories of a condition.
+
+Parsing the few hundred trajectory csvs of a condition takes minutes. They are converted once into a directory per
+condition holding one .npy file per column (float32 kinematics, int64 trajectory_num and tsi) and a store.json manifest
+listing the name, size, modification time and number of rows of every source csv. Loads then read only the columns
+they ask for. Whenever csvs are added, removed or changed, only those get parsed (on a process pool) and the rows of
+the others are copied over from the old store.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from roboskeeter.io.i_o import TRAJECTORY_CSV_COLUMNS, get_condition_csv_paths, get_directory, load_single_csv_to_df
+
+STORE_FORMAT_VERSION = 2
+MANIFEST_FNAME = 'store.json'
+INDEX_COLUMNS = ('trajectory_num', 'tsi')
+COLUMNS = tuple(TRAJECTORY_CSV_COLUMNS) + INDEX_COLUMNS
+READ_ATTEMPTS = 20  # times a reader retries while a store is being replaced, see _read_store
+READ_RETRY_DELAY = 0.1  # seconds
+
+
+def get_store_dir(condition, store_root=None):
+    """the store directory of one condition ('Control', 'Left' or 'Right')"""
+    if store_root is None:
+        store_root = get_directory('TRAJECTORY_STORE')
+    return os.path.join(store_root, string.upper(condition))
+
+
+def source_files(condition):
+    """[fname, size, mtime] of every csv of the condition, in loading order"""
+    sources = []
+    for file_path in get_condition_csv_paths(condition):
+        stat = os.stat(file_path)
+        sources.append([os.path.basename(file_path), stat.st_size, stat.st_mtime])
+    return sources
+
+
+def store_is_current(condition, store_root=None):
+    store_dir = get_store_dir(condition, store_root)
+    manifest = _read_manifest(store_dir)
+    if manifest is None:
+        return False
+    return _source_keys(manifest['sources']) == _source_keys(source_files(condition))
+
+
+def load_conditions(conditions, columns=None, store_root=None, workers=None):
+    """
+    load_condition of one or several conditions, concatenated. Same as i_o.experiment_condition_to_DF, except for
+    reading only the requested columns. The csvs of every condition that needs updating are parsed on one pool.
+    """
+    if type(conditions) is str:
+        conditions = [conditions]
+
+    columns = _check_columns(columns)
+    update_stores([condition for condition in conditions if not store_is_current(condition, store_root)],
+                  store_root, workers)
+
+    df_list = []
+    for condition in conditions:
+        print "Loading {} from its trajectory store".format(condition)
+        df_list.append(_read_store(get_store_dir(condition, store_root), columns))
+
+    return pd.concat(df_list)
+
+
+def load_condition(condition, columns=None, store_root=None, workers=None):
+    """
+    Parameters
+    ----------
+    condition
+        'Control', 'Left' or 'Right'
+    columns
+        (list or None) trajectory csv columns to read, None reads all of them. trajectory_num and tsi are always read
+    store_root
+        defaults to get_directory('TRAJECTORY_STORE')
+    workers
+        (int or None) processes to parse csvs on if the store needs updating, None uses every cpu
+
+    Returns
+    -------
+    df
+        same as concatenating i_o.load_single_csv_to_df of every csv of the condition
+    """
+    columns = _check_columns(columns)
+    if not store_is_current(condition, store_root):
+        update_stores([condition], store_root, workers)
+
+    return _read_store(get_store_dir(condition, store_root), columns)
+
+
+def update_stores(conditions, store_root=None, workers=None):
+    """
+    Bring the stores of the conditions up to date with their csvs. Rows of csvs that are unchanged since the last
+    update (same name, size and modification time) are copied over from the old store, only new and changed csvs get
+    parsed, on a pool of worker processes.
+
+    Returns
+    -------
+    list of the store directories
+    """
+    plans = []
+    to_parse = []
+    for condition in conditions:
+        sources = source_files(condition)
+        old_rows = _get_old_rows(get_store_dir(condition, store_root))
+        paths = get_condition_csv_paths(condition)
+        new = [i for i, source in enumerate(sources) if _source_key(source) not in old_rows]
+        print "Trajectory store of {}: {}/{} csvs new or changed".format(condition, len(new), len(sources))
+
+        plans.append((condition, sources, old_rows, {i: len(to_parse) + j for j, i in enumerate(new)}))
+        to_parse.extend(paths[i] for i in new)
+
+    parsed = _parse_csvs(to_parse, workers)
+
+    store_dirs = []
+    for condition, sources, old_rows, parsed_index in plans:
+        chunks = []
+        for i, source in enumerate(sources):
+            if i in parsed_index:
+                chunks.append(parsed[parsed_index[i]])
+            else:
+                chunks.append(old_rows[_source_key(source)])
+        store_dirs.append(_write_store(get_store_dir(condition, store_root), sources, chunks))
+
+    return store_dirs
+
+
+def build_store(condition, store_root=None, workers=None):
+    """
+    Parse every csv of the condition and write its store from scratch.
+
+    Returns
+    -------
+    store_dir
+    """
+    sources = source_files(condition)
+    chunks = _parse_csvs(get_condition_csv_paths(condition), workers)
+    return _write_store(get_store_dir(condition, store_root), sources, chunks)
+
+
+def _check_columns(columns):
+    """the columns to read, see load_condition"""
+    if columns is None:
+        columns = TRAJECTORY_CSV_COLUMNS
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError("unknown trajectory columns {}".format(unknown))
+    return columns
+
+
+def _read_store(store_dir, columns):
+    """
+    The columns of a store as a DataFrame. A writer replacing the store swaps directories with two renames, so for a
+    moment there may be no store, or a reader may get columns of both the old and the new store. The read is retried
+    until the manifest is there and unchanged from before the columns were read to after.
+    """
+    names = [column for column in columns if column not in INDEX_COLUMNS] + list(INDEX_COLUMNS)
+    for _ in range(READ_ATTEMPTS):
+        manifest = _read_manifest(store_dir)
+        if manifest is not None:
+            try:
+                data = {column: np.load(os.path.join(store_dir, column + '.npy')) for column in names}
+            except IOError:  # the store was swapped out while we were reading it
+                data = None
+            if data is not None and _read_manifest(store_dir) == manifest:
+                return pd.DataFrame(data, index=data['tsi'], columns=[column for column in COLUMNS if column in data])
+        time.sleep(READ_RETRY_DELAY)
+
+    raise IOError("could not read trajectory store {}".format(store_dir))
+
+
+def _parse_csvs(paths, workers=None):
+    """the columns of each csv, as dicts of column -> array, parsed on a process pool"""
+    if not paths:
+        return []
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(paths))
+
+    chunks = []
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for chunk in pool.imap(_parse_csv, paths, chunksize=4):
+                chunks.append(chunk)
+                sys.stdout.write("\rParsed {}/{} csvs".format(len(chunks), len(paths)))
+                sys.stdout.flush()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for path in paths:
+            chunks.append(_parse_csv(path))
+            sys.stdout.write("\rParsed {}/{} csvs".format(len(chunks), len(paths)))
+            sys.stdout.flush()
+    print
+
+    return chunks
+
+
+def _parse_csv(path):
+    df = load_single_csv_to_df(path)
+    return {column: np.asarray(df[column].values, dtype=_get_dtype(column)) for column in COLUMNS}
+
+
+def _get_old_rows(store_dir):
+    """(fname, size, mtime) -> columns of that csv, from an existing store"""
+    manifest = _read_manifest(store_dir)
+    if manifest is None:
+        return {}
+
+    columns = {column: np.load(os.path.join(store_dir, column + '.npy'), mmap_mode='r') for column in COLUMNS}
+    old_rows = {}
+    start = 0
+    for source in manifest['sources']:
+        stop = start + source[3]
+        old_rows[_source_key(source)] = {column: np.array(values[start:stop]) for column, values in columns.iteritems()}
+        start = stop
+
+    return old_rows
+
+
+def _write_store(store_dir, sources, chunks):
+    """
+    Write a store from the columns of each source csv. The store is written next to its final location and renamed
+    into place, so it is never seen partially written. An existing store is first renamed out of the way, which
+    leaves a moment without a store, see _read_store.
+    """
+    store_dir = os.path.abspath(store_dir)
+    parent = os.path.dirname(store_dir)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:  # someone else made it in the meantime
+            if not os.path.isdir(parent):
+                raise
+
+    # the manifest records the number of rows of every csv, so unchanged csvs can be copied over in later updates
+    sources = [list(source[:3]) + [len(chunk['tsi'])] for source, chunk in zip(sources, chunks)]
+
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.' + os.path.basename(store_dir), suffix='.tmp')
+    try:
+        for column in COLUMNS:
+            if chunks:
+                values = np.concatenate([chunk[column] for chunk in chunks])
+            else:
+                values = np.empty(0, dtype=_get_dtype(column))
+            np.save(os.path.join(tmp_dir, column + '.npy'), values)
+        with open(os.path.join(tmp_dir, MANIFEST_FNAME), 'w') as f:
+            json.dump({'version': STORE_FORMAT_VERSION, 'n_rows': sum(source[3] for source in sources),
+                       'sources': sources}, f)
+
+        if os.path.exists(store_dir):
+            old_dir = tmp_dir + '.old'
+            os.rename(store_dir, old_dir)
+            os.rename(tmp_dir, store_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.rename(tmp_dir, store_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if _read_manifest(store_dir) is None:  # lost a race against another writer is fine, anything else isn't
+            raise
+
+    return store_dir
+
+
+def _get_dtype(column):
+    return np.int64 if column in INDEX_COLUMNS else np.float32
+
+
+def _source_key(source):
+    """fname, size, mtime of a manifest entry, as they come back from json"""
+    fname, size, mtime = source[:3]
+    return fname, int(size), float(mtime)
+
+
+def _source_keys(sources):
+    return [_source_key(source) for source in sources]
+
+
+def _read_manifest(store_dir):
+    """the manifest of a store, or None if there is no store of the current format"""
+    try:
+        with open(os.path.join(store_dir, MANIFEST_FNAME)) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if manifest.get('version') != STORE_FORMAT_VERSION:
+        return None
+    return manifest
@@ -0,0 +1,122 @@
+"""
+Distributions of the scored kinematics of an ensemble, accumulated while it is being simulated.
+
+Scoring only compares the value distributions of a few kinematics, outside the endzones of the windtunnel. A
+KinematicSummary keeps just those, either as the samples themselves (exact scores) or as counts between fixed bin
+edges (a sketch, whose memory use doesn't grow with the number of trajectories). Scoring accepts a summary wherever
+it accepts an experiment.
+"""
+import numpy as np
+
+# the kinematics Scoring compares
+SCORED_KINEMATICS = ('velocity_x', 'velocity_y', 'velocity_z',
+                     'acceleration_x', 'acceleration_y', 'acceleration_z',
+                     'position_x', 'position_y', 'position_z',
+                     'curvature')
+
+
+class KinematicSummary(object):
+    def __init__(self, sketch_edges=None, endzones=(0.05, 0.95)):
+        """
+        Parameters
+        ----------
+        sketch_edges
+            None keeps every sample. Otherwise a dict of kinematic -> sorted bin edges, and only the number of samples
+            falling between consecutive edges is kept (see Scoring.get_sketch_edges for edges that suit KS scores)
+        endzones
+            (lower, upper) samples are only kept where lower < position_x < upper, like
+            Observations.get_kinematic_dict(trim_endzones=True)
+        """
+        self.endzones = endzones
+        if sketch_edges is None:
+            self.sketch_edges = None
+            self._samples = {kinematic: [] for kinematic in SCORED_KINEMATICS}
+            self._sorted = {}  # sorted samples, built on demand
+        else:
+            self.sketch_edges = {kinematic: np.asarray(sketch_edges[kinematic], dtype=float)
+                                 for kinematic in SCORED_KINEMATICS}
+            # counts[i] is the number of samples in (edges[i - 1], edges[i]], the last bin holds everything above
+            self._counts = {kinematic: np.zeros(len(edges) + 1, dtype=np.int64)
+                            for kinematic, edges in self.sketch_edges.iteritems()}
+        self.n_samples = 0
+
+    @property
+    def is_sketch(self):
+        return self.sketch_edges is not None
+
+    def add(self, kinematics):
+        """
+        Parameters
+        ----------
+        kinematics
+            dict of kinematic -> 1D array, holding every scored kinematic of the same timesteps. Timesteps in the
+            endzones are dropped here.
+        """
+        lower, upper = self.endzones
+        position_x = np.asarray(kinematics['position_x'])
+        keep = (position_x > lower) & (position_x < upper)
+
+        for kinematic in SCORED_KINEMATICS:
+            values = np.asarray(kinematics[kinematic])[keep]
+            if self.is_sketch:
+                bins = np.searchsorted(self.sketch_edges[kinematic], values, side='left')
+                self._counts[kinematic] += np.bincount(bins, minlength=len(self._counts[kinematic]))
+            else:
+                self._samples[kinematic].append(values)
+        self.n_samples += int(keep.sum())
+        if not self.is_sketch:
+            self._sorted.clear()
+
+    def update(self, other):
+        """merge another summary of the same kind into this one, e.g. the summaries of parallel workers"""
+        if self.is_sketch != other.is_sketch:
+            raise ValueError("can't merge a sketch and a sample summary")
+
+        for kinematic in SCORED_KINEMATICS:
+            if self.is_sketch:
+                if not np.array_equal(self.sketch_edges[kinematic], other.sketch_edges[kinematic]):
+                    raise ValueError("sketches of {} have different bin edges".format(kinematic))
+                self._counts[kinematic] += other._counts[kinematic]
+            else:
+                self._samples[kinematic].extend(other._samples[kinematic])
+        self.n_samples += other.n_samples
+        if not self.is_sketch:
+            self._sorted.clear()
+
+        return self
+
+    def get_kinematic_dict(self, trim_endzones=True):
+        """
+        Same as Observations.get_kinematic_dict(trim_endzones=True), except that every array is sorted. Sketches
+        don't keep samples, see ecdf() instead.
+        """
+        if not trim_endzones:
+            raise ValueError("summaries only keep samples outside the endzones")
+        if self.is_sketch:
+            raise ValueError("sketch summaries don't keep samples, use ecdf()")
+
+        return {kinematic: self._get_sorted(kinematic) for kinematic in SCORED_KINEMATICS}
+
+    def ecdf(self, kinematic):
+        """
+        Empirical CDF of a kinematic.
+
+        Returns
+        -------
+        points, cdf
+            sorted values and the fraction of samples <= each of them. For samples that's every sample, for
+            sketches every bin edge
+        """
+        if self.is_sketch:
+            counts = np.cumsum(self._counts[kinematic][:-1])
+            return self.sketch_edges[kinematic], counts / float(max(self.n_samples, 1))
+        else:
+            samples = self._get_sorted(kinematic)
+            return samples, np.searchsorted(samples, samples, side='right') / float(max(len(samples), 1))
+
+    def _get_sorted(self, kinematic):
+        if kinematic not in self._sorted:
+            samples = self._samples[kinematic]
+            self._sorted[kinematic] = np.sort(np.concatenate(samples)) if samples else np.empty(0)
+            self._samples[kinematic] = [self._sorted[kinematic]]  # don't hold on to the unsorted chunks
+        return self._sorted[kinematic]
@@ -0,0 +1,105 @@
+"""
+Exact integration of linearly damped motion under piecewise-constant forcing.
+
+The agent obeys m dv/dt = -b v + F, and F only changes at timestep boundaries. Over one timestep of length dt the
+solution is closed-form (the mean of an Ornstein-Uhlenbeck process):
+
+    v(t + dt) = d v(t) + phi1 a
+    x(t + dt) = x(t) + phi1 v(t) + phi2 a
+
+with lambda = b / m, d = exp(-lambda dt), phi1 = (1 - d) / lambda, phi2 = (dt - phi1) / lambda and a = F / m.
+Unlike explicit Euler this is stable for any lambda * dt, and because the update is linear, k timesteps can be taken
+at once with a (k + 1, k) matrix product instead of a python loop.
+"""
+from __future__ import print_function, division
+
+import numpy as np
+
+__author__ = 'richard'
+
+
+class ExponentialIntegrator(object):
+    def __init__(self, damping_coeff, mass, dt, max_steps=1):
+        """
+        Parameters
+        ----------
+        damping_coeff
+            b, in kg s-1
+        mass
+            m, in kg
+        dt
+            timestep, in s
+        max_steps
+            the most timesteps propagate() will be asked to take at once
+        """
+        self.dt = dt
+        self.max_steps = max_steps
+        self.decay, self.phi1, self.phi2 = exponential_coefficients(damping_coeff / mass, dt)
+
+        # velocity_weights[j, i] is how much the acceleration during step i contributes to the velocity after step j
+        steps = np.arange(max_steps + 1)
+        lags = steps[:, np.newaxis] - 1 - steps[np.newaxis, :max_steps]
+        self.velocity_weights = np.where(lags >= 0, self.phi1 * self.decay ** np.maximum(lags, 0), 0.)
+        self.decay_powers = self.decay ** steps
+
+    def step(self, position, velocity, acceleration):
+        """
+        Advance one timestep. acceleration is the non-damping force divided by the mass.
+
+        Returns
+        -------
+        position, velocity
+            after the step
+        """
+        new_position = position + self.phi1 * velocity + self.phi2 * acceleration
+        new_velocity = self.decay * velocity + self.phi1 * acceleration
+
+        return new_position, new_velocity
+
+    def propagate(self, position, velocity, accelerations):
+        """
+        Advance k timesteps at once.
+
+        Parameters
+        ----------
+        position, velocity
+            (N, 3) arrays, the state before the first step
+        accelerations
+            (N, k, 3) array, the non-damping force divided by the mass during each step
+
+        Returns
+        -------
+        positions, velocities
+            (N, k + 1, 3) arrays. index 0 is the initial state, index j the state after j steps
+        """
+        k = accelerations.shape[1]
+        if k > self.max_steps:
+            raise ValueError("asked for {} steps at once, integrator was set up for {}".format(k, self.max_steps))
+
+        weights = self.velocity_weights[:k + 1, :k]
+        velocities = (self.decay_powers[np.newaxis, :k + 1, np.newaxis] * velocity[:, np.newaxis, :] +
+                      np.einsum('ji,nid->njd', weights, accelerations))
+
+        positions = np.empty_like(velocities)
+        positions[:, 0] = position
+        displacements = self.phi1 * velocities[:, :k] + self.phi2 * accelerations
+        positions[:, 1:] = position[:, np.newaxis, :] + np.cumsum(displacements, axis=1)
+
+        return positions, velocities
+
+
+def exponential_coefficients(damping_rate, dt):
+    """
+    d, phi1, phi2 of the exact update (see the module docstring) for damping rate lambda = b / m. Small lambda * dt
+    uses the series expansions, which also covers undamped motion.
+    """
+    z = damping_rate * dt
+    decay = np.exp(-z)
+    if z < 1e-4:
+        phi1 = dt * (1. - z / 2. + z ** 2 / 6.)
+        phi2 = dt ** 2 * (0.5 - z / 6. + z ** 2 / 24.)
+    else:
+        phi1 = -np.expm1(-z) / damping_rate
+        phi2 = (dt - phi1) / damping_rate
+
+    return decay, phi1, phi2
@@ -0,0 +1,98 @@
+"""
+Constant-time lookups on regular 3D grids, e.g. the interpolated temperature grid of the time-averaged plume.
+
+Since the grid is regular, the cell containing a position can be found with index arithmetic instead of a
+kd-tree query, and values are gathered straight out of the numpy volumes.
+"""
+import numpy as np
+
+__author__ = 'richard'
+
+
+class RegularGridLookup(object):
+    def __init__(self, xi, yi, zi, volumes):
+        """
+        Parameters
+        ----------
+        xi, yi, zi
+            (1D arrays) evenly spaced, increasing grid coordinates along each axis
+        volumes
+            (dict) name -> array with shape (len(xi), len(yi), len(zi)) or (len(xi), len(yi), len(zi), k) for
+            vector-valued volumes such as gradients
+        """
+        self.axes = [np.asarray(xi, dtype=float), np.asarray(yi, dtype=float), np.asarray(zi, dtype=float)]
+        self.shape = np.array([len(axis) for axis in self.axes])
+        self.origin = np.array([axis[0] for axis in self.axes])
+        self.spacing = np.array([axis[1] - axis[0] if len(axis) > 1 else 1. for axis in self.axes])
+        self.strides = np.array([self.shape[1] * self.shape[2], self.shape[2], 1])
+
+        self.volumes = {}
+        for name, volume in volumes.iteritems():
+            volume = np.asanyarray(volume)  # keeps memory-mapped volumes memory-mapped
+            if tuple(volume.shape[:3]) != tuple(self.shape):
+                raise ValueError("volume {} has shape {}, grid has shape {}".format(name, volume.shape, self.shape))
+            # flatten the spatial dimensions so a lookup is a single gather
+            self.volumes[name] = volume.reshape((volume.shape[0] * volume.shape[1] * volume.shape[2],) +
+                                                volume.shape[3:])
+
+    def query(self, positions, name, mode='nearest'):
+        """
+        Parameters
+        ----------
+        positions
+            [x, y, z] or (N, 3) array
+        name
+            which volume to read
+        mode
+            'nearest' (value at the closest grid node) or 'trilinear'
+
+        Returns
+        -------
+        value(s) at the positions. A single position returns a single value (or vector), (N, 3) positions return
+        an array with N rows. Positions outside the grid get the value at the nearest edge of the grid.
+        """
+        positions = np.asarray(positions, dtype=float)
+        single = positions.ndim == 1
+        positions = np.atleast_2d(positions)
+
+        if mode == 'nearest':
+            values = self._nearest(positions, self.volumes[name])
+        elif mode == 'trilinear':
+            values = self._trilinear(positions, self.volumes[name])
+        else:
+            raise ValueError("unknown grid lookup mode {}".format(mode))
+
+        if single:
+            return values[0]
+        return values
+
+    def nearest_indices(self, positions):
+        """(N, 3) positions -> (N, 3) integer indices of the closest grid nodes"""
+        indices = np.rint((positions - self.origin) / self.spacing).astype(int)
+        return np.clip(indices, 0, self.shape - 1)
+
+    def _nearest(self, positions, volume):
+        flat_indices = self.nearest_indices(positions).dot(self.strides)
+        return volume[flat_indices]
+
+    def _trilinear(self, positions, volume):
+        fractional_indices = (positions - self.origin) / self.spacing
+        lower = np.clip(np.floor(fractional_indices).astype(int), 0, np.maximum(self.shape - 2, 0))
+        weights_upper = np.clip(fractional_indices - lower, 0., 1.)
+        weights_lower = 1. - weights_upper
+        upper = np.minimum(lower + 1, self.shape - 1)
+
+        corners = (lower, upper)
+        weights = (weights_lower, weights_upper)
+        values = 0.
+        for cx in (0, 1):
+            for cy in (0, 1):
+                for cz in (0, 1):
+                    flat_indices = corners[cx][:, 0] * self.strides[0] + corners[cy][:, 1] * self.strides[1] + \
+                        corners[cz][:, 2]
+                    weight = weights[cx][:, 0] * weights[cy][:, 1] * weights[cz][:, 2]
+                    if volume.ndim > 1:
+                        weight = weight[:, np.newaxis]
+                    values = values + weight * volume[flat_indices]
+
+        return values
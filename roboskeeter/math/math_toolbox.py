@@ -99,8 +99,13 @@ def calculate_curvature(ensemble):
     velocity_vec = np.vstack((ensemble.velocity_x, ensemble.velocity_y, ensemble.velocity_z))  # shape is (3, R)
     acceleration_vec = np.vstack((ensemble.acceleration_x, ensemble.acceleration_y, ensemble.acceleration_z))
 
-    numerator = np.linalg.norm( np.cross(velocity_vec.T, acceleration_vec.T), axis=1)
-    denominator = np.linalg.norm(acceleration_vec, axis=0)**3
+    return calculate_curvature_from_vectors(velocity_vec.T, acceleration_vec.T)
+
+
+def calculate_curvature_from_vectors(velocities, accelerations):
+    """calculate_curvature for (R, 3) arrays of velocities and accelerations"""
+    numerator = np.linalg.norm(np.cross(velocities, accelerations), axis=1)
+    denominator = np.linalg.norm(accelerations, axis=1)**3
 
     curvature = numerator/denominator
 
@@ -109,18 +114,37 @@ def calculate_curvature(ensemble):
     return curvature
 
 
-def generate_random_unit_vector():
+def generate_random_unit_vector(random_state=np.random):
     """generate randomly pointed (radially-symmetric) 3D unit vectors/ direction vectors
 
+    random_state can be a np.random.RandomState if you need a reproducible stream, otherwise the global numpy RNG
+    is used.
+
     math test
     print "vector lengths", np.sqrt(np.sum([x*x, y*y, z*z], axis=0))
     print "mean", np.mean(np.sum([x*x, y*y, z*z], axis=0))
     print "variance", np.var(np.sum([x*x, y*y, z*z], axis=0))
     """
-    gauss = np.random.normal(size=3)
+    gauss = random_state.normal(size=3)
     unit_vector = gauss / np.linalg.norm(gauss, axis=0)
     return unit_vector
 
+
+def generate_random_unit_vectors(n_vectors, random_state=np.random):
+    """generate n randomly pointed (radially-symmetric) 3D unit vectors at once
+
+    :param n_vectors: number of vectors to draw
+    :param random_state: np.random.RandomState or the global numpy RNG
+    :return: (n_vectors, 3) array of unit vectors
+    """
+    gauss = random_state.normal(size=(n_vectors, 3))
+    return normalize_vectors(gauss)
+
+
+def normalize_vectors(vectors):
+    """scale each row of an (N, 3) array to unit length. Used to turn pre-drawn gaussian triplets into directions."""
+    return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+
 def rads_to_degrees(rads):
     degrees = (rads * 180/np.pi) % 360  # map to [0,360)
     return degrees
@@ -0,0 +1,224 @@
+"""
+Differential evolution with generation-wise ("deferred") updating.
+
+Every candidate of a generation is built before any of them is scored, so a whole generation can be scored at once,
+e.g. on a process pool (see FitBaselineModel). After every generation the population and its scores are appended to a
+history file, one JSON object per line, from which an interrupted run can be resumed.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+__author__ = 'richard'
+
+
+class DifferentialEvolution(object):
+    def __init__(self, bounds, popsize=15, mutation=(0.5, 1.), recombination=0.7, maxiter=100, tol=0.01, atol=0.,
+                 seed=None, history_path=None):
+        """
+        Parameters
+        ----------
+        bounds
+            sequence of (min, max), one per parameter
+        popsize
+            population size is popsize * number of parameters, like scipy.optimize.differential_evolution
+        mutation
+            differential weight, or (min, max) to draw a new one every generation (dithering)
+        recombination
+            crossover probability
+        maxiter
+            maximum number of generations
+        tol, atol
+            stop once std(scores) <= atol + tol * |mean(scores)|
+        seed
+            (int or None) seed of the mutations and crossovers. None picks one, which gets stored in the history so
+            resumed runs continue with the same stream
+        history_path
+            (str or None) file to append every generation to
+        """
+        self.bounds = np.asarray(bounds, dtype=float)
+        if self.bounds.ndim != 2 or self.bounds.shape[1] != 2 or np.any(self.bounds[:, 0] > self.bounds[:, 1]):
+            raise ValueError("bounds must be a sequence of (min, max) pairs")
+        self.n_parameters = len(self.bounds)
+        self.n_population = max(popsize * self.n_parameters, 5)
+
+        self.mutation = mutation
+        self.recombination = recombination
+        self.maxiter = maxiter
+        self.tol = tol
+        self.atol = atol
+        self.seed = np.random.randint(2 ** 31) if seed is None else seed
+        self.history_path = history_path
+
+    def solve(self, evaluate, initial_guess=None, resume=False, callback=None):
+        """
+        Parameters
+        ----------
+        evaluate
+            function mapping an (n, n_parameters) array of candidates to their n scores, lower is better
+        initial_guess
+            (optional) put into the initial population
+        resume
+            continue from the last generation in the history file, if there is one
+        callback
+            (optional) called with (generation, population, scores) after every generation. Returning True stops
+
+        Returns
+        -------
+        scipy.optimize.OptimizeResult with x, fun, nit, nfev, population and population_energies
+        """
+        generation, population, scores = None, None, None
+        if resume:
+            generation, population, scores = self._load_last_generation()
+        if generation is None:
+            self._start_history()
+            generation = 0
+            population = self._initial_population(initial_guess)
+            scores = self._evaluate(evaluate, population)
+            self._log_generation(generation, population, scores)
+        else:
+            print "Resuming differential evolution after generation {}".format(generation)
+        nfev = len(population)
+
+        message = "Maximum number of generations reached"
+        try:
+            while generation < self.maxiter:
+                if self._converged(scores):
+                    message = "Population scores converged"
+                    break
+                generation += 1
+
+                trials = self._make_trials(generation, population, scores)
+                trial_scores = self._evaluate(evaluate, trials)
+                nfev += len(trials)
+
+                improved = trial_scores <= scores
+                population[improved] = trials[improved]
+                scores[improved] = trial_scores[improved]
+                self._log_generation(generation, population, scores)
+
+                if callback is not None and callback(generation, population.copy(), scores.copy()):
+                    message = "Stopped by callback"
+                    break
+        except KeyboardInterrupt:
+            message = "Interrupted after generation {}".format(generation)
+            print "\n {}".format(message)
+
+        best = np.argmin(scores)
+        return OptimizeResult(x=population[best], fun=scores[best], nit=generation, nfev=nfev,
+                              success=message == "Population scores converged", message=message,
+                              population=population, population_energies=scores)
+
+    def _initial_population(self, initial_guess=None):
+        """latin hypercube sample of the bounds"""
+        random_state = np.random.RandomState([self.seed, 0])
+        segments = (np.arange(self.n_population)[:, None] + random_state.uniform(size=(self.n_population,
+                                                                                        self.n_parameters)))
+        unit = segments / self.n_population
+        for j in range(self.n_parameters):
+            unit[:, j] = unit[random_state.permutation(self.n_population), j]
+
+        population = self._scale(unit)
+        if initial_guess is not None:
+            population[0] = np.clip(initial_guess, self.bounds[:, 0], self.bounds[:, 1])
+        return population
+
+    def _make_trials(self, generation, population, scores):
+        """best1bin: mutate the best candidate by the difference of two others, then cross over with each candidate"""
+        # every generation gets its own stream, so resumed runs draw the same trials
+        random_state = np.random.RandomState([self.seed, generation])
+        if np.size(self.mutation) == 2:
+            mutation = random_state.uniform(*self.mutation)
+        else:
+            mutation = self.mutation
+
+        unit = self._unscale(population)
+        best = unit[np.argmin(scores)]
+        trials = np.empty_like(unit)
+        for i in range(self.n_population):
+            others = [j for j in range(self.n_population) if j != i]
+            r1, r2 = random_state.choice(others, 2, replace=False)
+            mutant = best + mutation * (unit[r1] - unit[r2])
+
+            crossover = random_state.uniform(size=self.n_parameters) < self.recombination
+            crossover[random_state.randint(self.n_parameters)] = True  # take at least one parameter from the mutant
+            trials[i] = np.where(crossover, mutant, unit[i])
+
+        # mutants that left the bounds get a random value inside them instead
+        outside = (trials < 0.) | (trials > 1.)
+        trials[outside] = random_state.uniform(size=outside.sum())
+
+        return self._scale(trials)
+
+    def _evaluate(self, evaluate, candidates):
+        scores = np.asarray(evaluate(candidates), dtype=float)
+        if scores.shape != (len(candidates),):
+            raise ValueError("expected {} scores, got shape {}".format(len(candidates), scores.shape))
+        scores[np.isnan(scores)] = np.inf
+        return scores
+
+    def _converged(self, scores):
+        finite = scores[np.isfinite(scores)]
+        if len(finite) < len(scores):
+            return False
+        return np.std(finite) <= self.atol + self.tol * np.abs(np.mean(finite))
+
+    def _scale(self, unit):
+        return self.bounds[:, 0] + unit * (self.bounds[:, 1] - self.bounds[:, 0])
+
+    def _unscale(self, population):
+        span = self.bounds[:, 1] - self.bounds[:, 0]
+        span[span == 0] = 1.
+        return (population - self.bounds[:, 0]) / span
+
+    def _start_history(self):
+        if self.history_path is not None and os.path.exists(self.history_path):
+            os.remove(self.history_path)
+
+    def _log_generation(self, generation, population, scores):
+        best = np.argmin(scores)
+        msg = "generation {}, best guess = {}, best score = {}, mean score = {}".format(
+            generation, population[best], scores[best], np.mean(scores[np.isfinite(scores)]))
+        logging.info(msg)
+        print msg
+
+        if self.history_path is None:
+            return
+        record = {'generation': generation,
+                  'seed': self.seed,
+                  'bounds': self.bounds.tolist(),
+                  'population': population.tolist(),
+                  'scores': [score if np.isfinite(score) else None for score in scores]}
+        with open(self.history_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load_last_generation(self):
+        """generation, population, scores of the last complete line of the history, or Nones if there is none"""
+        if self.history_path is None or not os.path.isfile(self.history_path):
+            return None, None, None
+
+        record, end = None, 0
+        with open(self.history_path, 'r+') as f:
+            for line in iter(f.readline, ''):
+                try:
+                    record = json.loads(line)
+                except ValueError:  # line cut short by a crash
+                    break
+                end = f.tell()
+            f.truncate(end)  # so the next generation doesn't get appended to a partial line
+        if record is None:
+            return None, None, None
+
+        population = np.array(record['population'], dtype=float)
+        if population.shape != (self.n_population, self.n_parameters) or record['bounds'] != self.bounds.tolist():
+            raise ValueError("history in {} is from a run with different bounds or population size".format(
+                self.history_path))
+        scores = np.array([np.inf if score is None else score for score in record['scores']], dtype=float)
+        self.seed = record['seed']
+
+        return record['generation'], population, scores
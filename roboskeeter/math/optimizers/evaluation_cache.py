@@ -0,0 +1,120 @@
+"""
+On-disk store of scored optimizer guesses.
+
+Simulating and scoring one guess takes minutes, and optimizers revisit guesses (basinhopping returns to old minima,
+restarted runs start over). Every score is stored in an sqlite database with the context it was computed in (number of
+trajectories, seeds, fixed simulation settings, score weights), and looked up before simulating. Parameters match
+within a tolerance, since optimizers revisit points up to floating point noise.
+
+sqlite locks the file for each write, so several optimizer runs can share a store.
+"""
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+__author__ = 'richard'
+
+# bump this whenever simulations or scores change in a way the context doesn't capture, to ignore old entries
+CACHE_VERSION = 1
+
+
+class EvaluationCache(object):
+    def __init__(self, path, rtol=1e-9, atol=0., timeout=60.):
+        """
+        Parameters
+        ----------
+        path
+            sqlite file, created if needed
+        rtol, atol
+            a stored guess matches if every parameter is within atol + rtol * |parameter|. Keep these below the
+            finite difference steps of gradient-based minimizers
+        timeout
+            seconds to wait for another writer to release the database
+        """
+        self.path = path
+        self.rtol = rtol
+        self.atol = atol
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS evaluations (
+                                        id INTEGER PRIMARY KEY,
+                                        context TEXT NOT NULL,
+                                        first_parameter REAL NOT NULL,
+                                        parameters TEXT NOT NULL,
+                                        score REAL NOT NULL,
+                                        score_components TEXT NOT NULL,
+                                        created REAL NOT NULL)""")
+            self.connection.execute("""CREATE INDEX IF NOT EXISTS evaluations_lookup
+                                       ON evaluations (context, first_parameter)""")
+
+    def get(self, parameters, context):
+        """
+        Parameters
+        ----------
+        parameters
+            sequence of floats
+        context
+            JSON-serializable description of everything else the score depends on, see make_context
+
+        Returns
+        -------
+        (score, score_components) of the closest stored match, or None
+        """
+        parameters = np.asarray(parameters, dtype=float)
+        tolerance = self.atol + self.rtol * np.abs(parameters)
+
+        rows = self.connection.execute("""SELECT parameters, score, score_components FROM evaluations
+                                          WHERE context = ? AND first_parameter BETWEEN ? AND ?""",
+                                       (self._context_key(context), parameters[0] - tolerance[0],
+                                        parameters[0] + tolerance[0])).fetchall()
+
+        best, best_distance = None, None
+        for stored_parameters, score, score_components in rows:
+            stored_parameters = np.array(json.loads(stored_parameters), dtype=float)
+            if stored_parameters.shape != parameters.shape:
+                continue
+            difference = np.abs(stored_parameters - parameters)
+            if np.all(difference <= tolerance):
+                distance = np.max(difference)
+                if best_distance is None or distance < best_distance:
+                    score_components = {str(kinematic): value
+                                        for kinematic, value in json.loads(score_components).iteritems()}
+                    best, best_distance = (score, score_components), distance
+
+        return best
+
+    def put(self, parameters, context, score, score_components):
+        """store a scored guess"""
+        parameters = [float(parameter) for parameter in parameters]
+        score_components = {kinematic: float(value) for kinematic, value in score_components.iteritems()}
+        with self.connection:  # one transaction, so concurrent writers never see half an entry
+            self.connection.execute("""INSERT INTO evaluations
+                                       (context, first_parameter, parameters, score, score_components, created)
+                                       VALUES (?, ?, ?, ?, ?, ?)""",
+                                    (self._context_key(context), parameters[0], json.dumps(parameters), float(score),
+                                     json.dumps(score_components, sort_keys=True), time.time()))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _context_key(context):
+        return json.dumps({'version': CACHE_VERSION, 'context': context}, sort_keys=True)
+
+
+def make_context(n_trajectories, seeds, agent_kwargs, simulation_conditions, score_weights, reference_condition):
+    """
+    The context a score is stored under. seeds is None for fresh noise at every evaluation, in which case any earlier
+    score of the guess is as good as a new one.
+    """
+    return {'n_trajectories': n_trajectories,
+            'seeds': None if seeds is None else [int(seed) for seed in seeds],
+            'agent_kwargs': agent_kwargs,
+            'simulation_conditions': simulation_conditions,
+            'score_weights': score_weights,
+            'reference_condition': reference_condition}
@@ -0,0 +1,189 @@
+"""
+Brute force grid search that scores grid points in chunks and checkpoints every chunk.
+
+Same grid and output as scipy.optimize.brute(func, ranges, Ns, full_output=True, finish=None), but points are handed to
+an evaluate function a chunk at a time (e.g. to score them on a process pool, see FitBaselineModel), the scores so far
+are written to disk after every chunk, and an interrupted search resumes from there. Optional refinement passes then
+lay finer grids around the best points.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+__author__ = 'richard'
+
+
+class GridSearch(object):
+    def __init__(self, ranges, Ns=20, refinements=0, refine_best=3, refine_Ns=5, chunk_size=20, checkpoint_path=None):
+        """
+        Parameters
+        ----------
+        ranges
+            sequence of (min, max), one per parameter
+        Ns
+            grid points per parameter
+        refinements
+            number of refinement passes after the full grid
+        refine_best
+            points of the previous pass to refine around
+        refine_Ns
+            points per parameter of each refinement grid, which spans one grid step of the previous pass on either
+            side of the point
+        chunk_size
+            points to evaluate between checkpoints
+        checkpoint_path
+            (str or None) .npz file holding the points and scores of every pass
+        """
+        self.ranges = np.asarray(ranges, dtype=float)
+        if self.ranges.ndim != 2 or self.ranges.shape[1] != 2:
+            raise ValueError("ranges must be a sequence of (min, max) pairs")
+        self.n_parameters = len(self.ranges)
+        self.Ns = Ns
+        self.refinements = refinements
+        self.refine_best = refine_best
+        self.refine_Ns = refine_Ns
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+
+        self.passes = []  # (points, scores) of every pass, scores are nan where not evaluated yet
+        self.refinement_steps = []  # the grid step of every pass
+
+    def solve(self, evaluate, resume=False):
+        """
+        Parameters
+        ----------
+        evaluate
+            function mapping an (n, n_parameters) array of points to their n scores, lower is better
+        resume
+            keep the scores in the checkpoint and only evaluate the rest
+
+        Returns
+        -------
+        x0, fval, grid, Jout
+            like scipy.optimize.brute. grid and Jout are those of the full grid, x0 and fval the best point of all
+            passes. The points and scores of the refinement passes are in self.passes
+        """
+        stored = self._load_checkpoint() if resume else []
+        grid = self._get_grid()
+        self.passes = []
+        self.refinement_steps = [(self.ranges[:, 1] - self.ranges[:, 0]) / max(self.Ns - 1, 1)]
+
+        try:
+            for pass_i in range(self.refinements + 1):
+                if pass_i == 0:
+                    points = grid.reshape(self.n_parameters, -1).T
+                else:
+                    points = self._get_refinement_points()
+
+                scores = np.full(len(points), np.nan)
+                if pass_i < len(stored):
+                    stored_points, stored_scores = stored[pass_i]
+                    if stored_points.shape != points.shape or not np.allclose(stored_points, points, rtol=1e-12):
+                        raise ValueError("checkpoint {} is from a different grid".format(self.checkpoint_path))
+                    scores = stored_scores
+                self.passes.append((points, scores))
+
+                self._evaluate_pass(evaluate, pass_i)
+        except KeyboardInterrupt:
+            print "\n Grid search interrupted! Scores so far are in {}".format(self.checkpoint_path)
+
+        return self._get_result(grid)
+
+    def _evaluate_pass(self, evaluate, pass_i):
+        points, scores = self.passes[pass_i]
+        todo = np.flatnonzero(np.isnan(scores))
+        n_done = len(scores) - len(todo)
+        if n_done:
+            print "Pass {}: resuming with {}/{} points scored".format(pass_i, n_done, len(scores))
+
+        for start in range(0, len(todo), self.chunk_size):
+            chunk = todo[start:start + self.chunk_size]
+            chunk_scores = np.asarray(evaluate(points[chunk]), dtype=float)
+            if chunk_scores.shape != (len(chunk),):
+                raise ValueError("expected {} scores, got shape {}".format(len(chunk), chunk_scores.shape))
+            chunk_scores[np.isnan(chunk_scores)] = np.inf  # nan marks points that still need scoring
+            scores[chunk] = chunk_scores
+            self._save_checkpoint()
+
+            print "Pass {}: {}/{} points scored".format(pass_i, n_done + start + len(chunk), len(scores))
+
+    def _get_grid(self):
+        """the grid of scipy.optimize.brute"""
+        slices = [slice(low, high, complex(self.Ns)) for low, high in self.ranges]
+        return np.mgrid[slices]
+
+    def _get_refinement_points(self):
+        """finer grids around the best points of the last pass, without points scored in any pass already"""
+        points, scores = self.passes[-1]
+        step = self.refinement_steps[-1]
+        new_step = 2 * step / max(self.refine_Ns - 1, 1)
+        self.refinement_steps.append(new_step)
+
+        offsets = np.mgrid[[slice(-1., 1., complex(self.refine_Ns))] * self.n_parameters]
+        offsets = offsets.reshape(self.n_parameters, -1).T * step
+
+        best = np.argsort(scores)[:self.refine_best]
+        refined = np.concatenate([points[i] + offsets for i in best])
+        refined = np.clip(refined, self.ranges[:, 0], self.ranges[:, 1])
+
+        # drop points scored already, and duplicates where the grids around neighbouring points overlap
+        tolerance = 1e-6 * new_step
+        seen = list(np.concatenate([pass_points for pass_points, _ in self.passes]))
+        keep = []
+        for i, point in enumerate(refined):
+            if not np.all(np.abs(np.array(seen) - point) <= tolerance, axis=1).any():
+                keep.append(i)
+                seen.append(point)
+
+        return refined[keep]
+
+    def _get_result(self, grid):
+        x0, fval = None, np.inf
+        for points, scores in self.passes:
+            scored = np.flatnonzero(~np.isnan(scores))
+            if len(scored) and scores[scored].min() < fval:
+                best = scored[np.argmin(scores[scored])]
+                x0, fval = points[best], scores[best]
+
+        Jout = self.passes[0][1].reshape(grid.shape[1:])
+        if self.n_parameters == 1:  # scipy.optimize.brute squeezes 1D grids
+            grid = grid[0]
+            if x0 is not None:
+                x0 = x0[0]
+
+        return x0, fval, grid, Jout
+
+    def _load_checkpoint(self):
+        if self.checkpoint_path is None or not os.path.isfile(self.checkpoint_path):
+            return []
+
+        stored = []
+        with np.load(self.checkpoint_path) as checkpoint:
+            if not np.array_equal(checkpoint['ranges'], self.ranges) or int(checkpoint['Ns']) != self.Ns:
+                raise ValueError("checkpoint {} is from a different grid".format(self.checkpoint_path))
+            for pass_i in range(int(checkpoint['n_passes'])):
+                stored.append((checkpoint['points_{}'.format(pass_i)], checkpoint['scores_{}'.format(pass_i)]))
+
+        return stored
+
+    def _save_checkpoint(self):
+        """write to a temporary file next to the checkpoint and rename it into place, so it is never half written"""
+        if self.checkpoint_path is None:
+            return
+
+        arrays = {'ranges': self.ranges, 'Ns': self.Ns, 'n_passes': len(self.passes)}
+        for pass_i, (points, scores) in enumerate(self.passes):
+            arrays['points_{}'.format(pass_i)] = points
+            arrays['scores_{}'.format(pass_i)] = scores
+
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.checkpoint_path),
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.rename(tmp_path, self.checkpoint_path)
+        except:
+            os.remove(tmp_path)
+            raise
@@ -1,11 +1,17 @@
 __author__ = 'richard'
 
 import logging
+import multiprocessing
 from datetime import datetime
 
-from scipy.optimize import minimize_scalar, basinhopping, brute
+import numpy as np
+from scipy.optimize import minimize_scalar, basinhopping
 
 from roboskeeter import experiments
+from roboskeeter.environment import publish_environment, register_environment
+from roboskeeter.math.optimizers.differential_evolution import DifferentialEvolution
+from roboskeeter.math.optimizers.evaluation_cache import EvaluationCache, make_context
+from roboskeeter.math.optimizers.grid_search import GridSearch
 from roboskeeter.math.scoring import scoring
 
 logging.basicConfig(filename='basin_hopping.log', level=logging.DEBUG)
@@ -78,7 +84,30 @@ logging.basicConfig(filename='basin_hopping.log', level=logging.DEBUG)
 
 
 class FitBaselineModel:
-    def __init__(self, initial_guess, n_trajectories = 100, method='basinhopping'):
+    def __init__(self, initial_guess, n_trajectories = 100, method='basinhopping', workers=1, resume=False,
+                 crn_seed=None, n_seed_replicas=1):
+        """
+        Parameters
+        ----------
+        initial_guess
+            ["resitution", "randomF", "damping"]
+        n_trajectories
+            simulated per guess
+        method
+            'basinhopping', 'brute' or 'differential_evolution'
+        workers
+            (int) processes to score the guesses of a differential evolution generation or a brute force chunk on
+        resume
+            (bool) continue differential evolution from the last generation in its history file, or the brute force
+            search from its checkpoint
+        crn_seed
+            (int or None) common random numbers. None simulates every guess with fresh random forces and initial
+            conditions. Otherwise every guess is simulated on the same ones, drawn from streams seeded with crn_seed
+            (see Simulator.fly), so that scores of neighbouring guesses differ by the parameters, not by the noise
+        n_seed_replicas
+            (int) with crn_seed, score every guess on this many noise replicas (seeds crn_seed, crn_seed + 1, ...) and
+            average, so that the fit doesn't adapt to one particular draw
+        """
         print "starting optimization using"
 
         ## optimizer params
@@ -90,6 +119,32 @@ class FitBaselineModel:
         self.niter = 200  # number of basin hopping iterations, default 100
         self.niter_success = 15  # Stop the run if the global minimum candidate remains the same for this number of iterations
 
+        # differential evolution params
+        self.popsize = 10  # guesses per generation = popsize * number of params
+        self.maxiter = 100  # max number of generations
+        self.de_tol = 0.01  # stop once the std of the population's scores is below this fraction of their mean
+        self.de_seed = None
+        self.history_path = 'differential_evolution_history.jsonl'  # one line per generation, to resume from
+        self.workers = workers
+        self.resume = resume
+
+        # brute force params
+        self.Ns = 20  # grid points per param
+        self.refinements = 0  # passes of finer grids around the best points after the full grid
+        self.refine_best = 3  # points to refine around in each pass
+        self.checkpoint_path = 'brute_force_checkpoint.npz'  # scores so far, to resume from
+
+        # common random numbers
+        self.crn_seed = crn_seed
+        self.n_seed_replicas = n_seed_replicas
+        if n_seed_replicas < 1:
+            raise ValueError("n_seed_replicas must be at least 1")
+
+        # scored guesses are stored here and looked up before simulating, see EvaluationCache. None disables it
+        self.cache_path = 'optimizer_evaluations.sqlite'
+        self.cache_rtol = 1e-9  # relative tolerance for matching stored guesses, keep below SLSQP's finite difference steps
+        self._cache = None
+
         # init best guess with very large score
         self.best_guess = None
         self.best_score = 1e10
@@ -133,6 +188,7 @@ class FitBaselineModel:
         T = {T}
         niter = {ni}
         niter_success = {nis}
+        common random numbers seed = {crn} ({nr} replicas)
         ############################################################""".format(
             date=datetime.now(),
             algo=self.method,
@@ -142,12 +198,15 @@ class FitBaselineModel:
             ss = self.stepsize,
             T = self.temperature,
             ni = self.niter,
-            nis = self.niter_success))
+            nis = self.niter_success,
+            crn = self.crn_seed,
+            nr = self.n_seed_replicas))
 
         self.result = self._optimize()
 
     def _optimize(self):
-        f = {'basinhopping':self._optimize_bh, 'brute': self._optimize_brute_force}
+        f = {'basinhopping':self._optimize_bh, 'brute': self._optimize_brute_force,
+             'differential_evolution': self._optimize_de}
         result = f[self.method]()
         return result
 
@@ -177,16 +236,70 @@ class FitBaselineModel:
             return ""
 
     def _optimize_brute_force(self):
-        x0, fval, grid, Jout = brute(
-            self._simulation_wrapper,
-            self.bounds,
-            Ns=20,
-            # args=params,
-            full_output=True,
-            finish=None)
+        """
+        Grid search with the output of scipy.optimize.brute(..., full_output=True, finish=None). Grid points are scored
+        in chunks on a pool of self.workers processes, and the scores are checkpointed after every chunk.
+        """
+        search = GridSearch(self.bounds, Ns=self.Ns, refinements=self.refinements, refine_best=self.refine_best,
+                            chunk_size=max(4 * self.workers, 20), checkpoint_path=self.checkpoint_path)
+        logging.info("brute force: Ns = {}, refinements = {}, workers = {}".format(self.Ns, self.refinements,
+                                                                                    self.workers))
+
+        pool = self._make_pool()
+
+        def evaluate(guesses):
+            return [combined_score for combined_score, _ in self._score_guesses(guesses, pool)]
+
+        try:
+            x0, fval, grid, Jout = search.solve(evaluate, resume=self.resume)
+            if pool is not None:
+                pool.close()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
         return [x0, fval, grid, Jout]
 
+    def _optimize_de(self):
+        """
+        Differential evolution. Every generation's guesses are scored together, on a pool of self.workers processes
+        which get the scorer (and so the reference data) once, when they start.
+        """
+        optimizer = DifferentialEvolution(self.bounds, popsize=self.popsize, maxiter=self.maxiter, tol=self.de_tol,
+                                          seed=self.de_seed, history_path=self.history_path)
+        logging.info("differential evolution: popsize = {}, maxiter = {}, tol = {}, seed = {}, workers = {}".format(
+            self.popsize, self.maxiter, self.de_tol, optimizer.seed, self.workers))
+
+        pool = self._make_pool()
+
+        def evaluate(guesses):
+            return [combined_score for combined_score, _ in self._score_guesses(guesses, pool)]
+
+        try:
+            result = optimizer.solve(evaluate, initial_guess=self.initial_guess, resume=self.resume)
+            if pool is not None:
+                pool.close()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        return result
+
+    def _make_pool(self):
+        """process pool whose workers get the scorer (and so the reference data) and the published environment once,
+        when they start. None for serial scoring"""
+        if self.workers > 1:
+            # the environment only depends on the simulation conditions, which are the same for every guess
+            agent_kwargs, simulation_conditions = _get_simulation_kwargs(np.mean(self.bounds, axis=1))
+            environment = publish_environment(experiments.Experiment(agent_kwargs, simulation_conditions,
+                                                                     shared_environment=True))
+            return multiprocessing.Pool(self.workers, initializer=_init_optimizer_worker,
+                                        initargs=(self.scorer, self.n_trajectories, environment))
+        else:
+            return None
+
     def _simulation_wrapper(self, guess):
         """
         :param bias_scale_GUESS:
@@ -196,38 +309,76 @@ class FitBaselineModel:
             estimated damping was 5e-6, # cranked up to get more noise #5e-6,#1e-6,  # 1e-5
         :return:
         """
+        combined_score, score_components = self._score_guesses([guess])[0]
+
+        return combined_score
+
+    def _score_guesses(self, guesses, pool=None):
+        """
+        Score guesses, looking each one up in the evaluation cache first. The rest are simulated, on the pool if given,
+        and stored.
+
+        Returns
+        -------
+        list of (combined_score, score_components), one per guess
+        """
+        cache = self._get_cache()
+        contexts = [self._get_cache_context(guess) for guess in guesses]
+
+        results = [None] * len(guesses)
+        if cache is not None:
+            for i, (guess, context) in enumerate(zip(guesses, contexts)):
+                results[i] = cache.get(guess, context)
+                if results[i] is not None:
+                    self._record_score(guess, results[i][0], results[i][1], cached=True)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        # without common random numbers every guess gets its own simulation seed, as forked workers would otherwise
+        # share the same random stream
+        jobs = [(guesses[i], self._get_simulation_seeds()) for i in missing]
+        if pool is None:
+            scored = (_score_guess(self.scorer, self.n_trajectories, guess, seeds) for guess, seeds in jobs)
+        else:
+            scored = pool.imap(_optimizer_worker, jobs)
+
+        for i, (combined_score, score_components) in zip(missing, scored):
+            results[i] = (combined_score, score_components)
+            if cache is not None:
+                cache.put(guesses[i], contexts[i], combined_score, score_components)
+            self._record_score(guesses[i], combined_score, score_components)
+
+        return results
+
+    def _get_cache(self):
+        if self._cache is None and self.cache_path is not None:
+            self._cache = EvaluationCache(self.cache_path, rtol=self.cache_rtol)
+        return self._cache
+
+    def _get_cache_context(self, guess):
+        """everything besides the guess its score depends on"""
+        agent_kwargs, simulation_conditions = _get_simulation_kwargs(guess)
+        for kwarg in OPTIMIZED_AGENT_KWARGS:
+            del agent_kwargs[kwarg]
+        if self.crn_seed is None:  # fresh noise, so any earlier score of the guess is as good as a new one
+            seeds = None
+        else:
+            seeds = self._get_simulation_seeds()
+
+        return make_context(self.n_trajectories, seeds, agent_kwargs, simulation_conditions, self.score_weights,
+                            self.scorer.condition)
+
+    def _get_simulation_seeds(self):
+        """the seeds to simulate a guess with, one per noise replica. See crn_seed"""
+        if self.crn_seed is None:
+            return [np.random.randint(2 ** 31)]
+        else:
+            return [self.crn_seed + replica for replica in range(self.n_seed_replicas)]
+
+    def _record_score(self, guess, combined_score, score_components, cached=False):
+        """log a scored guess and keep track of the best one"""
         self.iter_count += 1
 
-        resitution, randomF, damping  = guess
-
-        simulation_conditions = {'condition': 'Control',
-                             'time_max': 6.,
-                             'bounded': True,
-                             'plume_model': "None",
-                             'optimizing': True
-                             }
-
-        agent_kwargs = {'is_simulation': True,
-                        'random_f_strength': resitution,
-                        'stim_f_strength': 0.,
-                        'damping_coeff': damping,
-                        'collision_type': 'part_elastic',
-                        'restitution_coeff': resitution,  # Optimizing this
-                        'stimulus_memory_n_timesteps': 1,
-                        'decision_policy': 'ignore',  # 'surge_only', 'cast_only', 'cast+surge', 'gradient', 'ignore'
-                        'initial_position_selection': 'downwind_high',
-                        'verbose': False,
-                        'optimizing': True
-                        }
-
-        # experiment = experiments.start_simulation(self.n_trajectories, None, None)
-        experiment = experiments.start_simulation(self.n_trajectories, agent_kwargs, simulation_conditions)
-
-        # TODO: we commented out the auto calc score
-        # use our scorer instead
-        combined_score, score_components = self.scorer.calc_score(experiment)
-
-        log_str = "iter {}, guess = {}. total score = {}. score components = {}. time = {}".format(self.iter_count, guess, combined_score, score_components, datetime.now())
+        log_str = "{}iter {}, guess = {}. total score = {}. score components = {}. time = {}".format("(cached) " if cached else "", self.iter_count, guess, combined_score, score_components, datetime.now())
         logging.info(log_str)
         print log_str
 
@@ -237,8 +388,6 @@ class FitBaselineModel:
             hs_announcement = "accepted {} as new best guess!!!!!!!!!!!!!!!!!!!!!".format(guess)
             print(hs_announcement)
             logging.info(hs_announcement)
-
-        return combined_score
     #
     # def _load_reference_ensemble(self):
     #     reference_experiment = experiments.load_experiment(experiment_conditions = {'condition': 'Control',
@@ -252,6 +401,87 @@ class FitBaselineModel:
 
 
 
+# the agent kwargs the optimizer fits, in guess order
+OPTIMIZED_AGENT_KWARGS = ('restitution_coeff', 'random_f_strength', 'damping_coeff')
+
+
+def _get_simulation_kwargs(guess):
+    """
+    Returns
+    -------
+    agent_kwargs, simulation_conditions
+        to simulate a guess with
+    """
+    resitution, randomF, damping  = guess
+
+    simulation_conditions = {'condition': 'Control',
+                         'time_max': 6.,
+                         'bounded': True,
+                         'heat_model_name': "None",
+                         'optimizing': True
+                         }
+
+    agent_kwargs = {'is_simulation': True,
+                    'random_f_strength': randomF,
+                    'stim_f_strength': 0.,
+                    'damping_coeff': damping,
+                    'collision_type': 'part_elastic',
+                    'restitution_coeff': resitution,  # Optimizing this
+                    'stimulus_memory_n_timesteps': 1,
+                    'decision_policy': 'ignore',  # 'surge_only', 'cast_only', 'cast+surge', 'gradient', 'ignore'
+                    'initial_position_selection': 'downwind_high',
+                    'verbose': False,
+                    'optimizing': True,
+                    'simulation_engine': 'batch'
+                    }
+
+    return agent_kwargs, simulation_conditions
+
+
+def _score_guess(scorer, n_trajectories, guess, seeds=(None,)):
+    """ simulate a guess once per seed and score it
+
+    Returns
+    -------
+    combined_score, score_components
+        averaged over the seeds
+    """
+    agent_kwargs, simulation_conditions = _get_simulation_kwargs(guess)
+
+    # experiment = experiments.start_simulation(self.n_trajectories, None, None)
+    replicas = [experiments.start_simulation(n_trajectories, agent_kwargs, simulation_conditions, seed=seed,
+                                             summary_only=True)  # scoring only needs the kinematic distributions
+                for seed in seeds]
+
+    # TODO: we commented out the auto calc score
+    # use our scorer instead
+    results = scorer.calc_scores(replicas)
+    if len(results) == 1:
+        return results[0]
+
+    score_components = {kinematic: np.mean([components[kinematic] for _, components in results])
+                        for kinematic in results[0][1]}
+    return np.mean([combined_score for combined_score, _ in results]), score_components
+
+
+# process pool helpers for FitBaselineModel's process pools. they live at module level so that they can be pickled.
+_worker_scorer = None
+_worker_n_trajectories = None
+
+
+def _init_optimizer_worker(scorer, n_trajectories, environment=None):
+    global _worker_scorer, _worker_n_trajectories
+    _worker_scorer = scorer
+    _worker_n_trajectories = n_trajectories
+    if environment is not None:  # simulations in this worker use the environment published by FitBaselineModel
+        register_environment(environment)
+
+
+def _optimizer_worker(args):
+    guess, seeds = args
+    return _score_guess(_worker_scorer, _worker_n_trajectories, guess, seeds)
+
+
 if __name__ == '__main__':
     initial_guess = [0.1, 6.55599224e-06, 3.63674551e-07]  # ["resitution", "randomF", "damping"]
 
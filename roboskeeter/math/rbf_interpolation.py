@@ -0,0 +1,169 @@
+"""
+Block-wise radial basis function interpolation onto regular 3D grids.
+
+Evaluating a scipy Rbf builds an (n_evaluation_points, n_observations) distance matrix, so evaluating a fine grid in a
+single call runs out of memory. Here the grid is cut into blocks that are evaluated one at a time (optionally on a
+process pool), which bounds memory by the block size.
+
+With n_neighbors set, every block gets its own small Rbf fitted to the observations nearest to it (a local RBF), which
+also makes the fit itself cheap. scipy's Rbf has no polynomial term, so local fits are made to what a least squares
+linear trend of the neighbors doesn't explain, and the trend is added back. Otherwise block nodes near the edge of their
+neighborhood get badly extrapolated values. Local fits can show small seams between blocks, so keep blocks small
+compared to the spacing of the observations.
+"""
+from __future__ import print_function, division
+
+import itertools
+import multiprocessing
+import sys
+
+import numpy as np
+from scipy.interpolate import Rbf
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+__author__ = 'richard'
+
+
+def interpolate_rbf_on_grid(observations, values, xi, yi, zi, function='quintic', smooth=0., epsilon=None,
+                            block_shape=(10, 10, 10), n_neighbors=None, workers=1, verbose=True):
+    """
+    Parameters
+    ----------
+    observations
+        (N, 3) array of positions the values were measured at
+    values
+        (N,) array
+    xi, yi, zi
+        (1D arrays) grid coordinates along each axis
+    function, smooth, epsilon
+        passed to scipy.interpolate.Rbf. function must be the name of one of Rbf's radial functions, callables aren't
+        supported
+    block_shape
+        number of grid nodes per block along each axis. memory use is about
+        prod(block_shape) * (N or n_neighbors) * 8 bytes per worker
+    n_neighbors
+        None fits one Rbf to all observations. An int fits a local Rbf per block, using the n_neighbors observations
+        closest to the block center
+    workers
+        number of processes to evaluate blocks on
+    verbose
+        report progress
+
+    Returns
+    -------
+    grid_values
+        array with shape (len(xi), len(yi), len(zi))
+    """
+    if callable(function):
+        raise ValueError("function must be the name of one of scipy Rbf's radial functions, not a callable")
+
+    observations = np.asarray(observations, dtype=float)
+    values = np.asarray(values, dtype=float)
+    axes = [np.asarray(xi, dtype=float), np.asarray(yi, dtype=float), np.asarray(zi, dtype=float)]
+    grid_values = np.empty([len(axis) for axis in axes])
+
+    blocks = list(_grid_blocks(grid_values.shape, block_shape))
+
+    if n_neighbors is None:
+        rbfi = Rbf(observations[:, 0], observations[:, 1], observations[:, 2], values, function=function,
+                   smooth=smooth, epsilon=epsilon)
+        # ship the fitted model, not the Rbf object (its kernel is a bound method, which doesn't pickle)
+        initargs = ('global', axes, rbfi.xi.T, rbfi.nodes, rbfi.function, rbfi.epsilon, smooth)
+    else:
+        n_neighbors = min(n_neighbors, len(observations))
+        initargs = ('local', axes, observations, values, function, epsilon, smooth, n_neighbors)
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_block_worker, initargs=initargs)
+        try:
+            results = pool.imap_unordered(_interpolate_block, blocks)
+            _collect_blocks(results, grid_values, len(blocks), verbose)
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        _init_block_worker(*initargs)
+        _collect_blocks(itertools.imap(_interpolate_block, blocks), grid_values, len(blocks), verbose)
+
+    return grid_values
+
+
+def _grid_blocks(grid_shape, block_shape):
+    """yields (x slice, y slice, z slice) blocks covering the grid"""
+    ranges = [range(0, n, step) for n, step in zip(grid_shape, block_shape)]
+    for ix, iy, iz in itertools.product(*ranges):
+        yield (slice(ix, min(ix + block_shape[0], grid_shape[0])),
+               slice(iy, min(iy + block_shape[1], grid_shape[1])),
+               slice(iz, min(iz + block_shape[2], grid_shape[2])))
+
+
+def _collect_blocks(results, grid_values, n_blocks, verbose):
+    for i, (block, block_values) in enumerate(results):
+        grid_values[block] = block_values
+        if verbose:
+            sys.stdout.write("\rInterpolated block {}/{}".format(i + 1, n_blocks))
+            sys.stdout.flush()
+    if verbose:
+        print()
+
+
+# state of the process evaluating blocks, set by _init_block_worker()
+_worker_state = {}
+
+
+def _init_block_worker(mode, axes, *model):
+    _worker_state.clear()
+    _worker_state['mode'] = mode
+    _worker_state['axes'] = axes
+
+    if mode == 'global':
+        centers, nodes, function, epsilon, smooth = model
+        _worker_state['centers'] = centers
+        _worker_state['nodes'] = nodes
+        _worker_state['kernel'] = _rbf_kernel(function, epsilon)
+    elif mode == 'local':
+        observations, values, function, epsilon, smooth, n_neighbors = model
+        _worker_state['observations'] = observations
+        _worker_state['values'] = values
+        _worker_state['tree'] = cKDTree(observations)
+        _worker_state['rbf_kwargs'] = {'function': function, 'smooth': smooth, 'epsilon': epsilon}
+        _worker_state['n_neighbors'] = n_neighbors
+    else:
+        raise ValueError("unknown rbf interpolation mode {}".format(mode))
+
+
+def _interpolate_block(block):
+    xi, yi, zi = [axis[s] for axis, s in zip(_worker_state['axes'], block)]
+    grid_x, grid_y, grid_z = np.meshgrid(xi, yi, zi, indexing='ij')
+    points = np.column_stack([grid_x.ravel(), grid_y.ravel(), grid_z.ravel()])
+
+    if _worker_state['mode'] == 'global':
+        kernel = _worker_state['kernel'](cdist(points, _worker_state['centers']))
+        block_values = kernel.dot(_worker_state['nodes'])
+    else:
+        center = points.mean(axis=0)
+        _, neighbors = _worker_state['tree'].query(center, k=_worker_state['n_neighbors'])
+        neighbors = np.atleast_1d(neighbors)
+        local = _worker_state['observations'][neighbors]
+
+        # fit the Rbf to the residuals of the neighbors' linear trend
+        trend = np.column_stack([np.ones(len(local)), local])
+        coefficients = np.linalg.lstsq(trend, _worker_state['values'][neighbors], rcond=None)[0]
+        residuals = _worker_state['values'][neighbors] - trend.dot(coefficients)
+
+        rbfi = Rbf(local[:, 0], local[:, 1], local[:, 2], residuals, **_worker_state['rbf_kwargs'])
+        block_values = rbfi(points[:, 0], points[:, 1], points[:, 2])
+        block_values += np.column_stack([np.ones(len(points)), points]).dot(coefficients)
+
+    return block, block_values.reshape(grid_x.shape)
+
+
+def _rbf_kernel(function, epsilon):
+    """the radial function scipy's Rbf(function=function, epsilon=epsilon) evaluates distances with"""
+    kernel = Rbf.__new__(Rbf)  # only used for its _h_* methods, which just need epsilon
+    kernel.epsilon = epsilon
+    return getattr(kernel, '_h_' + function)
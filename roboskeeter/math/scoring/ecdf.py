@@ -0,0 +1,95 @@
+"""
+Two-sample Kolmogorov-Smirnov statistics against a fixed reference sample.
+
+scipy.stats.ks_2samp sorts both samples and evaluates both empirical CDFs at every point of both samples on each call.
+When one of the samples is always the same experimental reference, it only needs to be sorted once. The statistic then
+only needs the new sample sorted, plus two binary searches of its distinct values in the reference: between two
+consecutive sample values the sample's CDF is flat, so the largest distance to the (monotonic) reference CDF in
+between is reached at one of the two ends.
+"""
+from __future__ import print_function, division
+
+import numpy as np
+from scipy.stats import kstwobign
+
+__author__ = 'richard'
+
+
+class ReferenceECDF(object):
+    def __init__(self, reference):
+        """
+        Parameters
+        ----------
+        reference
+            1D array, the sample every other sample gets compared to
+        """
+        self.values = np.sort(np.asarray(reference, dtype=float))
+        self.n = len(self.values)
+        if self.n == 0:
+            raise ValueError("empty reference sample")
+
+    def cdf(self, points):
+        """fraction of the reference <= each point"""
+        return np.searchsorted(self.values, points, side='right') / self.n
+
+    def ks_statistic(self, sample, assume_sorted=False, return_pvalue=False):
+        """
+        Same statistic (and p-value) as scipy.stats.ks_2samp(sample, reference).
+
+        Parameters
+        ----------
+        sample
+            1D array
+        assume_sorted
+            skip sorting sample, e.g. for KinematicSummary samples
+        return_pvalue
+            also return the asymptotic p-value
+
+        Returns
+        -------
+        d, or (d, pvalue) if return_pvalue
+        """
+        sample = np.asarray(sample, dtype=float)
+        if not assume_sorted:
+            sample = np.sort(sample)
+        n = len(sample)
+        if n == 0:
+            raise ValueError("empty sample")
+
+        # the distinct sample values, and the sample's CDF at each of them
+        last = np.flatnonzero(np.r_[sample[1:] != sample[:-1], True])
+        points = sample[last]
+        sample_cdf = (last + 1) / n
+
+        reference_at = np.searchsorted(self.values, points, side='right') / self.n
+        reference_below = np.searchsorted(self.values, points, side='left') / self.n
+
+        d = max(reference_below[0],  # before the first sample value
+                np.abs(reference_at - sample_cdf).max(),
+                np.abs(reference_below[1:] - sample_cdf[:-1]).max() if len(points) > 1 else 0.)
+
+        if return_pvalue:
+            return d, ks_pvalue(d, n, self.n)
+        else:
+            return d
+
+    def ks_statistics(self, samples, assume_sorted=False, return_pvalues=False):
+        """
+        ks_statistic of several samples, e.g. of a population of candidate simulations.
+
+        Returns
+        -------
+        array of d, or (d array, pvalue array) if return_pvalues
+        """
+        results = [self.ks_statistic(sample, assume_sorted, return_pvalues) for sample in samples]
+        if return_pvalues:
+            d, pvalues = zip(*results) if results else ((), ())
+            return np.array(d), np.array(pvalues)
+        else:
+            return np.array(results)
+
+
+def ks_pvalue(d, n1, n2):
+    """asymptotic two-sample KS p-value, as computed by scipy.stats.ks_2samp"""
+    en = np.sqrt(n1 * n2 / (n1 + n2))
+    return kstwobign.sf((en + 0.12 + 0.11 / en) * d)
@@ -1,16 +1,21 @@
 __author__ = 'richard'
 
-from scipy.stats import ks_2samp
+import numpy as np
 from roboskeeter.experiments import load_experiment
+from roboskeeter.io.reference_cache import load_reference_kinematics
+from roboskeeter.kinematic_summary import KinematicSummary
+from roboskeeter.math.scoring.ecdf import ReferenceECDF, ks_pvalue
 
 
 class Scoring():
     def __init__(self,
                  condition='Control',
                  score_weights=None,
-                 reference_data=None
+                 reference_data=None,
+                 use_reference_cache=True
                  ):
         self.condition = condition
+        self.use_reference_cache = use_reference_cache  # keep the trimmed reference data on disk, see io.reference_cache
         print "Scoring reference ensemble set to {}".format(self.condition)
         if reference_data is None:
             # TODO: when called from an experiment class, find out the relevant experiment from metadata,
@@ -35,24 +40,100 @@ class Scoring():
         else:
             self.score_weights = score_weights
 
-    def calc_score(self, target_experiment):
+        # sort the reference once, every score compares against it
+        self.reference_ecdfs = {kinematic: ReferenceECDF(self.reference_data[kinematic])
+                                for kinematic in self.score_weights}
+
+    def calc_score(self, target_experiment, return_pvalues=False):
         """
         Solves KS-2 sample test for test and reference data, weighted by the score weights kwarg
 
+        Parameters
+        ----------
+        target_experiment
+            experiment, or the KinematicSummary of a simulation (see Simulator.fly_summary). Sketch summaries get the
+            KS statistic evaluated at their bin edges.
+        return_pvalues
+            also return the KS p-value of each kinematic
+
         Returns
         -------
-        total score and score components
+        total score and score components (and a dict of p-values if return_pvalues)
         """
-        target_data = target_experiment.observations.get_kinematic_dict(trim_endzones=True)
+        return self.calc_scores([target_experiment], return_pvalues)[0]
 
-        score_components = dict()
-        for kinematic, kinematic_array in target_data.iteritems():
-            ks_score, pval = ks_2samp(kinematic_array, self.reference_data[kinematic])
-            # cubing scores <1 will make them smaller. +1 makes sure they will increase exponentially
-            score_plus_1_cubed = (ks_score+1)**3
-            score_components[kinematic] = self.score_weights[kinematic] * score_plus_1_cubed
+    def calc_scores(self, target_experiments, return_pvalues=False):
+        """
+        calc_score for several candidates at once, e.g. a population of parameter guesses
 
-        return sum(score_components.values()), score_components
+        Returns
+        -------
+        list of what calc_score returns, one per candidate
+        """
+        targets = [self._get_target_data(target) for target in target_experiments]
+
+        ks_scores = [dict() for _ in targets]
+        pvalues = [dict() for _ in targets]
+        for kinematic, reference_ecdf in self.reference_ecdfs.iteritems():
+            for i, (data, assume_sorted) in enumerate(targets):
+                if isinstance(data, KinematicSummary):  # sketch
+                    edges, target_cdf = data.ecdf(kinematic)
+                    ks_scores[i][kinematic] = np.abs(target_cdf - reference_ecdf.cdf(edges)).max()
+                    if return_pvalues:
+                        pvalues[i][kinematic] = ks_pvalue(ks_scores[i][kinematic], data.n_samples, reference_ecdf.n)
+                else:
+                    result = reference_ecdf.ks_statistic(data[kinematic], assume_sorted, return_pvalues)
+                    if return_pvalues:
+                        ks_scores[i][kinematic], pvalues[i][kinematic] = result
+                    else:
+                        ks_scores[i][kinematic] = result
+
+        results = []
+        for ks_score, pvalue in zip(ks_scores, pvalues):
+            score_components = dict()
+            for kinematic, d in ks_score.iteritems():
+                # cubing scores <1 will make them smaller. +1 makes sure they will increase exponentially
+                score_plus_1_cubed = (d + 1) ** 3
+                score_components[kinematic] = self.score_weights[kinematic] * score_plus_1_cubed
+
+            if return_pvalues:
+                results.append((sum(score_components.values()), score_components, pvalue))
+            else:
+                results.append((sum(score_components.values()), score_components))
+
+        return results
+
+    def _get_target_data(self, target_experiment):
+        """
+        Returns
+        -------
+        data, assume_sorted
+            a dict of kinematic -> samples and whether they are sorted already, or a sketch KinematicSummary
+        """
+        if isinstance(target_experiment, KinematicSummary):
+            summary = target_experiment
+        else:
+            summary = getattr(target_experiment, 'summary', None)
+
+        if summary is None:
+            return target_experiment.observations.get_kinematic_dict(trim_endzones=True), False
+        elif summary.is_sketch:
+            return summary, True
+        else:
+            return summary.get_kinematic_dict(trim_endzones=True), True
+
+    def get_sketch_edges(self, n_bins=1000):
+        """
+        Bin edges for sketch summaries (see KinematicSummary) at quantiles of the reference data. KS statistics of
+        such sketches are off by at most about 1 / n_bins.
+
+        Returns
+        -------
+        dict of kinematic -> sorted edges
+        """
+        quantiles = np.linspace(0., 100., n_bins + 1)
+        return {kinematic: np.unique(np.percentile(self.reference_data[kinematic], quantiles))
+                for kinematic in self.score_weights}
 
     def _load_reference_ensemble(self, condition):
         """
@@ -63,7 +144,13 @@ class Scoring():
 
         Returns
         -------
-
+        dict of kinematic -> trimmed samples
         """
-        reference_experiment = load_experiment([condition])
-        return reference_experiment.observations.get_kinematic_dict(trim_endzones=True)
+        def compute():
+            reference_experiment = load_experiment([condition])
+            return reference_experiment.observations.get_kinematic_dict(trim_endzones=True)
+
+        if self.use_reference_cache:
+            return load_reference_kinematics(condition, compute)
+        else:
+            return compute()
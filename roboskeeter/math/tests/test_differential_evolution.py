@@ -0,0 +1,59 @@
+"""
+Unit tests for the generation-wise differential evolution optimizer.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from roboskeeter.math.optimizers.differential_evolution import DifferentialEvolution
+
+BOUNDS = [(-5., 5.), (0., 1e-4)]
+MINIMUM = np.array([1.5, 3e-5])
+
+
+def _evaluate(guesses):
+    return [np.sum(((guess - MINIMUM) / [1., 1e-4]) ** 2) for guess in guesses]
+
+
+class DifferentialEvolutionTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.history_path = os.path.join(self.tmp_dir, 'history.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_finds_minimum_within_bounds(self):
+        result = DifferentialEvolution(BOUNDS, maxiter=200, tol=1e-8, seed=1).solve(_evaluate)
+        np.testing.assert_allclose(result.x, MINIMUM, rtol=1e-2)
+        bounds = np.array(BOUNDS)
+        self.assertTrue(np.all(result.population >= bounds[:, 0]) and np.all(result.population <= bounds[:, 1]))
+
+    def test_resume_continues_same_run(self):
+        uninterrupted = DifferentialEvolution(BOUNDS, maxiter=6, tol=0., seed=2).solve(_evaluate)
+
+        DifferentialEvolution(BOUNDS, maxiter=3, tol=0., seed=2, history_path=self.history_path).solve(_evaluate)
+        with open(self.history_path, 'a') as f:
+            f.write('{"generation": 4, "popul')  # a crash while writing the next generation
+        resumed = DifferentialEvolution(BOUNDS, maxiter=6, tol=0., history_path=self.history_path).solve(
+            _evaluate, resume=True)
+
+        np.testing.assert_array_equal(resumed.population, uninterrupted.population)
+        self.assertEqual(resumed.nit, 6)
+        with open(self.history_path) as f:
+            self.assertEqual(len(f.readlines()), 7)
+
+    def test_resume_rejects_other_bounds(self):
+        DifferentialEvolution(BOUNDS, maxiter=1, seed=3, history_path=self.history_path).solve(_evaluate)
+        self.assertRaises(ValueError, DifferentialEvolution([(-5., 5.), (0., 1.)], history_path=self.history_path).solve,
+                          _evaluate, resume=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
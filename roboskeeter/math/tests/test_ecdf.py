@@ -0,0 +1,45 @@
+"""
+Unit tests for KS statistics against a sorted reference.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+from scipy.stats import ks_2samp
+
+from roboskeeter.math.scoring.ecdf import ReferenceECDF
+
+
+class ReferenceECDFTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.reference = np.random.normal(size=2000)
+        self.ecdf = ReferenceECDF(self.reference)
+
+    def test_matches_ks_2samp(self):
+        for sample in [np.random.normal(0.1, 1.2, 500), np.random.normal(size=3), np.array([0.5]),
+                       np.random.uniform(-5, 5, 1000), self.reference[::7]]:
+            d, pvalue = self.ecdf.ks_statistic(sample, return_pvalue=True)
+            expected_d, expected_pvalue = ks_2samp(sample, self.reference)
+            self.assertAlmostEqual(d, expected_d, places=12)
+            self.assertAlmostEqual(pvalue, expected_pvalue, places=10)
+
+    def test_ties(self):
+        ecdf = ReferenceECDF(np.round(self.reference, 1))
+        sample = np.round(np.random.normal(0.2, 1., 300), 1)
+        self.assertAlmostEqual(ecdf.ks_statistic(sample), ks_2samp(sample, np.round(self.reference, 1))[0],
+                               places=12)
+
+    def test_several_samples(self):
+        samples = [np.random.normal(mu, 1., 200) for mu in (0., 0.5, 1.)]
+        d = self.ecdf.ks_statistics([np.sort(sample) for sample in samples], assume_sorted=True)
+        np.testing.assert_allclose(d, [ks_2samp(sample, self.reference)[0] for sample in samples], rtol=1e-12)
+
+        d, pvalues = self.ecdf.ks_statistics(samples, return_pvalues=True)
+        self.assertEqual(pvalues.shape, (3,))
+        self.assertTrue(pvalues[0] > pvalues[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
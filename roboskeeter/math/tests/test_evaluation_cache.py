@@ -0,0 +1,65 @@
+"""
+Unit tests for the on-disk store of scored optimizer guesses.
+"""
+from __future__ import print_function, division
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from roboskeeter.math.optimizers.evaluation_cache import EvaluationCache, make_context
+
+CONTEXT = make_context(100, None, {'decision_policy': 'ignore'}, {'condition': 'Control'}, {'curvature': 3}, 'Control')
+GUESS = [0.1, 6.55599224e-06, 3.63674551e-07]
+
+
+def _put_guesses(args):
+    path, first = args
+    cache = EvaluationCache(path)
+    for i in range(first, first + 20):
+        cache.put([float(i), 1e-6], CONTEXT, float(i), {'curvature': float(i)})
+    cache.close()
+
+
+class EvaluationCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'evaluations.sqlite')
+        self.cache = EvaluationCache(self.path, rtol=1e-9)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_match_within_tolerance(self):
+        self.assertIsNone(self.cache.get(GUESS, CONTEXT))
+        self.cache.put(GUESS, CONTEXT, 21.5, {'curvature': 9.})
+
+        score, score_components = self.cache.get([g * (1 + 1e-12) for g in GUESS], CONTEXT)
+        self.assertEqual(score, 21.5)
+        self.assertEqual(score_components, {'curvature': 9.})
+        self.assertIsNone(self.cache.get([GUESS[0] + 1.5e-8] + GUESS[1:], CONTEXT))  # an SLSQP finite difference step
+
+    def test_context_must_match(self):
+        self.cache.put(GUESS, CONTEXT, 21.5, {'curvature': 9.})
+        other = make_context(100, [7], {'decision_policy': 'ignore'}, {'condition': 'Control'}, {'curvature': 3},
+                             'Control')
+        self.assertIsNone(self.cache.get(GUESS, other))
+
+    def test_persists_and_survives_concurrent_writers(self):
+        pool = multiprocessing.Pool(4)
+        pool.map(_put_guesses, [(self.path, first) for first in range(0, 80, 20)])
+        pool.close()
+        pool.join()
+
+        cache = EvaluationCache(self.path)
+        self.assertEqual(len(cache), 80)
+        self.assertEqual(cache.get([42., 1e-6], CONTEXT)[0], 42.)
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
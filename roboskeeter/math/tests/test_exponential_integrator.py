@@ -0,0 +1,59 @@
+"""
+Unit tests for the exact integrator of damped motion.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from roboskeeter.math.exponential_integrator import ExponentialIntegrator
+
+
+class ExponentialIntegratorTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.damping_coeff, self.mass, self.dt = 3.6e-7, 2.88e-6, 0.01
+        self.integrator = ExponentialIntegrator(self.damping_coeff, self.mass, self.dt, max_steps=8)
+
+    def test_step_matches_closed_form(self):
+        v0, a = np.array([0.2, -0.1, 0.05]), np.array([1., 2., -3.])
+        rate = self.damping_coeff / self.mass
+        t = self.dt
+        expected_v = v0 * np.exp(-rate * t) + a / rate * (1 - np.exp(-rate * t))
+        expected_x = v0 / rate * (1 - np.exp(-rate * t)) + a / rate * (t - (1 - np.exp(-rate * t)) / rate)
+
+        x, v = self.integrator.step(np.zeros(3), v0, a)
+        np.testing.assert_allclose(v, expected_v, rtol=1e-10)
+        np.testing.assert_allclose(x, expected_x, rtol=1e-8)
+
+    def test_propagate_matches_repeated_steps(self):
+        position, velocity = np.random.normal(size=(4, 3)), np.random.normal(size=(4, 3))
+        accelerations = np.random.normal(size=(4, 8, 3))
+
+        positions, velocities = self.integrator.propagate(position, velocity, accelerations)
+        x, v = position, velocity
+        for j in range(8):
+            x, v = self.integrator.step(x, v, accelerations[:, j])
+            np.testing.assert_allclose(positions[:, j + 1], x, rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(velocities[:, j + 1], v, rtol=1e-10, atol=1e-12)
+
+    def test_undamped_and_overdamped(self):
+        x, v = ExponentialIntegrator(0., 1., 0.1).step(np.zeros(3), np.ones(3), np.full(3, 2.))
+        np.testing.assert_allclose(v, 1.2)
+        np.testing.assert_allclose(x, 0.1 + 0.01)
+
+        # explicit Euler blows up at this damping, the exact update relaxes to the terminal velocity a / rate
+        stiff = ExponentialIntegrator(1e3, 1., 0.1)
+        x, v = np.zeros(3), np.full(3, 10.)
+        for _ in range(10):
+            x, v = stiff.step(x, v, np.full(3, 5.))
+        np.testing.assert_allclose(v, 5e-3)
+
+    def test_too_many_steps(self):
+        self.assertRaises(ValueError, self.integrator.propagate, np.zeros((1, 3)), np.zeros((1, 3)),
+                          np.zeros((1, 9, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Unit tests for regular grid lookups.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from roboskeeter.math.grid_lookup import RegularGridLookup
+
+
+class RegularGridLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.xi = np.arange(0., 1., 0.05)
+        self.yi = np.arange(-0.127, 0.127, 0.05)
+        self.zi = np.arange(0., 0.254, 0.05)
+        self.grid_x, self.grid_y, self.grid_z = np.meshgrid(self.xi, self.yi, self.zi, indexing='ij')
+        # a linear field, which trilinear interpolation should reproduce exactly
+        self.temp = 19. + 2. * self.grid_x - 3. * self.grid_y + 5. * self.grid_z
+        gradient = np.stack([self.grid_x, self.grid_y ** 2, -self.grid_z], axis=-1)
+        self.lookup = RegularGridLookup(self.xi, self.yi, self.zi, {'temperature': self.temp, 'gradient': gradient})
+
+    def test_nearest_matches_kdtree(self):
+        nodes = np.column_stack([self.grid_x.ravel(), self.grid_y.ravel(), self.grid_z.ravel()])
+        tree = cKDTree(nodes)
+        positions = np.random.uniform([-0.1, -0.2, -0.1], [1.1, 0.2, 0.35], size=(500, 3))
+
+        _, index = tree.query(positions)
+        np.testing.assert_array_equal(self.lookup.query(positions, 'temperature'), self.temp.ravel()[index])
+
+    def test_trilinear_reproduces_linear_field(self):
+        positions = np.random.uniform([self.xi[0], self.yi[0], self.zi[0]],
+                                      [self.xi[-1], self.yi[-1], self.zi[-1]], size=(500, 3))
+        expected = 19. + 2. * positions[:, 0] - 3. * positions[:, 1] + 5. * positions[:, 2]
+        np.testing.assert_array_almost_equal(self.lookup.query(positions, 'temperature', 'trilinear'), expected)
+
+    def test_single_position_and_vector_volume(self):
+        position = [self.xi[3], self.yi[2], self.zi[1]]
+        np.testing.assert_array_almost_equal(self.lookup.query(position, 'gradient'),
+                                             [self.xi[3], self.yi[2] ** 2, -self.zi[1]])
+        self.assertEqual(self.lookup.query(np.array([position] * 4), 'gradient', 'trilinear').shape, (4, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
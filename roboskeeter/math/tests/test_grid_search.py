@@ -0,0 +1,76 @@
+"""
+Unit tests for the checkpointed brute force grid search.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.optimize import brute
+
+from roboskeeter.math.optimizers.grid_search import GridSearch
+
+RANGES = ((0., 0.4), (1e-7, 1e-4), (1e-7, 1e-4))
+MINIMUM = np.array([0.13, 3.3e-5, 7.1e-5])
+
+
+def _objective(guess):
+    return np.sum(((guess - MINIMUM) / [0.4, 1e-4, 1e-4]) ** 2)
+
+
+class GridSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.tmp_dir, 'checkpoint.npz')
+        self.n_evaluated = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _evaluate(self, guesses):
+        self.n_evaluated += len(guesses)
+        return [_objective(guess) for guess in guesses]
+
+    def test_matches_brute(self):
+        expected = brute(_objective, RANGES, Ns=6, full_output=True, finish=None)
+        result = GridSearch(RANGES, Ns=6, chunk_size=50).solve(self._evaluate)
+        for expected_output, output in zip(expected, result):
+            np.testing.assert_allclose(output, expected_output)
+
+    def test_resume_after_interrupt(self):
+        def interrupted(guesses):
+            if self.n_evaluated >= 100:
+                raise KeyboardInterrupt
+            return self._evaluate(guesses)
+
+        x0, fval, grid, Jout = GridSearch(RANGES, Ns=6, chunk_size=50, checkpoint_path=self.checkpoint_path).solve(
+            interrupted)
+        self.assertEqual(np.isnan(Jout).sum(), 6 ** 3 - 100)
+
+        self.n_evaluated = 0
+        resumed = GridSearch(RANGES, Ns=6, chunk_size=50, checkpoint_path=self.checkpoint_path).solve(
+            self._evaluate, resume=True)
+        self.assertEqual(self.n_evaluated, 6 ** 3 - 100)
+        np.testing.assert_allclose(resumed[3], brute(_objective, RANGES, Ns=6, full_output=True, finish=None)[3])
+
+        self.assertRaises(ValueError, GridSearch(RANGES, Ns=7, checkpoint_path=self.checkpoint_path).solve,
+                          self._evaluate, resume=True)
+
+    def test_refinement_improves_best_point(self):
+        coarse = GridSearch(RANGES, Ns=6).solve(self._evaluate)
+        search = GridSearch(RANGES, Ns=6, refinements=2, refine_best=2)
+        refined = search.solve(self._evaluate)
+
+        self.assertTrue(refined[1] < coarse[1])
+        np.testing.assert_array_equal(refined[3], coarse[3])
+        self.assertEqual(len(search.passes), 3)
+        all_points = np.concatenate([points for points, _ in search.passes])
+        self.assertEqual(len(np.unique(all_points.round(15), axis=0)), len(all_points))  # nothing scored twice
+
+
+if __name__ == '__main__':
+    unittest.main()
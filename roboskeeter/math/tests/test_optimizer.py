@@ -0,0 +1,107 @@
+"""
+Unit tests for how FitBaselineModel seeds and scores the simulations of its guesses.
+"""
+from __future__ import print_function, division
+
+import logging
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+_use = matplotlib.use
+matplotlib.use = lambda *args, **kwargs: None  # plotting.plot_environment forces Qt4Agg, which needs a display
+# optimizer logs to basin_hopping.log in the cwd through logging.basicConfig, which does nothing once the root logger
+# has a handler
+_null_handler = logging.NullHandler()
+logging.root.addHandler(_null_handler)
+try:
+    from roboskeeter.math.optimizers import optimizer
+finally:
+    matplotlib.use = _use
+    logging.root.removeHandler(_null_handler)
+
+import numpy as np
+
+GUESS = [0.1, 6.55599224e-06, 3.63674551e-07]
+
+
+class _Replica(object):
+    def __init__(self, guess, seed):
+        self.guess = guess
+        self.seed = seed
+
+
+class _Scorer(object):
+    """scores a simulation by its guess plus noise that depends on its seed"""
+    condition = 'Control'
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def calc_scores(self, replicas):
+        results = []
+        for replica in replicas:
+            score = sum(replica.guess) + np.random.RandomState(replica.seed).uniform()
+            results.append((score, {'velocity_x': score}))
+        return results
+
+
+class FitBaselineModelSeedingTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self._Scoring = optimizer.scoring.Scoring
+        self._start_simulation = optimizer.experiments.start_simulation
+        self._optimize = optimizer.FitBaselineModel.__dict__['_optimize']
+        optimizer.scoring.Scoring = _Scorer
+        optimizer.experiments.start_simulation = self._simulate
+        optimizer.FitBaselineModel._optimize = lambda fit: None  # only score the guesses we hand it
+        self.seeds = []
+
+    def tearDown(self):
+        optimizer.scoring.Scoring = self._Scoring
+        optimizer.experiments.start_simulation = self._start_simulation
+        optimizer.FitBaselineModel._optimize = self._optimize
+
+    def _simulate(self, n_trajectories, agent_kwargs, simulation_conditions, seed=None, summary_only=False):
+        self.seeds.append(seed)
+        guess = [agent_kwargs[kwarg] for kwarg in optimizer.OPTIMIZED_AGENT_KWARGS]
+        return _Replica(guess, seed)
+
+    def _fit(self, **kwargs):
+        fit = optimizer.FitBaselineModel(GUESS, n_trajectories=10, **kwargs)
+        fit.cache_path = None
+        return fit
+
+    def _score(self, fit):
+        return fit._score_guesses([GUESS])[0][0]
+
+    def test_crn_scores_are_repeatable(self):
+        fit = self._fit(crn_seed=5)
+        self.assertEqual(self._score(fit), self._score(fit))
+        self.assertEqual(self.seeds, [5, 5])
+
+        fit = self._fit()
+        self.assertNotEqual(self._score(fit), self._score(fit))
+
+    def test_replicas_are_averaged(self):
+        fit = self._fit(crn_seed=5, n_seed_replicas=3)
+        score = self._score(fit)
+        self.assertEqual(self.seeds, [5, 6, 7])
+        expected = [combined_score for combined_score, _ in _Scorer().calc_scores(
+            [_Replica(GUESS, seed) for seed in [5, 6, 7]])]
+        self.assertAlmostEqual(score, np.mean(expected))
+
+        self.assertRaises(ValueError, self._fit, crn_seed=5, n_seed_replicas=0)
+
+    def test_cache_context_depends_on_crn(self):
+        contexts = [self._fit()._get_cache_context(GUESS), self._fit(crn_seed=5)._get_cache_context(GUESS),
+                    self._fit(crn_seed=6)._get_cache_context(GUESS),
+                    self._fit(crn_seed=5, n_seed_replicas=2)._get_cache_context(GUESS)]
+        for i, context in enumerate(contexts):
+            for other in contexts[i + 1:]:
+                self.assertNotEqual(context, other)
+        self.assertEqual(self._fit()._get_cache_context(GUESS), contexts[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Unit tests for block-wise Rbf interpolation onto regular grids.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+from scipy.interpolate import Rbf
+
+from roboskeeter.math.rbf_interpolation import interpolate_rbf_on_grid
+
+
+def _function(points):
+    return np.sin(3 * points[:, 0]) + np.cos(2 * points[:, 1]) * points[:, 2]
+
+
+class RbfInterpolationTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        random_state = np.random.RandomState(0)
+        self.observations = random_state.uniform(size=(400, 3))
+        self.values = _function(self.observations)
+        self.axes = [np.linspace(0.05, 0.95, 12), np.linspace(0., 1., 9), np.linspace(0.1, 0.9, 7)]
+        self.grid = np.meshgrid(*self.axes, indexing='ij')
+
+    def _interpolate(self, **kwargs):
+        return interpolate_rbf_on_grid(self.observations, self.values, *self.axes, block_shape=(4, 4, 4),
+                                       verbose=False, **kwargs)
+
+    def _rbf(self, function):
+        rbfi = Rbf(self.observations[:, 0], self.observations[:, 1], self.observations[:, 2], self.values,
+                   function=function)
+        return rbfi(*self.grid)
+
+    def test_global_matches_rbf(self):
+        for function in ['quintic', 'thin_plate', 'multiquadric']:
+            expected = self._rbf(function)
+            for workers in [1, 2]:
+                np.testing.assert_allclose(self._interpolate(function=function, workers=workers), expected,
+                                           rtol=0, atol=1e-10)
+
+    def test_local_close_to_function(self):
+        expected = _function(np.column_stack([axis.ravel() for axis in self.grid])).reshape(self.grid[0].shape)
+        for function in ['quintic', 'thin_plate', 'multiquadric']:
+            for n_neighbors in [50, 150]:
+                local = self._interpolate(function=function, n_neighbors=n_neighbors, workers=2)
+                self.assertLess(np.abs(local - expected).max(), 0.1)
+
+    def test_rejects_callable_function(self):
+        self.assertRaises(ValueError, self._interpolate, function=lambda self, r: r)
+
+
+if __name__ == '__main__':
+    unittest.main()
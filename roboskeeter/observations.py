@@ -7,15 +7,30 @@ Created on Tue May  5 21:15:28 2015
 creates a trajectory object that has a bunch of sweet methods.
 """
 
+import os
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 import pandas as pd
-from roboskeeter.io import i_o
+from roboskeeter.io import i_o, trajectory_store
+
+# the columns of the per-trajectory csvs Sharri's pipeline reads
+SHARRI_CSV_COLUMNS = ('position_x', 'position_y', 'position_z', 'in_plume')
 
 
 class Observations(object):
     def __init__(self):
         self.kinematics = pd.DataFrame()
 
+    @property
+    def kinematics(self):
+        return self._kinematics
+
+    @kinematics.setter
+    def kinematics(self, kinematics):
+        self._kinematics = kinematics
+        self._trajectory_index = None  # start/stop rows per trajectory, built on demand. see _get_trajectory_index
+
     def concat_df_list(self, dataframe_list):
         """
         Takes list of pandas dataframes, concatinates them, and runs analysis functions.
@@ -30,56 +45,219 @@ class Observations(object):
         """
         self.kinematics = pd.concat(dataframe_list)
 
-    def dump2csvs(self):
+    def dump2csvs(self, output_dir='.', columns=SHARRI_CSV_COLUMNS, workers=4):
         """we don't use self.observations.to_csv(name) because Sharri likes having separate csvs for each trajectory
 
+        The columns are gathered into one array once, split at the trajectory offsets and written on a pool of writer
+        threads, in the same format np.savetxt writes.
+
+        Parameters
+        ----------
+        output_dir
+            (str) directory to write into, created if needed
+        columns
+            columns to write, in order. Booleans are written as 0/1, categories as their codes
+        workers
+            (int) writer threads
+
         Output
         ------
         Numbered csvs
         """
-        for trajectory_i in self.kinematics.trajectory_num.unique():
-            temp_traj = self.get_trajectory_slice(trajectory_i)
-            temp_array = temp_traj[['position_x', 'position_y', 'position_z', 'in_plume']].values
-            np.savetxt(str(trajectory_i) + ".csv", temp_array, delimiter=",")
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        values = np.column_stack([_get_export_values(self.kinematics[column]).astype(float) for column in columns])
+        line_fmt = ','.join(['%.18e'] * len(columns)) + '\n'
+
+        def write(trajectory):
+            trajectory_num, start, stop = trajectory
+            block = values[start:stop]
+            with open(os.path.join(output_dir, str(trajectory_num) + ".csv"), 'w') as f:
+                f.write((line_fmt * len(block)) % tuple(block.ravel()))
+
+        pool = ThreadPool(workers)
+        try:
+            pool.map(write, zip(*self._get_trajectory_index()))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def export_columnar(self, path, columns=None, compressed=True):
+        """
+        Write the ensemble into a single .npz file: one array per column, plus the trajectory index (the
+        trajectory_nums, starts and stops arrays) so readers can pick out trajectories without scanning. Read it back
+        with import_columnar().
+
+        Parameters
+        ----------
+        path
+            (str) .npz file to write
+        columns
+            columns to write, None writes all of them
+        compressed
+            zip-compress the arrays
+        """
+        if columns is None:
+            columns = list(self.kinematics.columns)
+
+        trajectory_nums, starts, stops = self._get_trajectory_index()
+        arrays = {'trajectory_nums': trajectory_nums, 'starts': starts, 'stops': stops,
+                  'columns': np.array(columns), 'index': self.kinematics.index.values}
+        for column in columns:
+            series = self.kinematics[column]
+            arrays['column_' + column] = _get_export_values(series)
+            if hasattr(series, 'cat'):
+                arrays['categories_' + column] = np.array(series.cat.categories, dtype=str)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if compressed:
+            np.savez_compressed(path, **arrays)
+        else:
+            np.savez(path, **arrays)
+
+    def import_columnar(self, path, index=None):
+        """
+        Load kinematics written by export_columnar()
+
+        Parameters
+        ----------
+        path
+            (str) .npz file
+        index
+            (int, list of ints or None) only load these trajectories, see get_trajectory_slice
+        """
+        with np.load(path) as stored:
+            trajectory_nums, starts, stops = stored['trajectory_nums'], stored['starts'], stored['stops']
+            if index is None:
+                rows = slice(None)
+            else:
+                found = np.flatnonzero(np.in1d(trajectory_nums, np.atleast_1d(index)))
+                rows = _get_rows(starts[found], stops[found])
+
+            data = {}
+            columns = [str(column) for column in stored['columns']]
+            for column in columns:
+                values = stored['column_' + column][rows]
+                if 'categories_' + column in stored.files:
+                    values = pd.Categorical.from_codes(values, list(stored['categories_' + column].astype(str)))
+                data[column] = values
+
+            row_index = stored['index'][rows]
+
+        self.kinematics = pd.DataFrame(data, index=row_index, columns=columns)
 
     def get_trajectory_slice(self, index=None):
         """
-        # TODO: select list of ints
         Parameters
         ----------
         index
-            (int or None)
-            trajectory index you want to select
+            (int, list of ints or None)
+            trajectory index you want to select, several of them, or None for all
 
         Returns
         -------
-        Sliced Pandas df
+        Sliced Pandas df. For a single trajectory that is a view of its rows, found in constant time. Lists of
+        trajectories come in the order they're listed in. Trajectories that don't exist select no rows.
         """
         if index is None:
-            df = self.kinematics
-        if type(index) == int or type(index) == np.int64:
-            df = self.kinematics.loc[self.kinematics.trajectory_num == int(index)]
+            return self.kinematics
+
+        trajectory_nums, starts, stops = self._get_trajectory_index()
+        if isinstance(index, (int, long, np.integer)):
+            i = self._find_trajectories([index])[0]
+            if i < 0:
+                return self.kinematics.iloc[0:0]
+            return self.kinematics.iloc[starts[i]:stops[i]]
+        elif isinstance(index, (list, tuple, np.ndarray)):
+            found = self._find_trajectories(index)
+            found = found[found >= 0]
+            if len(found) == 0:
+                return self.kinematics.iloc[0:0]
+            return self.kinematics.iloc[_get_rows(starts[found], stops[found])]
         else:
-            raise ValueError("index must be int or None, found type {} instead".format(type(index)))
+            raise ValueError("index must be int, list of ints or None, found type {} instead".format(type(index)))
 
-        return df
+    def iter_trajectories(self):
+        """
+        Yields
+        ------
+        trajectory_num, df
+            every trajectory in trajectory number order, df being a view of its rows
+        """
+        trajectory_nums, starts, stops = self._get_trajectory_index()
+        for trajectory_num, start, stop in zip(trajectory_nums, starts, stops):
+            yield trajectory_num, self.kinematics.iloc[start:stop]
 
     def get_trajectory_numbers(self):
-        return np.sort(self.kinematics.trajectory_num.unique())
+        return self._get_trajectory_index()[0]
+
+    def _get_trajectory_index(self):
+        """
+        Sorted trajectory numbers and the [start, stop) rows of each in self.kinematics. Simulations and experiments
+        store every trajectory's rows contiguously; if that's not the case, the rows get stably sorted by trajectory
+        number first. Built once per kinematics dataframe.
+
+        Returns
+        -------
+        trajectory_nums, starts, stops
+        """
+        if self._trajectory_index is None:
+            if 'trajectory_num' not in self.kinematics:
+                self._trajectory_index = (np.empty(0, dtype=int),) * 3
+                return self._trajectory_index
+
+            trajectory_num = self.kinematics['trajectory_num'].values
+            run_starts = _get_run_starts(trajectory_num)
+            if len(np.unique(trajectory_num[run_starts])) < len(run_starts):  # some trajectory isn't contiguous
+                order = np.argsort(trajectory_num, kind='mergesort')
+                self._kinematics = self.kinematics.iloc[order]
+                trajectory_num = trajectory_num[order]
+                run_starts = _get_run_starts(trajectory_num)
+
+            run_stops = np.r_[run_starts[1:], len(trajectory_num)]
+            order = np.argsort(trajectory_num[run_starts], kind='mergesort')
+            self._trajectory_index = (trajectory_num[run_starts][order], run_starts[order], run_stops[order])
+
+        return self._trajectory_index
+
+    def _find_trajectories(self, indices):
+        """positions of trajectory numbers in the trajectory index, -1 for ones that don't exist"""
+        trajectory_nums = self._get_trajectory_index()[0]
+        indices = np.asarray(indices)
+        if len(trajectory_nums) == 0:
+            return np.full(len(indices), -1, dtype=int)
+
+        found = np.searchsorted(trajectory_nums, indices).clip(0, len(trajectory_nums) - 1)
+        return np.where(trajectory_nums[found] == indices, found, -1)
 
-    def experiment_data_to_DF(self, experimental_condition):
+    def experiment_data_to_DF(self, experimental_condition, columns=None, use_store=True):
         """
         for loading experimental data to df
         Parameters
         ----------
         experimental_condition
+        columns
+            (list or None) the csv columns to load (see i_o.TRAJECTORY_CSV_COLUMNS), None loads all of them
+        use_store
+            load from the binary trajectory store of each condition, converting the csvs first if needed (see
+            io.trajectory_store). Otherwise parse every csv
 
         Returns
         -------
 
         """
         try:
-            df = i_o.experiment_condition_to_DF(experimental_condition)
+            if use_store:
+                df = trajectory_store.load_conditions(experimental_condition, columns)
+            else:
+                df = i_o.experiment_condition_to_DF(experimental_condition)
+                if columns is not None:
+                    df = df[[column for column in df.columns if column in columns or
+                             column in trajectory_store.INDEX_COLUMNS]]
             self.kinematics = df
         except TypeError:
             raise AssertionError('Input experimental condition should be string, instead got {}. printed: {}'.format(
@@ -117,6 +295,26 @@ class Observations(object):
         return positions_at_timestep_0
 
 
+def _get_export_values(series):
+    """the values of a column as a plain numpy array. Categories are exported as their codes"""
+    if hasattr(series, 'cat'):
+        return series.cat.codes.values
+    return series.values
+
+
+def _get_rows(starts, stops):
+    """row positions of every [start, stop) range, back to back"""
+    lengths = stops - starts
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+
+
+def _get_run_starts(values):
+    """positions where a run of equal values starts"""
+    if len(values) == 0:
+        return np.empty(0, dtype=int)
+    return np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+
+
 """
 the following is the code I used to fit the intiial velocity using the control experimental flight data
 
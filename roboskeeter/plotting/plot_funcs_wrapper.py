@@ -114,10 +114,8 @@ class PlotFuncsWrapper:
             plot_environment.plot_windtunnel.draw_plume(self.experiment.plume, ax=ax)
 
         if trajectory_i is "ALL":
-            index = self.observations.get_trajectory_numbers()
             ax.axis('off')
-            for i in index:
-                selected_trajectory_df = self.observations.get_trajectory_slice(i)
+            for i, selected_trajectory_df in self.observations.iter_trajectories():
                 plot_kwargs = {'title': "{type} trajectory #{N}".format(type=self.trajectory_type, N=i),
                                'highlight_inside_plume': highlight_inside_plume}
                 ax = plot_environment.draw_trajectory(ax, selected_trajectory_df)
@@ -8,21 +8,33 @@ TODO: implemement unit tests with nose
 """
 
 import sys
+import multiprocessing
 import numpy as np
 import pandas as pd
 from flight import Flight
-from decisions import Decisions
+from decisions import Decisions, EnsembleDecisions, DECISIONS, PLUME_SIGNALS, GRADIENT
+from ensemble_buffer import EnsembleBuffer
+from kinematic_summary import KinematicSummary, SCORED_KINEMATICS
 from observations import Observations
-from random import choice as choose
-from roboskeeter.math.math_toolbox import generate_random_unit_vector
+from roboskeeter.math.math_toolbox import generate_random_unit_vector, generate_random_unit_vectors, \
+    calculate_curvature_from_vectors
+from roboskeeter.math.exponential_integrator import ExponentialIntegrator
 
-class Simulator:
+class Simulator(object):
     """Our simulated mosquito.
     """
 
     def __init__(self, experiment, agent_kwargs):
         """ Load params
         """
+        # defaults for optional kwargs
+        self.simulation_engine = 'scalar'  # 'scalar': one trajectory at a time, 'batch': whole ensemble at once
+        self.integrator = 'euler'  # 'euler': explicit Euler, 'exponential': exact update, see ExponentialIntegrator
+        # timestep the plume, the decisions and the stimulus forces are updated at. None means every dt. Otherwise a
+        # multiple of dt, which needs the exponential integrator. The output is still sampled every dt
+        self.internal_dt = None
+        self.summary_chunk_size = 500  # trajectories fly_summary simulates at once, bounds its memory use
+
         # dump kwarg dictionary into the agent object
         for key, value in agent_kwargs.iteritems():
             setattr(self, key, value)
@@ -48,7 +60,6 @@ class Simulator:
         self.windtunnel = self.experiment.environment.windtunnel
         self.bounded = self.experiment.experiment_conditions['bounded']
         self.boundary = self.windtunnel.boundary
-        self.heat = self.experiment.environment.heat
 
         # useful lists TODO: get rid of?
         self.kinematics_list = ['position', 'velocity', 'acceleration']  # curvature?
@@ -67,39 +78,158 @@ class Simulator:
         # # create repulsion landscape
         # self._repulsion_funcs = repulsion_landscape3D.landscape(boundary=self.boundary)
 
-    def fly(self, n_trajectories=1):
-        """ runs _generate_flight n_trajectories times
+    @property
+    def heat(self):
+        """the environment's heat model, which the environment only loads once we first need it"""
+        return self.experiment.environment.heat
+
+    def fly(self, n_trajectories=1, workers=1, seed=None):
+        """ runs _generate_flight n_trajectories times, or _generate_ensemble once if simulation_engine is 'batch'
+
+        Parameters
+        ----------
+        n_trajectories
+            (int) number of flights to simulate
+        workers
+            (int) number of processes to shard the trajectories across
+        seed
+            (int or None) if given, trajectory i draws all of its random numbers from its own stream seeded with
+            (seed, i), so the ensemble is identical no matter how many workers generate it. If None, the global numpy
+            RNG is used.
+
+        Returns
+        -------
+        Observations object
         """
-        df_list = []
-        traj_i = 0
+        if self.verbose:
+            print """Starting simulations with {} heat model and {} decision policy.
+            If you run out of patience, press <CTL>-C to stop generating simulations and
+            cut to the chase scene.""".format(
+            self.experiment.environment.heat_model_name, self.decision_policy)
+
+        trajectory_nums = np.arange(n_trajectories)
+        if workers > 1:
+            df_list = self._fly_parallel(trajectory_nums, workers, seed)
+            kinematics = df_list[0] if len(df_list) == 1 else pd.concat(df_list, ignore_index=True)
+        else:
+            kinematics = self._fly_shard(trajectory_nums, seed)
+
+        observations = Observations()
+        observations.kinematics = kinematics
+
+        return observations
+
+    def fly_summary(self, n_trajectories=1, workers=1, seed=None, sketch_edges=None):
+        """ like fly, but only keeps the distributions of the scored kinematics outside the endzones. Trajectories are
+        simulated summary_chunk_size at a time and summarized right away, so no dataframe is ever built.
+
+        Parameters
+        ----------
+        n_trajectories, workers, seed
+            see fly
+        sketch_edges
+            see KinematicSummary. None keeps the samples themselves
+
+        Returns
+        -------
+        KinematicSummary, which Scoring.calc_score accepts
+        """
+        trajectory_nums = np.arange(n_trajectories)
+        if workers > 1:
+            summary = KinematicSummary(sketch_edges)
+            for shard_summary in self._fly_parallel(trajectory_nums, workers, seed, sketch_edges, summarize=True):
+                summary.update(shard_summary)
+        else:
+            summary = self._fly_shard_summary(trajectory_nums, seed, sketch_edges)
+
+        return summary
+
+    def _fly_shard(self, trajectory_nums, seed=None):
+        """ simulate the given trajectory numbers with the selected engine, returns a dataframe
+        """
+        return self._fly_shard_buffer(trajectory_nums, seed).to_dataframe(trajectory_nums, self._get_times())
+
+    def _fly_shard_summary(self, trajectory_nums, seed=None, sketch_edges=None):
+        """ simulate the given trajectory numbers in chunks, returns a KinematicSummary of all of them
+        """
+        summary = KinematicSummary(sketch_edges)
+        n_chunks = int(np.ceil(len(trajectory_nums) / float(self.summary_chunk_size)))
+        for chunk in np.array_split(trajectory_nums, max(n_chunks, 1)):
+            buffer = self._fly_shard_buffer(chunk, seed)
+            velocities = np.column_stack([buffer.column('velocity_' + dim) for dim in 'xyz'])
+            accelerations = np.column_stack([buffer.column('acceleration_' + dim) for dim in 'xyz'])
+
+            kinematics = {kinematic: buffer.column(kinematic) for kinematic in SCORED_KINEMATICS
+                          if kinematic != 'curvature'}
+            kinematics['curvature'] = calculate_curvature_from_vectors(velocities, accelerations)
+            summary.add(kinematics)
+
+        return summary
+
+    def _fly_shard_buffer(self, trajectory_nums, seed=None):
+        """ simulate the given trajectory numbers with the selected engine, returns the compacted EnsembleBuffer
+        """
+        if self.simulation_engine == 'scalar':
+            return self._fly_scalar(trajectory_nums, seed)
+        elif self.simulation_engine == 'batch':
+            return self._generate_ensemble(trajectory_nums, seed)
+        else:
+            raise ValueError("unknown simulation engine {}".format(self.simulation_engine))
+
+    def _fly_parallel(self, trajectory_nums, workers, seed=None, sketch_edges=None, summarize=False):
+        """ split the trajectory numbers into shards and fly them on a process pool. returns list of dataframes (one per
+        shard), in trajectory number order. If summarize, returns a list of KinematicSummary instead, see fly_summary
+        """
+        if seed is None:
+            # every forked worker would start from a copy of the same global RNG state
+            seed = np.random.randint(2 ** 31)
+            print "\nNo seed given for parallel simulations, using seed {}".format(seed)
+
+        shards = [shard for shard in np.array_split(trajectory_nums, workers) if len(shard)]
+
+        # load the heat model once here, not in every worker, and put its grids in shared memory so the workers don't
+        # each end up with a copy
+        self.heat.publish()
+
+        results = []
+        pool = multiprocessing.Pool(workers, initializer=_init_fly_worker, initargs=(self,))
         try:
-            if self.verbose:
-                print """Starting simulations with {} heat model and {} decision policy.
-                If you run out of patience, press <CTL>-C to stop generating simulations and
-                cut to the chase scene.""".format(
-                self.heat.heat_model_name, self.decision_policy)
+            for result in pool.imap(_fly_worker, [(shard, seed, sketch_edges, summarize) for shard in shards]):
+                results.append(result)
+                if self.verbose:
+                    sys.stdout.write("\rShards finished {}/{}".format(len(results), len(shards)))
+                    sys.stdout.flush()
+            pool.close()
+        except KeyboardInterrupt:
+            print "\n Simulations interrupted after {} shards. Moving along...".format(len(results))
+            pool.terminate()
+        finally:
+            pool.join()
+
+        return results
 
+    def _fly_scalar(self, trajectory_nums, seed=None):
+        """ runs _generate_flight for each trajectory number, writing into one EnsembleBuffer. returns the compacted
+        buffer
+        """
+        n_trajectories = len(trajectory_nums)
+        buffer = self._make_ensemble_buffer(n_trajectories)
+        traj_i = 0
+        try:
             while traj_i < n_trajectories:
                 # print updates
                 if self.verbose:
                     sys.stdout.write("\rTrajectory {}/{}".format(traj_i + 1, n_trajectories))
                     sys.stdout.flush()
 
-                array_dict = self._generate_flight()
+                trajectory_num = trajectory_nums[traj_i]
+                length = self._generate_flight(buffer.trajectory(traj_i), self._get_random_stream(seed, trajectory_num))
+                buffer.land(traj_i, length)
 
-                # if len(array_dict['velocity_x']) < 5:  # hack to catch when optimizer makes trajectories explode
+                # if length < 5:  # hack to catch when optimizer makes trajectories explode
                 #     print "catching explosion"
                 #     break
 
-                # add label column to enumerate the trajectories
-                array_len = len(array_dict['tsi'])
-                array_dict['trajectory_num'] = [traj_i] * array_len
-
-                # mk df, add to list of dfs
-                df = pd.DataFrame(array_dict)
-                # df = df.set_index(['trajectory_num'])
-                df_list.append(df)
-
                 traj_i += 1
 
                 if traj_i == n_trajectories:
@@ -111,19 +241,51 @@ class Simulator:
             print "\n Simulations interrupted at iteration {}. Moving along...".format(traj_i)
             pass
 
-        observations = Observations()
-        observations.kinematics = pd.concat(df_list)  # concatenate all the data frames at once for performance boost.
+        buffer.compact(n_trajectories=traj_i)  # drop the interrupted trajectory and the ones we never got to
+        return buffer
 
-        return observations
+    def _make_ensemble_buffer(self, n_trajectories):
+        # looked up plume gradients go in their own single precision columns, decisions and signals are int coded
+        return EnsembleBuffer(n_trajectories, self.max_bins, self.kinematics_list + self.forces_list,
+                              float32_vector_names=['gradient'],
+                              categories={'decision': DECISIONS, 'heat_signal': PLUME_SIGNALS})
 
-    def _generate_flight(self):
+    def _get_times(self):
+        return np.linspace(0, self.time_max, self.max_bins)
+
+    def _get_random_stream(self, seed, trajectory_num):
+        """the random number generator trajectory number trajectory_num draws from.
+
+        if seed is None, that's the global numpy RNG, otherwise it's an independent stream derived from
+        (seed, trajectory_num)
+        """
+        if seed is None:
+            return np.random
+        else:
+            return np.random.RandomState([seed, trajectory_num])
+
+    def _generate_flight(self, vector_dict, random_state=np.random):
         """Generate a single trajectory using our model.
-    
-        First put everything into np arrays stored inside of a dictionary
+
+        vector_dict holds (max_bins, ...) arrays to write the trajectory into, see EnsembleBuffer.trajectory()
+        random_state is the RNG this trajectory draws from, see _get_random_stream
+
+        Returns
+        -------
+        length
+            number of timesteps to keep, see _land
         """
+        if self.integrator == 'exponential':
+            return self._generate_flight_exponential(vector_dict, random_state)
+        elif self.integrator != 'euler':
+            raise ValueError("unknown integrator {}".format(self.integrator))
+        self._get_internal_steps()  # check internal_dt
+
         dt = self.dt
         m = self.mass
-        vector_dict = self._initialize_vector_dict()
+
+        # every mosquito starts without any memory of the plume
+        self.decisions = Decisions(self.decision_policy, self._get_decision_memory())
 
         # # dynamically create easy-to-read aliases for the contents of vector_dict
         # for key, value in vector_dict.iteritems():
@@ -138,26 +300,31 @@ class Simulator:
         stim_f = vector_dict['stim_f']
         total_f = vector_dict['total_f']
         decision = vector_dict['decision']
+        gradient = vector_dict['gradient']
 
-        position[0] = self._set_init_position()
-        velocity[0] = self._set_init_velocity()
+        position[0] = self._set_init_position(random_state)
+        velocity[0] = self._set_init_velocity(random_state)
 
-        for tsi in vector_dict['tsi']:
+        for tsi in xrange(self.max_bins):
             in_plume[tsi] = self.heat.check_in_plume_bounds(position[tsi])  # returns False for non-Bool plume
 
             decision[tsi], heat_signal[tsi] = self.decisions.make_decision(in_plume[tsi], velocity[tsi][1])
 
-            if heat_signal[tsi] == 'X':  # this is an awful hack telling us to look up the gradient
-                heat_signal[tsi] = self.heat.get_nearest_gradient(position[tsi])
+            if heat_signal[tsi] == GRADIENT:
+                # forces use the full precision gradient, the output column is single precision
+                plume_gradient = self.heat.get_nearest_gradient(position[tsi])
+                gradient[tsi] = plume_gradient
+            else:
+                plume_gradient = None
 
-            stim_f[tsi], random_f[tsi], total_f[tsi] = self.flight.calc_forces(velocity[tsi], decision[tsi], heat_signal[tsi])
+            stim_f[tsi], random_f[tsi], total_f[tsi] = self.flight.calc_forces(velocity[tsi], decision[tsi],
+                                                                               plume_gradient, random_state)
 
             # calculate current acceleration
             acceleration[tsi] = total_f[tsi] / m
 
             # check if time is out, end loop before we solve for future velo, position
             if tsi == self.max_bins-1: # -1 because of how range() works
-                vector_dict = self._land(tsi, vector_dict)
                 break
 
             ################################################
@@ -180,23 +347,357 @@ class Simulator:
             position[tsi + 1] = candidate_pos
             velocity[tsi + 1] = candidate_velo
 
-        # once flight is finished, make dictionary ready to be loaded into DF
-        vector_dict = self._fix_vector_dict(vector_dict)
+        return self._land(tsi)
+
+    def _generate_flight_exponential(self, vector_dict, random_state=np.random):
+        """_generate_flight with the exponential integrator. The plume, the decision and the stimulus force are
+        updated every internal_dt and held in between, random forces are still drawn every dt.
+        """
+        k = self._get_internal_steps()
+        integrator = self._make_integrator(k)
+        restitution = self._get_restitution_factor()
+
+        self.decisions = Decisions(self.decision_policy, self._get_decision_memory())
+
+        in_plume = vector_dict['in_plume']
+        heat_signal = vector_dict['heat_signal']
+        position = vector_dict['position']
+        velocity = vector_dict['velocity']
+        acceleration = vector_dict['acceleration']
+        random_f = vector_dict['random_f']
+        stim_f = vector_dict['stim_f']
+        total_f = vector_dict['total_f']
+        decision = vector_dict['decision']
+        gradient = vector_dict['gradient']
+
+        position[0] = self._set_init_position(random_state)
+        velocity[0] = self._set_init_velocity(random_state)
+
+        for start in xrange(0, self.max_bins, k):
+            stop = min(start + k, self.max_bins)
+            block = slice(start, stop)
+
+            in_plume[block] = self.heat.check_in_plume_bounds(position[start])
+            decision[block], heat_signal[block] = self.decisions.make_decision(in_plume[start], velocity[start][1])
+
+            if heat_signal[start] == GRADIENT:
+                plume_gradient = self.heat.get_nearest_gradient(position[start])
+                gradient[block] = plume_gradient
+            else:
+                plume_gradient = None
+
+            stim_f[block] = self.flight.stimulus(decision[start], plume_gradient)
+            random_f[block] = self.flight.random_batch(stop - start, random_state.normal(size=(stop - start, 3)))
+
+            self._integrate_block(position, velocity, random_f[block] + stim_f[block], start, integrator, restitution)
+            total_f[block] = -self.flight.damping_coeff * velocity[block] + random_f[block] + stim_f[block]
+            acceleration[block] = total_f[block] / self.mass
+
+        return self._land(self.max_bins - 1)
+
+    def _integrate_block(self, position, velocity, forces, start, integrator, restitution):
+        """
+        Exactly integrate the timesteps from start on under forces, the non-damping forces of each step, writing the
+        states after each step into position and velocity. Works on (max_bins, 3) position and velocity arrays of one
+        trajectory with (k, 3) forces, or on (N, max_bins, 3) arrays of N trajectories with (N, k, 3) forces. The last
+        timestep of the simulation isn't integrated past.
+        """
+        if position.ndim == 2:
+            position, velocity, forces = position[np.newaxis], velocity[np.newaxis], forces[np.newaxis]
+
+        n_steps = min(forces.shape[1], self.max_bins - 1 - start)
+        if n_steps < 1:
+            return
+
+        positions, velocities = self._propagate_block(position[:, start], velocity[:, start],
+                                                      forces[:, :n_steps] / self.mass, integrator, restitution)
+        position[:, start + 1:start + 1 + n_steps] = positions[:, 1:]
+        velocity[:, start + 1:start + 1 + n_steps] = velocities[:, 1:]
+
+    def _propagate_block(self, position, velocity, accelerations, integrator, restitution):
+        """
+        ExponentialIntegrator.propagate, but agents that leave the windtunnel collide with the wall at the first
+        timestep they are outside and are propagated on from there.
+        """
+        positions, velocities = integrator.propagate(position, velocity, accelerations)
+        if not self.bounded:
+            return positions, velocities
+
+        n_steps = accelerations.shape[1]
+        first_hit = self._first_wall_hit(positions, 1)
+        for j in range(1, n_steps + 1):
+            hit = np.flatnonzero(first_hit == j)
+            if not len(hit):
+                continue
+            positions[hit, j], velocities[hit, j] = self._collide_with_walls_ensemble(positions[hit, j],
+                                                                                      velocities[hit, j], restitution)
+            if j < n_steps:
+                positions[hit, j:], velocities[hit, j:] = integrator.propagate(positions[hit, j], velocities[hit, j],
+                                                                               accelerations[hit, j:])
+                first_hit[hit] = self._first_wall_hit(positions[hit], j + 1)
+
+        return positions, velocities
+
+    def _first_wall_hit(self, positions, start):
+        """index of the first of positions[:, start:] outside the windtunnel, per agent. positions.shape[1] if none"""
+        walls = self.windtunnel.walls
+        lower = np.array([walls.downwind, walls.left, walls.floor])
+        upper = np.array([walls.upwind, walls.right, walls.ceiling])
+
+        outside = ((positions[:, start:] < lower) | (positions[:, start:] > upper)).any(axis=2)
+        return np.where(outside.any(axis=1), start + outside.argmax(axis=1), positions.shape[1])
+
+    def _get_internal_steps(self):
+        """number of output timesteps per internal timestep, see internal_dt"""
+        if self.internal_dt is None:
+            return 1
 
-        return vector_dict
+        k = int(round(self.internal_dt / self.dt))
+        if k < 1 or not np.isclose(k * self.dt, self.internal_dt):
+            raise ValueError("internal_dt {} is not a multiple of dt {}".format(self.internal_dt, self.dt))
+        if k > 1 and self.integrator != 'exponential':
+            raise ValueError("internal_dt {} > dt needs the exponential integrator".format(self.internal_dt))
 
-    def _land(self, tsi, V):
-        ''' trim excess timebins in arrays
+        return k
+
+    def _get_decision_memory(self):
+        """plume memory in decisions, which are made once per internal timestep"""
+        return int(np.ceil(self.stimulus_memory_n_timesteps / float(self._get_internal_steps())))
+
+    def _make_integrator(self, max_steps):
+        return ExponentialIntegrator(self.flight.damping_coeff, self.mass, self.dt, max_steps)
+
+    def _generate_ensemble(self, trajectory_nums, seed=None):
+        """Generate the trajectories numbered trajectory_nums at once. Same model as _generate_flight, but every
+        timestep advances the whole ensemble with array operations.
+
+        If seed is given, each trajectory draws from its own stream (see _get_random_stream) in the same order as
+        _generate_flight does, so both engines consume the same random numbers.
+
+        Kinematics are written into (n_trajectories, max_bins, 3) views of an EnsembleBuffer, see _fly_ensemble_euler
+        and _fly_ensemble_exponential.
+
+        Returns
+        -------
+        the compacted EnsembleBuffer, trajectory after trajectory
+        """
+        n = len(trajectory_nums)
+        buffer = self._make_ensemble_buffer(n)
+
+        position = buffer.vector('position')
+        velocity = buffer.vector('velocity')
+
+        decisions = EnsembleDecisions(self.decision_policy, self._get_decision_memory(), n)
+        restitution = self._get_restitution_factor()
+
+        if seed is None:
+            position[:, 0] = self._set_init_positions(n)
+            velocity[:, 0] = self._set_init_velocities(n)
+            random_gauss = None
+        else:
+            # draw each trajectory's initial conditions and random force tape from its own stream up front
+            random_gauss = np.empty((n, self.max_bins, 3))
+            for i, trajectory_num in enumerate(trajectory_nums):
+                random_state = self._get_random_stream(seed, trajectory_num)
+                position[i, 0] = self._set_init_position(random_state)
+                velocity[i, 0] = self._set_init_velocity(random_state)
+                random_gauss[i] = random_state.normal(size=(self.max_bins, 3))
+
+        if self.integrator == 'euler':
+            self._get_internal_steps()  # check internal_dt
+            landed_at = self._fly_ensemble_euler(buffer, decisions, random_gauss, restitution)
+        elif self.integrator == 'exponential':
+            landed_at = self._fly_ensemble_exponential(buffer, decisions, random_gauss, restitution)
+        else:
+            raise ValueError("unknown integrator {}".format(self.integrator))
+
+        if self.verbose:
+            sys.stdout.write("\rSimulations finished. Performing deep magic.")
+            sys.stdout.flush()
+
+        for i, tsi in enumerate(landed_at):
+            buffer.land(i, self._land(tsi))
+
+        return buffer.compact()
+
+    def _fly_ensemble_euler(self, buffer, decisions, random_gauss, restitution):
+        """Explicit Euler integration of the whole ensemble. Every trajectory flies until max_bins, or until the
+        simulation is interrupted, so the whole ensemble is advanced together.
+
+        Returns
+        -------
+        landed_at
+            timestep each trajectory landed at
+        """
+        dt = self.dt
+        m = self.mass
+        n = buffer.n_trajectories
+
+        in_plume = buffer.series_view('in_plume')
+        heat_signal = buffer.series_view('heat_signal')
+        decision = buffer.series_view('decision')
+        position = buffer.vector('position')
+        velocity = buffer.vector('velocity')
+        acceleration = buffer.vector('acceleration')
+        random_f = buffer.vector('random_f')
+        stim_f = buffer.vector('stim_f')
+        total_f = buffer.vector('total_f')
+        gradient = buffer.vector('gradient')
+
+        landed_at = np.full(n, self.max_bins - 1)
+
+        tsi = 0
+        try:
+            for tsi in range(self.max_bins):
+                if self.verbose and tsi % 100 == 0:
+                    sys.stdout.write("\rTimestep {}/{}".format(tsi, self.max_bins))
+                    sys.stdout.flush()
+
+                pos = position[:, tsi]
+                velo = velocity[:, tsi]
+
+                in_plume[:, tsi] = self.heat.check_in_plume_bounds_batch(pos)
+
+                decisions_now, signals_now = decisions.make_decision(in_plume[:, tsi], velo[:, 1])
+
+                gradients = np.zeros_like(pos)
+                needs_gradient = signals_now == GRADIENT
+                if needs_gradient.any():
+                    gradients[needs_gradient] = self.heat.get_nearest_gradient_batch(pos[needs_gradient])
+
+                decision[:, tsi] = decisions_now
+                heat_signal[:, tsi] = signals_now
+                gradient[:, tsi] = gradients
+
+                gauss = None if random_gauss is None else random_gauss[:, tsi]
+                stim, rand, total = self.flight.calc_forces_batch(velo, decisions_now, gradients, gauss)
+                stim_f[:, tsi], random_f[:, tsi], total_f[:, tsi] = stim, rand, total
+
+                # calculate current acceleration
+                accel = total / m
+                acceleration[:, tsi] = accel
+
+                # check if time is out, end loop before we solve for future velo, position
+                if tsi == self.max_bins - 1:
+                    break
+
+                candidate_velo = velo + accel * dt
+                # make sure velocity doesn't diverge to infinity if system is unstable
+                candidate_velo = np.clip(candidate_velo, -20., 20.)
+                candidate_pos = pos + candidate_velo * dt
+
+                if self.bounded:
+                    candidate_pos, candidate_velo = self._collide_with_walls_ensemble(candidate_pos, candidate_velo,
+                                                                                      restitution)
+
+                position[:, tsi + 1] = candidate_pos
+                velocity[:, tsi + 1] = candidate_velo
+
+        except KeyboardInterrupt:
+            print "\n Simulations interrupted at timestep {}. Landing all trajectories...".format(tsi)
+            landed_at[:] = tsi
+
+        return landed_at
+
+    def _fly_ensemble_exponential(self, buffer, decisions, random_gauss, restitution):
+        """Exact integration of the whole ensemble, see _generate_flight_exponential.
+
+        Returns
+        -------
+        landed_at
+            timestep each trajectory landed at
+        """
+        k = self._get_internal_steps()
+        integrator = self._make_integrator(k)
+        n = buffer.n_trajectories
+
+        in_plume = buffer.series_view('in_plume')
+        heat_signal = buffer.series_view('heat_signal')
+        decision = buffer.series_view('decision')
+        position = buffer.vector('position')
+        velocity = buffer.vector('velocity')
+        acceleration = buffer.vector('acceleration')
+        random_f = buffer.vector('random_f')
+        stim_f = buffer.vector('stim_f')
+        total_f = buffer.vector('total_f')
+        gradient = buffer.vector('gradient')
+
+        landed_at = np.full(n, self.max_bins - 1)
+
+        start = 0
+        try:
+            for start in xrange(0, self.max_bins, k):
+                if self.verbose and start % 100 < k:
+                    sys.stdout.write("\rTimestep {}/{}".format(start, self.max_bins))
+                    sys.stdout.flush()
+
+                stop = min(start + k, self.max_bins)
+                block = slice(start, stop)
+                pos = position[:, start]
+
+                in_plume[:, block] = self.heat.check_in_plume_bounds_batch(pos)[:, np.newaxis]
+                decisions_now, signals_now = decisions.make_decision(in_plume[:, start], velocity[:, start, 1])
+                decision[:, block] = decisions_now[:, np.newaxis]
+                heat_signal[:, block] = signals_now[:, np.newaxis]
+
+                gradients = np.zeros_like(pos)
+                needs_gradient = signals_now == GRADIENT
+                if needs_gradient.any():
+                    gradients[needs_gradient] = self.heat.get_nearest_gradient_batch(pos[needs_gradient])
+                gradient[:, block] = gradients[:, np.newaxis]
+
+                stim_f[:, block] = self.flight.stimulus_batch(decisions_now, gradients)[:, np.newaxis]
+                gauss = None if random_gauss is None else random_gauss[:, block].reshape(-1, 3)
+                random_f[:, block] = self.flight.random_batch(n * (stop - start), gauss).reshape(n, stop - start, 3)
+
+                self._integrate_block(position, velocity, random_f[:, block] + stim_f[:, block], start, integrator,
+                                      restitution)
+                total_f[:, block] = (-self.flight.damping_coeff * velocity[:, block] + random_f[:, block] +
+                                     stim_f[:, block])
+                acceleration[:, block] = total_f[:, block] / self.mass
+
+        except KeyboardInterrupt:
+            print "\n Simulations interrupted at timestep {}. Landing all trajectories...".format(start)
+            landed_at[:] = start
+
+        return landed_at
+
+    def _get_restitution_factor(self):
+        """what happens to the velocity component normal to a wall after a collision"""
+        if self.collision_type == 'elastic':
+            return -1.
+        elif self.collision_type == 'part_elastic':
+            return -self.restitution_coeff
+        elif self.collision_type == 'crash':
+            return 0.
+        else:
+            raise ValueError("unknown collision type {}".format(self.collision_type))
+
+    def _collide_with_walls_ensemble(self, candidate_pos, candidate_velo, restitution):
+        """vectorized _collide_with_wall for (N, 3) arrays of candidate positions and velocities"""
+        walls = self.windtunnel.walls
+        teleport_distance = 0.005  # this is arbitrary
+
+        for dim, (lower, upper) in enumerate([(walls.downwind, walls.upwind),
+                                              (walls.left, walls.right),
+                                              (walls.floor, walls.ceiling)]):
+            too_low = candidate_pos[:, dim] < lower
+            candidate_pos[too_low, dim] = lower + teleport_distance  # teleport back inside
+            candidate_velo[too_low, dim] *= restitution
+
+            too_high = candidate_pos[:, dim] > upper
+            candidate_pos[too_high, dim] = upper - teleport_distance
+            candidate_velo[too_high, dim] *= restitution
+
+        return candidate_pos, candidate_velo
+
+    def _land(self, tsi):
+        ''' number of timebins to keep of a trajectory that landed at timestep tsi
         '''
         if tsi == 0:  # hack for if we need to chop a trajectory at the very start
-            for k, array in V.iteritems():
-                V[k] = array[:1]
+            return 1
         else:
-            for k, array in V.iteritems():
-                V[k] = array[:tsi - 1]
-                V[k] = array[:tsi - 1]
-        
-        return V
+            return tsi - 1
 
     def _collide_with_wall(self, candidate_pos, candidate_velo):
         walls = self.windtunnel.walls
@@ -279,32 +780,55 @@ class Simulator:
 
         return candidate_pos, candidate_velo
 
-    def _initialize_vector_dict(self):
-        """
-        initialize np arrays, store in dictionary
-        """
-        V = {}
+    def _set_init_velocity(self, random_state=np.random):
+        initial_velocity_norm = random_state.normal(self.initial_velocity_mu, self.initial_velocity_stdev, 1)
 
-        for name in self.kinematics_list + self.forces_list:
-            V[name] = np.full((self.max_bins, 3), np.nan)
+        unit_vector = generate_random_unit_vector(random_state)
+        velocity_vec = initial_velocity_norm * unit_vector
 
-        V['tsi'] = np.arange(self.max_bins)
-        V['times'] = np.linspace(0, self.time_max, self.max_bins)
-        V['in_plume'] = np.zeros(self.max_bins, dtype=bool)
-        V['heat_signal'] = np.array([None] * self.max_bins)
-        V['decision'] = np.array([None] * self.max_bins)
+        return velocity_vec
 
-        return V
+    def _set_init_velocities(self, n_trajectories):
+        """vectorized _set_init_velocity"""
+        initial_velocity_norms = np.random.normal(self.initial_velocity_mu, self.initial_velocity_stdev, n_trajectories)
 
-    def _set_init_velocity(self):
-        initial_velocity_norm = np.random.normal(self.initial_velocity_mu, self.initial_velocity_stdev, 1)
+        unit_vectors = generate_random_unit_vectors(n_trajectories)
+        velocity_vecs = initial_velocity_norms[:, np.newaxis] * unit_vectors
 
-        unit_vector = generate_random_unit_vector()
-        velocity_vec = initial_velocity_norm * unit_vector
+        return velocity_vecs
 
-        return velocity_vec
+    def _set_init_positions(self, n_trajectories):
+        """vectorized _set_init_position. returns (n_trajectories, 3) array"""
+        n = n_trajectories
+        if self.initial_position_selection == 'realistic':
+            # see _set_init_position for where these numbers come from
+            downwind, upwind, left, right, floor, ceiling = self.boundary
+            x_avg_dist_to_wall = 0.268
+            y_avg_dist_to_wall = 0.044
+            z_avg_dist_to_wall = 0.049
+            x = np.where(np.random.randint(2, size=n), downwind + x_avg_dist_to_wall, upwind - x_avg_dist_to_wall)
+            y = np.where(np.random.randint(2, size=n), left + y_avg_dist_to_wall, right - y_avg_dist_to_wall)
+            z = np.full(n, ceiling - z_avg_dist_to_wall)
+        elif self.initial_position_selection == 'downwind_high':
+            x = np.full(n, 0.05)
+            y = np.random.uniform(-0.127, 0.127, n)
+            z = np.full(n, 0.2373)  # 0.2373 is mode of z pos distribution
+        elif type(self.initial_position_selection) is list:
+            return np.tile(self.initial_position_selection, (n, 1)).astype(float)
+        elif self.initial_position_selection == "door":  # start trajectories as they exit the front door
+            x = np.full(n, 0.1909)
+            y = np.random.uniform(-0.0381, 0.0381, n)
+            z = np.random.uniform(0., 0.1016, n)
+        elif self.initial_position_selection == 'downwind_plane':
+            x = np.full(n, 0.1)
+            y = np.random.uniform(-0.127, 0.127, n)
+            z = np.random.uniform(0., 0.254, n)
+        else:
+            raise Exception('invalid agent position specified: {}'.format(self.initial_position_selection))
 
-    def _set_init_position(self):
+        return np.column_stack((x, y, z))
+
+    def _set_init_position(self, random_state=np.random):
         ''' puts the agent in an initial position, usually within the bounds of the
         cage
 
@@ -323,20 +847,21 @@ class Simulator:
             x_avg_dist_to_wall = 0.268
             y_avg_dist_to_wall = 0.044
             z_avg_dist_to_wall = 0.049
-            x = choose([(downwind + x_avg_dist_to_wall), (upwind - x_avg_dist_to_wall)])
-            y = choose([left + y_avg_dist_to_wall, (right - y_avg_dist_to_wall)])
+            x = random_state.choice([(downwind + x_avg_dist_to_wall), (upwind - x_avg_dist_to_wall)])
+            y = random_state.choice([left + y_avg_dist_to_wall, (right - y_avg_dist_to_wall)])
             z = ceiling - z_avg_dist_to_wall
             initial_position = np.array([x,y,z])
         elif self.initial_position_selection == 'downwind_high':
             initial_position = np.array(
-                [0.05, np.random.uniform(-0.127, 0.127), 0.2373])  # 0.2373 is mode of z pos distribution
+                [0.05, random_state.uniform(-0.127, 0.127), 0.2373])  # 0.2373 is mode of z pos distribution
         elif type(self.initial_position_selection) is list:
             initial_position = np.array(self.initial_position_selection)
         elif self.initial_position_selection == "door":  # start trajectories as they exit the front door
-            initial_position = np.array([0.1909, np.random.uniform(-0.0381, 0.0381), np.random.uniform(0., 0.1016)])
+            initial_position = np.array([0.1909, random_state.uniform(-0.0381, 0.0381),
+                                         random_state.uniform(0., 0.1016)])
             # FIXME cage is actually suspending above floor
         elif self.initial_position_selection == 'downwind_plane':
-            initial_position = np.array([0.1, np.random.uniform(-0.127, 0.127), np.random.uniform(0., 0.254)])
+            initial_position = np.array([0.1, random_state.uniform(-0.127, 0.127), random_state.uniform(0., 0.254)])
         else:
             raise Exception('invalid agent position specified: {}'.format(self.initial_position_selection))
 
@@ -354,23 +879,20 @@ class Simulator:
 
         return candidate_velo
 
-    def _fix_vector_dict(self, dct):
-        # prepare dict for loading into pandas (dataframe only accepts 1D vectors)
-        # split xyz dicts into separate x, y, z vectors for dataframe
 
-        fixed_dct = {}
-        for kinematic in self.kinematics_list + self.forces_list:
-            fixed_dct[kinematic + '_x'], fixed_dct[kinematic + '_y'], fixed_dct[kinematic + '_z'] = np.split(
-                dct[kinematic], 3, axis=1)
+# process pool helpers for Simulator._fly_parallel. they live at module level so that they can be pickled.
+_worker_simulator = None
+
 
-        # migrate rest of dict
-        for v in self.other_list:
-            fixed_dct[v] = dct[v]
+def _init_fly_worker(simulator):
+    global _worker_simulator
+    _worker_simulator = simulator
+    _worker_simulator.verbose = False  # don't let the workers fight over the terminal
 
-        # fix pandas bug when trying to load (R,1) arrays when it expects (R,) arrays
-        for key, dct in fixed_dct.iteritems():
-            fixed_dct[key] = fixed_dct[key].reshape(len(dct))
-            if fixed_dct[key].size == 0:
-                fixed_dct[key] = np.array([0.])  # hack so that kde calculation doesn't freeze on empty arrays
 
-        return fixed_dct
\ No newline at end of file
+def _fly_worker(args):
+    trajectory_nums, seed, sketch_edges, summarize = args
+    if summarize:
+        return _worker_simulator._fly_shard_summary(trajectory_nums, seed, sketch_edges)
+    else:
+        return _worker_simulator._fly_shard(trajectory_nums, seed)
@@ -0,0 +1,53 @@
+"""
+Unit tests for the ensemble decision policies.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from roboskeeter.decisions import Decisions, EnsembleDecisions, GRADIENT_ASCENT, GRADIENT
+
+
+class EnsembleDecisionsTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+
+    def _compare_to_scalar_policy(self, decision_policy):
+        n_agents, n_timesteps, memory = 20, 300, 10
+        in_plume = np.random.rand(n_agents, n_timesteps) < 0.3
+        crosswind_velocity = np.random.normal(size=(n_agents, n_timesteps))
+
+        ensemble = EnsembleDecisions(decision_policy, memory, n_agents)
+        agents = [Decisions(decision_policy, memory) for _ in range(n_agents)]
+
+        for tsi in range(n_timesteps):
+            decisions, signals = ensemble.make_decision(in_plume[:, tsi], crosswind_velocity[:, tsi])
+            for i, agent in enumerate(agents):
+                decision, signal = agent.make_decision(in_plume[i, tsi], crosswind_velocity[i, tsi])
+                self.assertEqual(decisions[i], decision)
+                self.assertEqual(signals[i], signal)
+
+    def test_cast_matches_scalar_policy(self):
+        self._compare_to_scalar_policy('cast')
+
+    def test_surge_matches_scalar_policy(self):
+        self._compare_to_scalar_policy('surge')
+
+    def test_castsurge_matches_scalar_policy(self):
+        self._compare_to_scalar_policy('castsurge')
+
+    def test_gradient_asks_for_gradient_lookup(self):
+        decisions, signals = EnsembleDecisions('gradient', 1, 5).make_decision(np.zeros(5, dtype=bool), np.zeros(5))
+        self.assertTrue((decisions == GRADIENT_ASCENT).all())
+        self.assertTrue((signals == GRADIENT).all())
+
+    def test_codes_are_small_ints(self):
+        decisions, signals = EnsembleDecisions('castsurge', 10, 5).make_decision(np.ones(5, dtype=bool), np.zeros(5))
+        self.assertEqual(decisions.dtype, np.int8)
+        self.assertEqual(signals.dtype, np.int8)
+
+
+if __name__ == '__main__':
+    unittest.main()
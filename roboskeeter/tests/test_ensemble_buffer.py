@@ -0,0 +1,75 @@
+"""
+Unit tests for the columnar buffer simulated ensembles are written into.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from roboskeeter.ensemble_buffer import EnsembleBuffer
+
+MAX_BINS = 6
+DECISIONS = ('search', 'surge', 'cast')
+
+
+class EnsembleBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.lengths = [4, 1, 6, 0, 2]
+        self.trajectory_nums = [7, 2, 9, 4, 3]
+        self.times = np.linspace(0, 0.05, MAX_BINS)
+
+        self.buffer = EnsembleBuffer(len(self.lengths), MAX_BINS, ['position', 'velocity'], ['gradient'],
+                                     {'decision': DECISIONS})
+        self.trajectories = []
+        for i, length in enumerate(self.lengths):
+            views = self.buffer.trajectory(i)
+            views['position'][:] = np.random.normal(size=(MAX_BINS, 3))
+            views['velocity'][:] = np.random.normal(size=(MAX_BINS, 3))
+            views['gradient'][:] = np.random.normal(size=(MAX_BINS, 3))
+            views['decision'][:] = np.random.randint(len(DECISIONS), size=MAX_BINS)
+            views['in_plume'][:] = np.random.uniform(size=MAX_BINS) > 0.5
+            self.trajectories.append({name: np.array(view[:length]) for name, view in views.items()})
+            self.buffer.land(i, length)
+
+    def _expected_column(self, name):
+        if name in self.buffer.series:
+            return np.concatenate([trajectory[name] for trajectory in self.trajectories])
+        vector, dim = name.rsplit('_', 1)
+        return np.concatenate([trajectory[vector][:, 'xyz'.index(dim)] for trajectory in self.trajectories])
+
+    def test_compacted_columns(self):
+        self.buffer.compact()
+        self.assertEqual(self.buffer.n_rows, sum(self.lengths))
+        for name in self.buffer.float_columns + self.buffer.float32_columns + ['decision', 'in_plume']:
+            np.testing.assert_array_equal(self.buffer.column(name), self._expected_column(name))
+
+    def test_compact_drops_trajectories(self):
+        self.buffer.compact(n_trajectories=2)
+        self.assertEqual(self.buffer.n_rows, 5)
+        np.testing.assert_array_equal(self.buffer.column('velocity_y'), self._expected_column('velocity_y')[:5])
+
+    def test_dataframe(self):
+        df = self.buffer.to_dataframe(self.trajectory_nums, self.times)
+        self.assertEqual(len(df), sum(self.lengths))
+
+        start = 0
+        for trajectory_num, length, trajectory in zip(self.trajectory_nums, self.lengths, self.trajectories):
+            rows = df.iloc[start:start + length]
+            np.testing.assert_array_equal(rows['trajectory_num'], [trajectory_num] * length)
+            np.testing.assert_array_equal(rows['tsi'], np.arange(length))
+            np.testing.assert_array_equal(rows['times'], self.times[:length])
+            np.testing.assert_array_equal(rows[['position_x', 'position_y', 'position_z']].values,
+                                          trajectory['position'])
+            np.testing.assert_array_equal(rows['decision'].cat.codes, trajectory['decision'])
+            start += length
+
+        self.assertEqual(list(df['decision'].cat.categories), list(DECISIONS))
+        self.assertEqual(df['gradient_x'].dtype, np.float32)
+        for name in self.buffer.float_columns:
+            self.assertTrue(np.shares_memory(df[name].values, self.buffer.floats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Unit tests for the environment and its heat models.
+"""
+from __future__ import print_function, division
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+_use = matplotlib.use
+matplotlib.use = lambda *args, **kwargs: None  # plotting.plot_environment forces Qt4Agg, which needs a display
+try:
+    from roboskeeter import environment
+finally:
+    matplotlib.use = _use
+
+import numpy as np
+import pandas as pd
+
+
+class _Experiment(object):
+    def __init__(self, **experiment_conditions):
+        self.experiment_conditions = dict({'condition': 'Left', 'heat_model_name': 'Boolean', 'bounded': True},
+                                          **experiment_conditions)
+
+
+def _make_plume_planes(y_position):
+    """a Boolean plume table with planes listed from upwind to downwind, like the plume bounds csvs"""
+    x_position = np.linspace(0.8, 0.2, 25)
+    return pd.DataFrame({'x_position': x_position,
+                         'z_position': np.random.uniform(0.08, 0.16, len(x_position)),
+                         'small_radius': np.random.uniform(0.01, 0.03, len(x_position)),
+                         'y_position': y_position})
+
+
+def _baseline_in_plume(plume, position):
+    """BooleanPlumeModel.check_in_plume_bounds before the plume planes were compiled into arrays"""
+    x, y, z = position
+    x_distances_to_plume_planes = np.abs(plume.data['x_position'].values - x)
+    if x_distances_to_plume_planes.min() > plume.resolution:
+        return False
+
+    plume_plane = plume.data.iloc[x_distances_to_plume_planes.argmin()]
+    minor_axis = plume_plane.small_radius
+    major_axis = minor_axis * 3
+    value = (((y - plume_plane.y_position) ** 2) / minor_axis ** 2) + \
+            (((z - plume_plane.z_position) ** 2) / major_axis ** 2)
+
+    return value <= 1
+
+
+class BooleanPlumeModelTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self._load_plume_data = environment.BooleanPlumeModel.__dict__['_load_plume_data']
+        environment.BooleanPlumeModel._load_plume_data = \
+            lambda plume: _make_plume_planes(plume.environment.windtunnel.heater_l.y_position)
+
+        self.tmp_dir = tempfile.mkdtemp()
+        heater_y = environment.WindTunnel('Left').heater_l.y_position
+        self.positions = np.column_stack([np.random.uniform(0.1, 0.9, 2000),
+                                          np.random.normal(heater_y, 0.03, 2000),
+                                          np.random.uniform(0.05, 0.2, 2000)])
+
+    def tearDown(self):
+        environment.BooleanPlumeModel._load_plume_data = self._load_plume_data
+        shutil.rmtree(self.tmp_dir)
+
+    def test_matches_baseline(self):
+        plume = environment.Environment(_Experiment()).heat
+        self.assertIsNone(plume.occupancy)
+
+        nearest, distances = plume._get_nearest_plume_planes(self.positions[:, 0])
+        baseline_distances = np.abs(plume.data['x_position'].values[:, np.newaxis] - self.positions[:, 0])
+        baseline_nearest = baseline_distances.argmin(axis=0)
+        np.testing.assert_array_equal(plume.plane_x[nearest], plume.data['x_position'].values[baseline_nearest])
+        np.testing.assert_array_equal(distances, baseline_distances.min(axis=0))
+
+        in_plume = plume._check_in_plume_ellipses(self.positions)
+        self.assertTrue(in_plume.any())
+        np.testing.assert_array_equal(in_plume, [_baseline_in_plume(plume, position) for position in self.positions])
+
+    def test_occupancy_bitmap_matches_ellipses_at_voxel_centres(self):
+        plume = environment.Environment(_Experiment(plume_occupancy_resolution=0.01)).heat
+        self.assertEqual(plume.occupancy_resolution, 0.01)
+
+        centres = np.column_stack([axis.ravel() for axis in np.meshgrid(*plume.occupancy.axes, indexing='ij')])
+        in_plume = plume.check_in_plume_bounds_batch(centres)
+        self.assertTrue(in_plume.any())
+        np.testing.assert_array_equal(in_plume, plume._check_in_plume_ellipses(centres))
+
+    def test_published_model_pickles_to_shared_memmaps(self):
+        plume = environment.Environment(_Experiment(plume_occupancy_resolution=0.01)).heat
+        bitmap = np.array(plume.occupancy.volumes['occupancy'])
+        in_plume = plume.check_in_plume_bounds_batch(self.positions)
+
+        shared_grid_dir = plume.publish(os.path.join(self.tmp_dir, 'grid'))
+        self.assertNotIn('occupancy', plume.__getstate__())
+
+        unpickled = pickle.loads(pickle.dumps(plume, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled.shared_grid_dir, shared_grid_dir)
+        volume = unpickled.occupancy.volumes['occupancy']
+        self.assertIsInstance(volume, np.memmap)
+        self.assertFalse(volume.flags.writeable)
+        np.testing.assert_array_equal(volume, bitmap)
+        np.testing.assert_array_equal(unpickled.check_in_plume_bounds_batch(self.positions), in_plume)
+
+
+class EnvironmentRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.registry = dict(environment._environment_registry)
+        environment._environment_registry.clear()
+
+    def tearDown(self):
+        environment._environment_registry.clear()
+        environment._environment_registry.update(self.registry)
+
+    def test_same_conditions_share_an_environment(self):
+        shared = environment.get_environment(_Experiment(heat_model_name='None'))
+        self.assertIs(environment.get_environment(_Experiment(condition='left', heat_model_name='NONE')), shared)
+
+        for conditions in [{'condition': 'Right'}, {'heat_model_name': 'Boolean'}, {'bounded': False},
+                           {'plume_occupancy_resolution': 0.01}]:
+            other = environment.get_environment(_Experiment(**dict({'heat_model_name': 'None'}, **conditions)))
+            self.assertIsNot(other, shared)
+        self.assertEqual(len(environment._environment_registry), 5)
+
+    def test_heat_model_loaded_on_first_access(self):
+        shared = environment.get_environment(_Experiment(heat_model_name='None'))
+        self.assertIsNone(shared._heat)
+        heat = shared.heat
+        self.assertIsInstance(heat, environment.NoHeatModel)
+        self.assertIs(shared.heat, heat)
+
+    def test_evict_by_each_field(self):
+        conditions = {'left': {'heat_model_name': 'None'},
+                      'right': {'condition': 'Right', 'heat_model_name': 'None'},
+                      'boolean': {},
+                      'unbounded': {'heat_model_name': 'None', 'bounded': False}}
+        environments = {name: environment.get_environment(_Experiment(**kwargs))
+                        for name, kwargs in conditions.items()}
+
+        self.assertEqual(environment.evict_environments(condition='Right'), 1)
+        self.assertIsNot(environment.get_environment(_Experiment(**conditions['right'])), environments['right'])
+        self.assertEqual(environment.evict_environments(heat_model_name='Boolean'), 1)
+        self.assertEqual(environment.evict_environments(bounded=False), 1)
+        self.assertIs(environment.get_environment(_Experiment(**conditions['left'])), environments['left'])
+
+        self.assertEqual(environment.evict_environments(), 2)
+        self.assertEqual(len(environment._environment_registry), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
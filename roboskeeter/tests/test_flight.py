@@ -0,0 +1,40 @@
+"""
+Unit tests for the stimulus force lookup.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from roboskeeter.decisions import DECISIONS, GRADIENT_ASCENT
+from roboskeeter.flight import Flight
+
+
+class FlightStimulusTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.flight = Flight(4e-06, 5e-06, 1e-5)
+
+    def test_batch_matches_scalar_stimulus(self):
+        decisions = np.arange(len(DECISIONS), dtype=np.int8).repeat(3)
+        gradients = np.random.normal(size=(len(decisions), 3))
+
+        forces = self.flight.stimulus_batch(decisions, gradients)
+        for decision, gradient, force in zip(decisions, gradients, forces):
+            # the norms of shrunk forces may differ in the last bit between the scalar and batch code
+            np.testing.assert_allclose(force, self.flight.stimulus(decision, gradient.copy()), rtol=1e-12)
+
+    def test_only_gradient_ascent_reads_gradient(self):
+        decisions = np.arange(len(DECISIONS), dtype=np.int8)
+        decisions = decisions[decisions != GRADIENT_ASCENT]
+        forces = self.flight.stimulus_batch(decisions, np.full((len(decisions), 3), np.nan))
+        self.assertTrue(np.isfinite(forces).all())
+
+    def test_unknown_decision(self):
+        self.assertRaises(LookupError, self.flight.stimulus, len(DECISIONS), None)
+        self.assertRaises(LookupError, self.flight.stimulus_batch, np.array([-1], dtype=np.int8), np.zeros((1, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
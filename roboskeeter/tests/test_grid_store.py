@@ -0,0 +1,81 @@
+"""
+Unit tests for the binary storage of regular 3D grids.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from roboskeeter.io import grid_store
+
+
+class _InterruptedVolume(object):
+    """a volume that interrupts the write when it gets saved"""
+    def __init__(self, shape):
+        self.shape = shape
+
+    def __array__(self, *args):
+        raise KeyboardInterrupt
+
+
+class GridStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.grid_dir = os.path.join(self.tmp_dir, 'grid')
+        self.xi, self.yi, self.zi = np.linspace(0, 1, 4), np.linspace(-1, 1, 5), np.linspace(0, 0.5, 3)
+        self.volumes = {'temperature': np.random.uniform(size=(4, 5, 3)),
+                        'gradient': np.random.normal(size=(4, 5, 3, 3))}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _assert_loads_volumes(self, volumes):
+        xi, yi, zi, loaded = grid_store.load_grid(self.grid_dir)
+        for axis, loaded_axis in [(self.xi, xi), (self.yi, yi), (self.zi, zi)]:
+            np.testing.assert_array_equal(loaded_axis, axis)
+        self.assertEqual(sorted(loaded), sorted(volumes))
+        for name, volume in volumes.items():
+            np.testing.assert_array_equal(loaded[name], volume)
+        return loaded
+
+    def test_round_trip_is_read_only_memmap(self):
+        grid_store.save_grid(self.grid_dir, self.xi, self.yi, self.zi, self.volumes)
+        self.assertTrue(grid_store.grid_exists(self.grid_dir))
+
+        for volume in self._assert_loads_volumes(self.volumes).values():
+            self.assertIsInstance(volume, np.memmap)
+            self.assertFalse(volume.flags.writeable)
+
+        in_memory = grid_store.load_grid(self.grid_dir, mmap_mode=None)[3]
+        self.assertNotIsInstance(in_memory['temperature'], np.memmap)
+
+    def test_no_overwrite(self):
+        grid_store.save_grid(self.grid_dir, self.xi, self.yi, self.zi, self.volumes)
+        new_volumes = {'temperature': np.zeros((4, 5, 3))}
+
+        grid_store.save_grid(self.grid_dir, self.xi, self.yi, self.zi, new_volumes)
+        self._assert_loads_volumes(self.volumes)
+
+        grid_store.save_grid(self.grid_dir, self.xi, self.yi, self.zi, new_volumes, overwrite=True)
+        self._assert_loads_volumes(new_volumes)
+        self.assertEqual(os.listdir(self.tmp_dir), ['grid'])
+
+    def test_interrupted_write_leaves_nothing_behind(self):
+        volumes = dict(self.volumes, broken=_InterruptedVolume((4, 5, 3)))
+        self.assertRaises(KeyboardInterrupt, grid_store.save_grid, self.grid_dir, self.xi, self.yi, self.zi, volumes)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+        grid_store.save_grid(self.grid_dir, self.xi, self.yi, self.zi, self.volumes)
+        self.assertRaises(KeyboardInterrupt, grid_store.save_grid, self.grid_dir, self.xi, self.yi, self.zi, volumes,
+                          overwrite=True)
+        self.assertEqual(os.listdir(self.tmp_dir), ['grid'])
+        self._assert_loads_volumes(self.volumes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Unit tests for the on-disk cache of interpolated temperature grids.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from roboskeeter.io import interpolation_cache
+
+SETTINGS = {'interp_func': '_interpolate_data_RBF',
+            'interpolation_resolution': 0.005,
+            'wall_sheet_thickness': 0.01,
+            'wall_sheet_resolution': 0.01,
+            'rbf_function': 'thin_plate',
+            'rbf_smoothing': 0.,
+            'rbf_epsilon': None,
+            'rbf_neighbors': None}
+
+
+class InterpolationCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.raw_data_path = os.path.join(self.tmp_dir, 'raw.csv')
+        np.savetxt(self.raw_data_path, np.random.uniform(size=(20, 4)), delimiter=',')
+
+        self.cache_version = interpolation_cache.CACHE_VERSION
+
+    def tearDown(self):
+        interpolation_cache.CACHE_VERSION = self.cache_version
+        shutil.rmtree(self.tmp_dir)
+
+    def _key(self, **settings):
+        return interpolation_cache.interpolation_cache_key(self.raw_data_path, dict(SETTINGS, **settings))
+
+    def _save(self, key):
+        xi, yi, zi = np.linspace(0, 1, 4), np.linspace(-1, 1, 5), np.linspace(0, 0.5, 3)
+        volumes = {'avg_temp': np.random.uniform(size=(4, 5, 3)), 'gradient_x': np.random.normal(size=(4, 5, 3))}
+        interpolation_cache.save_interpolation(key, xi, yi, zi, volumes, cache_dir=self.cache_dir)
+        return xi, yi, zi, volumes
+
+    def test_key_depends_on_raw_data_and_every_setting(self):
+        key = self._key()
+        self.assertEqual(key, self._key())
+
+        changed = [self._key(rbf_smoothing=0.1), self._key(rbf_epsilon=0.02), self._key(rbf_function='cubic'),
+                   self._key(interpolation_resolution=0.01), self._key(wall_sheet_thickness=0.02)]
+        self.assertEqual(len(set(changed + [key])), len(changed) + 1)
+
+        with open(self.raw_data_path, 'ab') as f:
+            f.write(b'0')
+        self.assertNotEqual(self._key(), key)
+
+    def test_round_trip(self):
+        key = self._key()
+        self.assertIsNone(interpolation_cache.load_interpolation(key, cache_dir=self.cache_dir))
+
+        xi, yi, zi, volumes = self._save(key)
+        loaded_xi, loaded_yi, loaded_zi, loaded_volumes = interpolation_cache.load_interpolation(
+            key, cache_dir=self.cache_dir)
+        for axis, loaded_axis in [(xi, loaded_xi), (yi, loaded_yi), (zi, loaded_zi)]:
+            np.testing.assert_array_equal(loaded_axis, axis)
+        self.assertEqual(sorted(loaded_volumes), sorted(volumes))
+        for name, volume in volumes.items():
+            np.testing.assert_array_equal(loaded_volumes[name], volume)
+
+    def test_version_bump_invalidates_entries(self):
+        key = self._key()
+        self._save(key)
+
+        interpolation_cache.CACHE_VERSION += 1
+        new_key = self._key()
+        self.assertNotEqual(new_key, key)
+        self.assertIsNone(interpolation_cache.load_interpolation(new_key, cache_dir=self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Unit tests for summaries of simulated kinematics.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from roboskeeter.kinematic_summary import KinematicSummary, SCORED_KINEMATICS
+
+
+def _random_kinematics(n):
+    kinematics = {kinematic: np.random.normal(size=n) for kinematic in SCORED_KINEMATICS}
+    kinematics['position_x'] = np.random.uniform(0., 1., n)
+    return kinematics
+
+
+class KinematicSummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.chunks = [_random_kinematics(n) for n in (100, 250, 40)]
+
+    def test_samples_are_trimmed_and_sorted(self):
+        summary = KinematicSummary()
+        for chunk in self.chunks:
+            summary.add(chunk)
+
+        position_x = np.concatenate([chunk['position_x'] for chunk in self.chunks])
+        keep = (position_x > 0.05) & (position_x < 0.95)
+        for kinematic, values in summary.get_kinematic_dict().iteritems():
+            expected = np.concatenate([chunk[kinematic] for chunk in self.chunks])[keep]
+            np.testing.assert_array_equal(values, np.sort(expected))
+        self.assertEqual(summary.n_samples, keep.sum())
+
+    def test_update_matches_single_summary(self):
+        single, merged = KinematicSummary(), KinematicSummary()
+        for chunk in self.chunks:
+            single.add(chunk)
+            part = KinematicSummary()
+            part.add(chunk)
+            merged.update(part)
+
+        for kinematic, values in single.get_kinematic_dict().iteritems():
+            np.testing.assert_array_equal(merged.get_kinematic_dict()[kinematic], values)
+
+    def test_sketch_cdf_matches_samples_at_edges(self):
+        edges = {kinematic: np.linspace(-3., 3., 25) for kinematic in SCORED_KINEMATICS}
+        sketch, samples = KinematicSummary(sketch_edges=edges), KinematicSummary()
+        for chunk in self.chunks:
+            sketch.add(chunk)
+            samples.add(chunk)
+
+        points, cdf = sketch.ecdf('velocity_y')
+        values = samples.get_kinematic_dict()['velocity_y']
+        np.testing.assert_allclose(cdf, np.searchsorted(values, points, side='right') / len(values))
+        self.assertRaises(ValueError, sketch.get_kinematic_dict)
+        self.assertRaises(ValueError, samples.update, sketch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Unit tests for selecting trajectories out of Observations.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from roboskeeter.decisions import DECISIONS
+from roboskeeter.observations import Observations
+
+
+def _make_kinematics(lengths):
+    """one row per timestep of trajectories numbered by the keys of lengths, in that order"""
+    frames = []
+    for trajectory_num, length in lengths:
+        frames.append(pd.DataFrame({'position_x': np.random.uniform(size=length),
+                                    'position_y': np.random.uniform(size=length),
+                                    'position_z': np.random.uniform(size=length),
+                                    'in_plume': np.random.uniform(size=length) > 0.5,
+                                    'trajectory_num': [trajectory_num] * length,
+                                    'tsi': np.arange(length)}, index=np.arange(length)))
+    return pd.concat(frames)
+
+
+class ObservationsTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.observations = Observations()
+        self.observations.kinematics = _make_kinematics([(4, 10), (1, 3), (9, 7), (2, 5)])
+
+    def _mask_slice(self, trajectory_num):
+        kinematics = self.observations.kinematics
+        return kinematics.loc[kinematics.trajectory_num == trajectory_num]
+
+    def test_slice_matches_mask(self):
+        np.testing.assert_array_equal(self.observations.get_trajectory_numbers(), [1, 2, 4, 9])
+        for trajectory_num in [1, 2, 4, 9, np.int64(9)]:
+            pd.testing.assert_frame_equal(self.observations.get_trajectory_slice(trajectory_num),
+                                          self._mask_slice(trajectory_num))
+        self.assertEqual(len(self.observations.get_trajectory_slice(5)), 0)
+        self.assertIs(self.observations.get_trajectory_slice(None), self.observations.kinematics)
+        self.assertRaises(ValueError, self.observations.get_trajectory_slice, 'ALL')
+
+    def test_slice_list_keeps_order(self):
+        df = self.observations.get_trajectory_slice([9, 5, 1])
+        pd.testing.assert_frame_equal(df, pd.concat([self._mask_slice(9), self._mask_slice(1)]))
+
+    def test_iterate_views(self):
+        trajectory_nums = []
+        for trajectory_num, df in self.observations.iter_trajectories():
+            trajectory_nums.append(trajectory_num)
+            pd.testing.assert_frame_equal(df, self._mask_slice(trajectory_num))
+        self.assertEqual(trajectory_nums, [1, 2, 4, 9])
+
+    def test_interleaved_rows_get_sorted(self):
+        kinematics = _make_kinematics([(4, 10), (1, 3), (4, 2)])
+        self.observations.kinematics = kinematics
+        np.testing.assert_array_equal(self.observations.get_trajectory_slice(4)['position_x'].values,
+                                      kinematics.loc[kinematics.trajectory_num == 4, 'position_x'].values)
+        np.testing.assert_array_equal(self.observations.get_trajectory_numbers(), [1, 4])
+
+
+class ObservationsExportTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.observations = Observations()
+        self.observations.kinematics = _make_kinematics([(4, 10), (1, 3), (9, 7)])
+        decisions = np.random.randint(len(DECISIONS), size=len(self.observations.kinematics))
+        self.observations.kinematics['decision'] = pd.Categorical.from_codes(decisions, DECISIONS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_csvs_match_savetxt(self):
+        output_dir = os.path.join(self.tmp_dir, 'csvs')
+        self.observations.dump2csvs(output_dir)
+        self.assertEqual(sorted(os.listdir(output_dir)), ['1.csv', '4.csv', '9.csv'])
+
+        expected_path = os.path.join(self.tmp_dir, 'expected.csv')
+        for trajectory_num, df in self.observations.iter_trajectories():
+            np.savetxt(expected_path, df[['position_x', 'position_y', 'position_z', 'in_plume']].values,
+                       delimiter=",")
+            with open(expected_path) as expected, open(os.path.join(output_dir, '{}.csv'.format(trajectory_num))) as f:
+                self.assertEqual(f.read(), expected.read())
+
+    def test_csv_columns(self):
+        self.observations.dump2csvs(self.tmp_dir, columns=['tsi', 'decision'], workers=2)
+        written = np.loadtxt(os.path.join(self.tmp_dir, '9.csv'), delimiter=',')
+        df = self.observations.get_trajectory_slice(9)
+        np.testing.assert_array_equal(written, np.column_stack([df.tsi, df.decision.cat.codes]))
+
+    def test_columnar_round_trip(self):
+        path = os.path.join(self.tmp_dir, 'ensemble.npz')
+        self.observations.export_columnar(path)
+
+        loaded = Observations()
+        loaded.import_columnar(path)
+        pd.testing.assert_frame_equal(loaded.kinematics, self.observations.kinematics)
+
+        loaded.import_columnar(path, index=[9, 1])
+        pd.testing.assert_frame_equal(loaded.kinematics, self.observations.get_trajectory_slice([1, 9]))
+
+
+if __name__ == '__main__':
+    unittest.main()
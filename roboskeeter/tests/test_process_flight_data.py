@@ -0,0 +1,119 @@
+"""
+Unit tests for splitting and gap filling raw tracker trajectories.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from roboskeeter.io import process_flight_data
+
+
+def _NaN_run(length):
+    return pd.DataFrame(np.full((length, 3), np.nan), columns=['x', 'y', 'z'])
+
+
+def _num_run(length):
+    return pd.DataFrame(np.random.randn(length, 3), columns=['x', 'y', 'z'])
+
+
+def _concat(runs):
+    return pd.concat(runs).reset_index()[['x', 'y', 'z']]
+
+
+class ProcessFlightDataTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.num10, self.num21, self.num30, self.num50, self.num100 = [_num_run(n) for n in [10, 21, 30, 50, 100]]
+
+    def _assert_split(self, df, expected):
+        trajectories = process_flight_data.split_trajectories(df)
+        self.assertEqual(len(trajectories), len(expected))
+        for trajectory, expected_trajectory in zip(trajectories, expected):
+            pd.testing.assert_frame_equal(trajectory, expected_trajectory)
+
+    def test_find_runs(self):
+        starts, lengths = process_flight_data.find_runs([True, True, False, True, False, False, True])
+        np.testing.assert_array_equal(starts, [0, 3, 6])
+        np.testing.assert_array_equal(lengths, [2, 1, 1])
+        self.assertEqual(len(process_flight_data.find_runs([])[0]), 0)
+
+    def test_trim(self):
+        df = _concat([_NaN_run(5), self.num30, _NaN_run(3)])
+        pd.testing.assert_frame_equal(process_flight_data.trim_leading_trailing_NaNs(df), self.num30)
+        self.assertEqual(len(process_flight_data.trim_leading_trailing_NaNs(_NaN_run(10))), 0)
+
+    def test_all_numbers(self):
+        self._assert_split(self.num100, [self.num100])
+
+    def test_long_NaN_runs_split(self):
+        self._assert_split(_concat([self.num50, _NaN_run(100), self.num30]), [self.num50, self.num30])
+        self._assert_split(_concat([self.num21, _NaN_run(50), self.num21]), [self.num21, self.num21])
+
+    def test_leading_trailing_and_short_trajectories(self):
+        df = _concat([_NaN_run(3), self.num50, _NaN_run(100), self.num10, _NaN_run(100), self.num100, _NaN_run(2)])
+        self._assert_split(df, [self.num50, self.num100])
+
+    def test_short_NaN_runs_interpolated(self):
+        timesteps = np.arange(80.)
+        smooth = pd.DataFrame({'x': np.sin(timesteps / 20), 'y': timesteps / 80, 'z': np.cos(timesteps / 30)},
+                              columns=['x', 'y', 'z'])
+        df = smooth.copy()
+        df.iloc[30:49] = np.nan
+
+        trajectories = process_flight_data.split_trajectories(df)
+        self.assertEqual(len(trajectories), 1)
+        np.testing.assert_allclose(trajectories[0].values, smooth.values, atol=1e-2)
+
+        linear = process_flight_data.split_trajectories(df, interpolation='linear')[0]
+        np.testing.assert_allclose(linear['y'].values, smooth['y'].values)
+
+    def test_stuck_tracker_splits(self):
+        stuck = pd.DataFrame(np.repeat(self.num50.values[-1:], 60, axis=0), columns=['x', 'y', 'z'])
+        df = _concat([self.num50, stuck, self.num30])
+        self._assert_split(df, [self.num50, self.num30])
+
+        trajectories = process_flight_data.split_trajectories(df, stuck_thresh=None)
+        self.assertEqual(len(trajectories), 1)
+        self.assertEqual(len(trajectories[0]), 140)
+
+
+class ProcessDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tmp_dir, 'raw')
+        self.destination_dir = os.path.join(self.tmp_dir, 'processed')
+        os.makedirs(self.source_dir)
+
+        self.expected = {}
+        for name, runs in [('a', [_num_run(40), _NaN_run(60), _num_run(25)]),
+                           ('b', [_NaN_run(4), _num_run(30)]),
+                           ('c', [_num_run(5)])]:
+            df = _concat(runs)
+            path = os.path.join(self.source_dir, name + '.csv')
+            df.to_csv(path, header=False, index=False, na_rep='NaN')
+            self.expected[path] = process_flight_data.split_trajectories(process_flight_data.load_csvs(path))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_process_directory(self):
+        for workers in [1, 2]:
+            processed = process_flight_data.process_directory(self.source_dir, self.destination_dir, workers)
+            self.assertEqual(sorted(processed), sorted(self.expected))
+            for path, output_paths in processed.items():
+                self.assertEqual(len(output_paths), len(self.expected[path]))
+                for output_path, trajectory in zip(output_paths, self.expected[path]):
+                    pd.testing.assert_frame_equal(pd.read_csv(output_path), trajectory)
+
+        self.assertEqual(sorted(os.listdir(self.destination_dir)), ['a_SPLIT_0.csv', 'a_SPLIT_1.csv', 'b_SPLIT_0.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
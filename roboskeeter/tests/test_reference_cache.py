@@ -0,0 +1,75 @@
+"""
+Unit tests for the on-disk cache of reference kinematics.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from roboskeeter.io import reference_cache
+
+
+class ReferenceCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.csv_paths = []
+        for i in range(3):
+            self.csv_paths.append(os.path.join(self.tmp_dir, 'trajectory{}.csv'.format(i)))
+            with open(self.csv_paths[-1], 'w') as f:
+                f.write('1,2,3\n')
+
+        self._get_condition_csv_paths = reference_cache.get_condition_csv_paths
+        reference_cache.get_condition_csv_paths = lambda condition: list(self.csv_paths)
+
+        self.n_computed = 0
+
+    def tearDown(self):
+        reference_cache.get_condition_csv_paths = self._get_condition_csv_paths
+        shutil.rmtree(self.tmp_dir)
+
+    def _compute(self):
+        self.n_computed += 1
+        return {'velocity_x': np.arange(5.) + self.n_computed, 'curvature': np.ones(3)}
+
+    def _load(self):
+        return reference_cache.load_reference_kinematics('Control', self._compute, cache_dir=self.cache_dir)
+
+    def test_second_load_is_cached(self):
+        first = self._load()
+        second = self._load()
+        self.assertEqual(self.n_computed, 1)
+        self.assertEqual(sorted(second.keys()), ['curvature', 'velocity_x'])
+        np.testing.assert_array_equal(second['velocity_x'], first['velocity_x'])
+
+    def test_changed_sources_invalidate(self):
+        self._load()
+
+        with open(self.csv_paths[0], 'a') as f:  # size changes
+            f.write('4,5,6\n')
+        self._load()
+        self.assertEqual(self.n_computed, 2)
+
+        stat = os.stat(self.csv_paths[1])  # only the mtime changes
+        os.utime(self.csv_paths[1], (stat.st_atime, stat.st_mtime + 10))
+        self._load()
+        self.assertEqual(self.n_computed, 3)
+
+        self.csv_paths.pop()  # a file is removed
+        np.testing.assert_array_equal(self._load()['velocity_x'], np.arange(5.) + 4)
+        self.assertEqual(self.n_computed, 4)
+
+    def test_conditions_get_separate_entries(self):
+        self._load()
+        reference_cache.load_reference_kinematics(['Left', 'Right'], self._compute, cache_dir=self.cache_dir)
+        self.assertEqual(self.n_computed, 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
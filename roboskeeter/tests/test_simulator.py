@@ -0,0 +1,101 @@
+"""
+Unit tests for simulating ensembles of trajectories.
+"""
+from __future__ import print_function, division
+
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+_use = matplotlib.use
+matplotlib.use = lambda *args, **kwargs: None  # plotting.plot_environment forces Qt4Agg, which needs a display
+try:
+    from roboskeeter import environment, experiments
+finally:
+    matplotlib.use = _use
+
+import numpy as np
+import pandas as pd
+
+SIMULATION_CONDITIONS = {'condition': 'Control',
+                         'time_max': 1.,
+                         'bounded': True,
+                         'optimizing': False,
+                         'heat_model_name': 'None'}
+
+AGENT_KWARGS = {'is_simulation': True,
+                'random_f_strength': 6.64725529e-06,
+                'stim_f_strength': 5.0e-06,
+                'damping_coeff': 3.63417031e-07,
+                'collision_type': 'part_elastic',
+                'restitution_coeff': 9.99023340e-02,
+                'stimulus_memory_n_timesteps': 100,
+                'decision_policy': 'ignore',
+                'initial_position_selection': 'realistic',
+                'verbose': False,
+                'optimizing': False,
+                'simulation_engine': 'batch'}
+
+# integrator settings every engine and worker count must agree for
+INTEGRATORS = [{'integrator': 'euler'},
+               {'integrator': 'exponential', 'internal_dt': 0.01},  # internal_dt == dt
+               {'integrator': 'exponential', 'internal_dt': 0.05}]
+
+
+# a wide Boolean plume over the left heater, so the agents enter it, decide and feel the stimulus force
+PLUME_CONDITIONS = {'condition': 'Left', 'heat_model_name': 'Boolean'}
+PLUME_AGENT_KWARGS = {'decision_policy': 'cast_and_surge'}
+
+
+def _make_plume_planes(plume):
+    x_position = np.linspace(0.95, 0.05, 50)
+    return pd.DataFrame({'x_position': x_position,
+                         'z_position': np.full(len(x_position), 0.15),
+                         'small_radius': np.full(len(x_position), 0.06),
+                         'y_position': plume.environment.windtunnel.heater_l.y_position})
+
+
+class SimulatorTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self._load_plume_data = environment.BooleanPlumeModel.__dict__['_load_plume_data']
+        environment.BooleanPlumeModel._load_plume_data = _make_plume_planes
+
+    def tearDown(self):
+        environment.BooleanPlumeModel._load_plume_data = self._load_plume_data
+        environment.evict_environments(heat_model_name='Boolean')
+
+    def _simulate(self, workers=1, plume=False, **agent_kwargs):
+        kwargs = dict(AGENT_KWARGS, **agent_kwargs)
+        conditions = dict(SIMULATION_CONDITIONS)
+        if plume:
+            kwargs.update(PLUME_AGENT_KWARGS)
+            conditions.update(PLUME_CONDITIONS)
+        experiment = experiments.start_simulation(6, kwargs, conditions, workers=workers, seed=3)
+        return experiment.observations.kinematics
+
+    def test_batch_matches_scalar(self):
+        for plume in [False, True]:
+            for integrator in INTEGRATORS:
+                pd.testing.assert_frame_equal(self._simulate(plume=plume, simulation_engine='batch', **integrator),
+                                              self._simulate(plume=plume, simulation_engine='scalar', **integrator))
+
+    def test_same_ensemble_for_any_number_of_workers(self):
+        for plume in [False, True]:
+            for integrator in INTEGRATORS:
+                kinematics = self._simulate(plume=plume, workers=1, **integrator)
+                pd.testing.assert_frame_equal(kinematics, self._simulate(plume=plume, workers=2, **integrator))
+                self.assertEqual(sorted(kinematics.trajectory_num.unique()), range(6))
+
+    def test_plume_is_held_for_internal_dt(self):
+        fine = self._simulate(plume=True, integrator='exponential', internal_dt=0.01)
+        coarse = self._simulate(plume=True, integrator='exponential', internal_dt=0.05)
+        self.assertTrue(coarse.in_plume.any())
+        self.assertFalse(np.allclose(fine.position_x, coarse.position_x))
+        for _, trajectory in coarse.groupby('trajectory_num'):  # decisions only change every 5th timestep
+            changes = np.flatnonzero(np.diff(trajectory.decision.cat.codes.values)) + 1
+            self.assertTrue(np.all(trajectory.tsi.values[changes] % 5 == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
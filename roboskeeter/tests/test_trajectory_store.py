@@ -0,0 +1,132 @@
+"""
+Unit tests for the binary columnar store of experimental trajectories.
+"""
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from roboskeeter.io import i_o, trajectory_store
+
+
+def _write_trajectory_csv(path, n_rows):
+    data = np.random.normal(size=(n_rows, len(i_o.TRAJECTORY_CSV_COLUMNS)))
+    data[0, 3] = np.nan
+    np.savetxt(path, data, delimiter=',')
+
+
+class TrajectoryStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        print("In test '{}'...".format(self._testMethodName))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_root = os.path.join(self.tmp_dir, 'store')
+        self.csv_paths = []
+        for trajectory_num, n_rows in [(3, 40), (12, 25), (7, 60)]:
+            self.csv_paths.append(os.path.join(self.tmp_dir, 'Traj{}.csv'.format(trajectory_num)))
+            _write_trajectory_csv(self.csv_paths[-1], n_rows)
+
+        self._get_condition_csv_paths = trajectory_store.get_condition_csv_paths
+        trajectory_store.get_condition_csv_paths = lambda condition: list(self.csv_paths)
+
+        self.parsed = []
+        self._load_single_csv_to_df = trajectory_store.load_single_csv_to_df
+        trajectory_store.load_single_csv_to_df = self._count_parse
+
+    def tearDown(self):
+        trajectory_store.get_condition_csv_paths = self._get_condition_csv_paths
+        trajectory_store.load_single_csv_to_df = self._load_single_csv_to_df
+        shutil.rmtree(self.tmp_dir)
+
+    def _count_parse(self, path):
+        self.parsed.append(os.path.basename(path))
+        return self._load_single_csv_to_df(path)
+
+    def _parse_csvs(self):
+        return pd.concat([i_o.load_single_csv_to_df(path) for path in self.csv_paths])
+
+    def test_matches_parsed_csvs(self):
+        self.assertFalse(trajectory_store.store_is_current('Control', self.store_root))
+        df = trajectory_store.load_condition('Control', store_root=self.store_root, workers=1)
+        self.assertTrue(trajectory_store.store_is_current('Control', self.store_root))
+        pd.testing.assert_frame_equal(df, self._parse_csvs())
+
+    def test_parallel_parsing(self):
+        df = trajectory_store.load_conditions(['Control', 'Left'], store_root=self.store_root, workers=2)
+        pd.testing.assert_frame_equal(df, pd.concat([self._parse_csvs()] * 2))
+
+    def test_only_requested_columns(self):
+        df = trajectory_store.load_condition('Control', columns=['velocity_y', 'position_x'],
+                                             store_root=self.store_root)
+        self.assertEqual(list(df.columns), ['position_x', 'velocity_y', 'trajectory_num', 'tsi'])
+        self.assertEqual(df['velocity_y'].dtype, np.float32)
+        self.assertRaises(ValueError, trajectory_store.load_condition, 'Control', ['in_plume'], self.store_root)
+
+    def test_only_changed_csvs_are_parsed(self):
+        trajectory_store.load_condition('Control', store_root=self.store_root, workers=1)
+        self.assertEqual(len(self.parsed), 3)
+
+        _write_trajectory_csv(self.csv_paths[1], 30)
+        self.csv_paths.insert(0, os.path.join(self.tmp_dir, 'Traj20.csv'))
+        _write_trajectory_csv(self.csv_paths[0], 10)
+        os.remove(self.csv_paths.pop())
+        self.assertFalse(trajectory_store.store_is_current('Control', self.store_root))
+
+        del self.parsed[:]
+        df = trajectory_store.load_condition('Control', store_root=self.store_root, workers=1)
+        self.assertEqual(sorted(self.parsed), ['Traj12.csv', 'Traj20.csv'])
+        pd.testing.assert_frame_equal(df, self._parse_csvs())
+        self.assertEqual((df.trajectory_num == 12).sum(), 30)
+
+    def test_load_conditions_checks_each_store_once(self):
+        trajectory_store.load_condition('Control', store_root=self.store_root, workers=1)
+
+        checked = []
+        source_files = trajectory_store.source_files
+        trajectory_store.source_files = lambda condition: checked.append(condition) or source_files(condition)
+        try:
+            trajectory_store.load_conditions(['Control'], store_root=self.store_root, workers=1)
+        finally:
+            trajectory_store.source_files = source_files
+        self.assertEqual(checked, ['Control'])
+
+    def test_read_retried_while_store_is_swapped(self):
+        expected = trajectory_store.load_condition('Control', store_root=self.store_root, workers=1)
+        store_dir = trajectory_store.get_store_dir('Control', self.store_root)
+        swapped_dir = store_dir + '.old'
+        os.rename(store_dir, swapped_dir)
+
+        reads = []
+        read_manifest = trajectory_store._read_manifest
+        delay = trajectory_store.READ_RETRY_DELAY
+
+        def swap_back(path):
+            reads.append(path)
+            if len(reads) == 2:  # the writer renames the new store into place
+                os.rename(swapped_dir, store_dir)
+            return read_manifest(path)
+
+        trajectory_store._read_manifest = swap_back
+        trajectory_store.READ_RETRY_DELAY = 0.
+        try:
+            df = trajectory_store._read_store(store_dir, i_o.TRAJECTORY_CSV_COLUMNS)
+        finally:
+            trajectory_store._read_manifest = read_manifest
+            trajectory_store.READ_RETRY_DELAY = delay
+        self.assertEqual(len(reads), 3)
+        pd.testing.assert_frame_equal(df, expected)
+
+        shutil.rmtree(store_dir)
+        trajectory_store.READ_RETRY_DELAY = 0.
+        try:
+            self.assertRaises(IOError, trajectory_store._read_store, store_dir, i_o.TRAJECTORY_CSV_COLUMNS)
+        finally:
+            trajectory_store.READ_RETRY_DELAY = delay
+
+
+if __name__ == '__main__':
+    unittest.main()